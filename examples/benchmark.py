@@ -0,0 +1,27 @@
+# Usage example: duplicate search benchmark on simulated high-latency storage.
+
+import time
+from yadupe import core, fsbackend
+
+FILES = 10000
+LATENCY = 0.001         # seconds per file system operation
+BANDWIDTH = 100000000   # bytes per second
+
+if __name__ == "__main__":
+    # In-memory tree: every tenth file is a duplicate, no real files are created.
+    memory = fsbackend.MemoryBackend()
+    for idx in range(FILES):
+        data = b'duplicate' if idx % 10 == 0 else str(idx).encode()
+        memory.add_file(f'/data/{idx % 100}/{idx}.bin', data)
+    memory.makedirs('/report')
+
+    # Each operation of the search waits, as on NFS.
+    backend = fsbackend.LatencyBackend(memory, LATENCY, BANDWIDTH)
+    for pipeline in (False, True):
+        settings = core.Settings(False, False, '/report', ['/data'], False, False,
+                                 pipeline=pipeline, backend=backend)
+        started = time.monotonic()
+        core.deduplicate(settings)
+        print(f'pipeline={pipeline}: {time.monotonic() - started:.1f} s')
+
+    print(dict(backend.calls))
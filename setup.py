@@ -26,9 +26,15 @@ setup(
     ],
     packages=['yadupe'],
     install_requires=["tqdm"],
+    extras_require={
+        "fast": ["numpy"],
+        "images": ["numpy", "Pillow"],
+    },
     entry_points={
         "console_scripts": [
             "yadupe=yadupe.__main__:main",
+            "yadupe-agent=yadupe.agent:main",
+            "yadupe-lookup=yadupe.lookup:main",
         ]
     },
 )
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+import pytest
+
+
+def _make_tree(root, files):
+    for path, content in files.items():
+        filepath = os.path.join(str(root), path)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'wb') as fileout:
+            fileout.write(content)
+
+
+@pytest.fixture
+def make_tree():
+    """ Return function creating {relative path: content} files under root. """
+    return _make_tree
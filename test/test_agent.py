@@ -0,0 +1,91 @@
+import sys
+import os
+import threading
+import pytest
+from yadupe import agent, core
+
+SOURCE_1 = 'test-data/A'
+SOURCE_2 = 'test-data/B'
+SOURCE_3 = 'test-data/C'
+
+DUPLICATE_PATH_1 = 'test-data/C/a/b/d/f/9.txt'
+DUPLICATE_PATH_2 = 'test-data/B/a/d/3.txt'
+DUPLICATE_PATH_3 = 'test-data/A/a/b/6.txt'
+
+
+@pytest.fixture
+def agents():
+    servers = []
+    for source in [SOURCE_2, SOURCE_3]:
+        server = agent.AgentServer([source], '127.0.0.1:0')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield [f'127.0.0.1:{server.server_address[1]}' for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_parse_address():
+    assert agent.parse_address('localhost:7477') == ('localhost', 7477)
+    with pytest.raises(ValueError):
+        agent.parse_address('localhost')
+
+
+def test_token(monkeypatch):
+    with pytest.raises(ValueError):
+        agent.AgentServer([SOURCE_2], '0.0.0.0:0')
+    assert agent.is_loopback('localhost:7477')
+    assert not agent.is_loopback('server1:7477')
+
+    server = agent.AgentServer([SOURCE_2], '127.0.0.1:0', token='secret')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = f'127.0.0.1:{server.server_address[1]}'
+    try:
+        with pytest.raises(ConnectionError):
+            agent.RemoteAgent(address, token='wrong')
+        monkeypatch.delenv(agent.TOKEN_VARIABLE, raising=False)
+        with pytest.raises(ConnectionError):
+            agent.RemoteAgent(address)
+        monkeypatch.setenv(agent.TOKEN_VARIABLE, 'secret')
+        remote = agent.RemoteAgent(address)
+        try:
+            assert len(remote.scan()) == 8
+        finally:
+            remote.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_remote_scan(agents):
+    remote = agent.RemoteAgent(agents[0])
+    try:
+        records = remote.scan()
+        assert len(records) == 8
+        assert all(record.digest is None for record in records)
+        hashed = remote.hash([758])
+        assert len(hashed) == 3
+        assert len({record.digest for record in hashed}) == 1
+    finally:
+        remote.close()
+
+
+def test_collect(agents):
+    hashed = []
+
+    def hasher(filepath):
+        hashed.append(filepath)
+        return core.hash_file(filepath)
+
+    fd = core.FilepathDict(hasher=hasher)
+    core._scan_duplicates(os.path.abspath(SOURCE_1), fd)
+    agent.collect(agents, fd)
+
+    groups = [group.path for sk in fd.keys() for group in fd[sk].duplicates()]
+    expected = {f'{agents[1]}:{os.path.abspath(DUPLICATE_PATH_1)}',
+                f'{agents[0]}:{os.path.abspath(DUPLICATE_PATH_2)}',
+                os.path.abspath(DUPLICATE_PATH_3)}
+    assert any(expected <= set(group) for group in groups)
+    # remote files are hashed by agents only
+    assert all(filepath.startswith(os.path.abspath(SOURCE_1)) for filepath in hashed)
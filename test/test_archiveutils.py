@@ -0,0 +1,97 @@
+import os
+import io
+import tarfile
+import zipfile
+import pytest
+from yadupe import archiveutils
+from yadupe.hashutils import hash_file
+
+
+def make_zip(filepath, members):
+    with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+
+
+def make_tar(filepath, members):
+    with tarfile.open(filepath, 'w:gz') as tar_file:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar_file.addfile(info, io.BytesIO(content))
+
+
+def test_iter_members(tmp_path):
+    zippath = str(tmp_path / 'dump.zip')
+    tarpath = str(tmp_path / 'dump.tar.gz')
+    make_zip(zippath, {'a/1.txt': b'one', 'b/2.txt': b'two!'})
+    make_tar(tarpath, {'a/1.txt': b'one'})
+
+    members = list(archiveutils.iter_members(zippath))
+    assert [(member.name, member.size) for member in members] == [('a/1.txt', 3), ('b/2.txt', 4)]
+    assert members[0].path == f'{zippath}!/a/1.txt'
+    assert members[0].crc is not None
+    members = list(archiveutils.iter_members(tarpath))
+    assert [(member.name, member.size, member.crc) for member in members] == [('a/1.txt', 3, None)]
+
+    broken = tmp_path / 'broken.zip'
+    broken.write_bytes(b'not a zip')
+    assert list(archiveutils.iter_members(str(broken))) == []
+
+
+def test_is_archive():
+    assert archiveutils.is_archive('/x/dump.ZIP')
+    assert archiveutils.is_archive('/x/dump.tar.gz')
+    assert not archiveutils.is_archive('/x/dump.gz')
+
+
+def test_archive_hasher(tmp_path):
+    loose = tmp_path / '1.txt'
+    loose.write_bytes(b'one' * 1000)
+    zippath = str(tmp_path / 'dump.zip')
+    tarpath = str(tmp_path / 'dump.tar.gz')
+    make_zip(zippath, {'1.txt': b'one' * 1000, '2.txt': b'two'})
+    make_tar(tarpath, {'1.txt': b'one' * 1000, '2.txt': b'two'})
+
+    hasher = archiveutils.ArchiveHasher()
+    for archive in (zippath, tarpath):
+        for member in archiveutils.iter_members(archive):
+            hasher.add(member)
+    expected = hash_file(str(loose))
+    assert hasher(str(loose)) == expected
+    assert hasher(f'{zippath}!/1.txt') == expected
+    assert hasher(f'{tarpath}!/1.txt') == expected
+    assert hasher(f'{zippath}!/2.txt') == hasher(f'{tarpath}!/2.txt')
+
+
+def test_archive_hasher_broken(tmp_path):
+    loose = tmp_path / '1.txt'
+    loose.write_bytes(b'one' * 1000)
+    zippath = str(tmp_path / 'dump.zip')
+    make_zip(zippath, {'1.txt': b'one' * 1000, '2.txt': os.urandom(5000)})
+    members = list(archiveutils.iter_members(zippath))
+    with open(zippath, 'r+b') as zip_file:
+        zip_file.truncate(os.path.getsize(zippath) // 2)
+
+    hasher = archiveutils.ArchiveHasher()
+    for member in members:
+        hasher.add(member)
+    hasher.add(archiveutils.ArchiveMember(zippath, 'gone.txt', 3))
+    digests = {member.path: hasher(member.path) for member in members}
+    assert digests[f'{zippath}!/1.txt'] != hash_file(str(loose))
+    assert len(set(digests.values())) == len(members)
+    assert hasher(f'{zippath}!/gone.txt') not in digests.values()
+    assert hasher(str(loose)) == hash_file(str(loose))
+
+
+def test_crc_prefilter():
+    members = [archiveutils.ArchiveMember('a.zip', '1', 10, 1),
+               archiveutils.ArchiveMember('a.zip', '2', 10, 2),
+               archiveutils.ArchiveMember('b.zip', '2', 10, 2),
+               archiveutils.ArchiveMember('b.zip', '3', 20, 3),
+               archiveutils.ArchiveMember('b.zip', '4', 20, 4),
+               archiveutils.ArchiveMember('c.tar', '5', 30),
+               archiveutils.ArchiveMember('c.tar', '6', 30)]
+    digests = archiveutils.crc_prefilter(members, {20: 1})
+    # size 20 collides with regular file, size 30 has no CRC
+    assert digests == {'a.zip!/1': 'crc32:00000001'}
@@ -57,6 +57,82 @@ CL_INCORRECT_5 = '-d -u -p test-data/A test-data/B test-data/C test-data/D '\
 
 ERROR_VALUE_5 = 'Select exactly one mode: remove duplicates or move unique files.'
 
+CL_INCORRECT_6 = '-c -d test-data/A test-data/B -r test-data/res'
+
+ERROR_VALUE_6 = 'Chunk analysis mode can not be combined with files moving.'
+
+CL_INCORRECT_7 = '--against test-data/A/none.bin test-data/B'
+
+ERROR_VALUE_7 = 'test-data/A/none.bin: must be valid path to filter file.'
+
+CL_INCORRECT_8 = '-d --against test-data/A/2.txt test-data/B -r test-data/res'
+
+ERROR_VALUE_8 = 'Filter modes can not be combined with other modes.'
+
+CL_INCORRECT_9 = 'test-data/A --reference test-data/A/a'
+
+ERROR_VALUE_9 = 'test-data/A/a: reference path must not overlap source paths.'
+
+CL_INCORRECT_10 = '--shard 3/3 test-data/A -r test-data/res'
+
+ERROR_VALUE_10 = '3/3: shard index must be in range from 0 to N-1.'
+
+CL_INCORRECT_11 = '--archives -u test-data/A -r test-data/res'
+
+ERROR_VALUE_11 = 'Archive mode can be used only in search or remove duplicates mode.'
+
+CL_INCORRECT_12 = '--sparse -c test-data/A'
+
+ERROR_VALUE_12 = 'Sparse hashing can not be combined with chunk analysis, filter, agent, image or archive modes.'
+
+CL_INCORRECT_13 = '--incremental test-data/A'
+
+ERROR_VALUE_13 = 'Incremental hashing requires hash cache file.'
+
+CL_INCORRECT_14 = '--min-size 100 --max-size 10 test-data/A'
+
+ERROR_VALUE_14 = '100: min size must not exceed max size.'
+
+CL_INCORRECT_15 = '--undo -r test-data/res'
+
+ERROR_VALUE_15 = 'test-data/res: must be valid path to directory with journal.'
+
+CL_INCORRECT_16 = '--copy test-data/A'
+
+ERROR_VALUE_16 = 'Copy mode can be used only in move uniques mode.'
+
+CL_INCORRECT_17 = '--max-iops 0 test-data/A'
+
+ERROR_VALUE_17 = 'Read rate and I/O operations limits must be positive.'
+
+CL_INCORRECT_18 = '--checksums xattr --sparse test-data/A'
+
+ERROR_VALUE_18 = 'Checksum sources and digest algorithm can not be combined with sparse or incremental hashing, chunk analysis, filter, agent, image or archive modes.'
+
+CL_INCORRECT_19 = '--keep root test-data/A'
+
+ERROR_VALUE_19 = 'Root keeper policy requires preferred roots and vice versa.'
+
+CL_INCORRECT_20 = '-d --dirs --max-size 100 test-data/A -r test-data/B'
+
+ERROR_VALUE_20 = 'Directory mode can not be combined with include, exclude, size or file system filters.'
+
+CL_INCORRECT_21 = '--sparse --archives test-data/A'
+
+ERROR_VALUE_21 = 'Sparse hashing can not be combined with chunk analysis, filter, agent, image or archive modes.'
+
+CL_INCORRECT_22 = '--incremental --archives --hash-cache test-data/cache.json test-data/A'
+
+ERROR_VALUE_22 = 'Incremental hashing can not be combined with sparse hashing, chunk analysis, filter, agent, image or archive modes.'
+
+CL_INCORRECT_23 = '--merge -d test-data/A -r test-data/res'
+
+ERROR_VALUE_23 = 'Merge mode can not be combined with other modes or options.'
+
+CL_INCORRECT_24 = '--undo --dirs -r test-data/res'
+
+ERROR_VALUE_24 = 'Resume and undo modes can not be combined with other modes, options or source paths.'
+
 def test_empty():
     with pytest.raises(SystemExit):
         argutils.parse_arguments('')
@@ -71,8 +147,22 @@ def parse_and_validate(input: str):
 
 
 def test_incorrect_args():
-    for i, o in zip([CL_INCORRECT_1, CL_INCORRECT_2, CL_INCORRECT_3, CL_INCORRECT_4, CL_INCORRECT_5],
-                    [ERROR_VALUE_1, ERROR_VALUE_2, ERROR_VALUE_3, ERROR_VALUE_4, ERROR_VALUE_5]):
+    for i, o in zip([CL_INCORRECT_1, CL_INCORRECT_2, CL_INCORRECT_3, CL_INCORRECT_4, CL_INCORRECT_5,
+                     CL_INCORRECT_6, CL_INCORRECT_7, CL_INCORRECT_8,
+                     CL_INCORRECT_9, CL_INCORRECT_10, CL_INCORRECT_11,
+                     CL_INCORRECT_12, CL_INCORRECT_13, CL_INCORRECT_14,
+                     CL_INCORRECT_15, CL_INCORRECT_16, CL_INCORRECT_17,
+                     CL_INCORRECT_18, CL_INCORRECT_19, CL_INCORRECT_20,
+                     CL_INCORRECT_21, CL_INCORRECT_22, CL_INCORRECT_23,
+                     CL_INCORRECT_24],
+                    [ERROR_VALUE_1, ERROR_VALUE_2, ERROR_VALUE_3, ERROR_VALUE_4, ERROR_VALUE_5,
+                     ERROR_VALUE_6, ERROR_VALUE_7, ERROR_VALUE_8,
+                     ERROR_VALUE_9, ERROR_VALUE_10, ERROR_VALUE_11,
+                     ERROR_VALUE_12, ERROR_VALUE_13, ERROR_VALUE_14,
+                     ERROR_VALUE_15, ERROR_VALUE_16, ERROR_VALUE_17,
+                     ERROR_VALUE_18, ERROR_VALUE_19, ERROR_VALUE_20,
+                     ERROR_VALUE_21, ERROR_VALUE_22, ERROR_VALUE_23,
+                     ERROR_VALUE_24]):
         with pytest.raises(ValueError) as exinfo:
             parse_and_validate(i)
         assert str(exinfo.value) == o
@@ -85,3 +175,67 @@ def test_correct_args():
         str_settings = f'{settings.op_dedup}, {settings.op_unique}, {settings.dest_path}, '\
             f'{settings.source}, {settings.remove_empty}, {settings.op_test}'
         assert str_settings == o
+
+
+def test_chunks_args():
+    settings = parse_and_validate('-c test-data/A test-data/B')
+    assert settings.op_chunks
+    assert not (settings.op_dedup or settings.op_unique)
+
+
+def test_reference_args():
+    settings = parse_and_validate('test-data/C --reference test-data/A --reference test-data/B')
+    assert settings.reference == ['test-data/A', 'test-data/B']
+
+
+def test_shard_args():
+    settings = parse_and_validate('--shard 1/4 test-data/A -r test-data/res')
+    assert settings.shard == (1, 4)
+    with pytest.raises(SystemExit):
+        argutils.parse_arguments(['--shard', '1-4', 'test-data/A'])
+
+
+def test_resume_undo_options(tmp_path):
+    (tmp_path / 'journal.jsonl').write_text('')
+    dest = str(tmp_path)
+    for mode in ('--resume', '--undo'):
+        for option in ('--dirs', '--images dhash', '--archives', '--keep oldest', '--copy',
+                       '--parallel', '--pipeline', '--time-budget 10', '--byte-budget 100',
+                       '--include *.txt', '--exclude .git', '--min-size 1', '-x',
+                       '--max-read-rate 100', '--max-iops 10', '--hash-cache cache.json'):
+            settings = argutils.parse_arguments([mode, '-r', dest] + option.split(' '))
+            with pytest.raises(ValueError) as exinfo:
+                argutils.verify_settings(settings, False)
+            assert str(exinfo.value) == ERROR_VALUE_24, f'{mode} {option}'
+    # resume purges emptied directories, undo does not
+    assert argutils.verify_settings(argutils.parse_arguments(['--resume', '-p', '-r', dest]),
+                                    False).remove_empty
+    with pytest.raises(ValueError):
+        argutils.verify_settings(argutils.parse_arguments(['--undo', '-p', '-r', dest]), False)
+
+
+def test_merge_args(tmp_path):
+    settings = argutils.parse_arguments(['--merge', 'a.jsonl', 'b.jsonl', '-r', 'test-data/res'])
+    assert settings.merge
+    assert settings.source == ['a.jsonl', 'b.jsonl']
+    assert settings.dest_path == 'test-data/res'
+    with pytest.raises(ValueError):
+        argutils.verify_settings(settings, False)
+    # options merge does not use are rejected, not ignored
+    for option in ('--copy', '--keep oldest', '--parallel', '--pipeline', '--time-budget 10',
+                   '--byte-budget 100', '--sparse', '--incremental', '--hash-cache cache.json',
+                   '--checksums xattr', '--include *.txt', '--exclude .git', '--min-size 1',
+                   '--max-size 1', '-x', '--max-read-rate 100', '--max-iops 10', '-p',
+                   '--dirs', '--algorithm sha256'):
+        settings = argutils.parse_arguments(['--merge', 'a.jsonl'] + option.split(' '))
+        with pytest.raises(ValueError) as exinfo:
+            argutils.verify_settings(settings, False)
+        assert str(exinfo.value) == ERROR_VALUE_23, option
+    (tmp_path / 'a.jsonl').write_text('')
+    settings = argutils.parse_arguments(['--merge', str(tmp_path / 'a.jsonl'), '--nice', '5'])
+    assert argutils.verify_settings(settings, False).merge
+    # source directory named "merge" is just a source
+    (tmp_path / 'merge').mkdir()
+    settings = argutils.parse_arguments([str(tmp_path / 'merge')])
+    assert not settings.merge
+    assert argutils.verify_settings(settings, False).source == [str(tmp_path / 'merge')]
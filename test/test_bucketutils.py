@@ -0,0 +1,27 @@
+import pytest
+from yadupe import bucketutils
+
+
+@pytest.fixture
+def buckets():
+    buckets = bucketutils.SizeBuckets()
+    for idx, size in enumerate([10, 20, 10, 30, 0, 20, 0, 40]):
+        buckets.add(f'/data/{idx}', size, reference=idx == 2)
+    return buckets
+
+
+EXPECTED = [('/data/0', 10, False), ('/data/1', 20, False), ('/data/2', 10, True),
+            ('/data/4', 0, False), ('/data/5', 20, False), ('/data/6', 0, False)]
+
+
+def test_colliding(buckets):
+    assert list(buckets.colliding()) == EXPECTED
+
+
+def test_colliding_python(buckets, monkeypatch):
+    monkeypatch.setattr(bucketutils, 'numpy', None)
+    assert list(buckets.colliding()) == EXPECTED
+
+
+def test_empty():
+    assert list(bucketutils.SizeBuckets().colliding()) == []
@@ -0,0 +1,97 @@
+import os
+import hashlib
+import pytest
+from yadupe import checksums, core
+from yadupe.hashutils import hash_file
+
+
+def xattrs_supported(path):
+    try:
+        os.setxattr(str(path), 'user.test', b'1')
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+DIGEST_A = 'a1' * 32
+DIGEST_B = 'b2' * 32
+
+
+def never_read(filepath):
+    raise AssertionError(f'{filepath} is read')
+
+
+def test_hash_file_algorithm(tmp_path, make_tree):
+    make_tree(tmp_path, {'a.txt': b'one'})
+    assert hash_file(str(tmp_path / 'a.txt'), 'sha256') == hashlib.sha256(b'one').hexdigest()
+
+
+def test_xattr(tmp_path, make_tree):
+    make_tree(tmp_path, {'a.txt': b'one'})
+    filepath = str(tmp_path / 'a.txt')
+    if not xattrs_supported(filepath):
+        pytest.skip('xattrs are not supported')
+    hasher = checksums.ChecksumHasher(['xattr'], 'sha256',
+                                      lambda path: hash_file(path, 'sha256'), write_back=True)
+    digest = hasher(filepath)
+    assert os.getxattr(filepath, 'user.checksum.sha256').decode() == digest
+    assert checksums.ChecksumHasher(['xattr'], 'sha256', never_read)(filepath) == digest
+    # modified file is read again
+    make_tree(tmp_path, {'a.txt': b'two'})
+    os.utime(filepath, ns=(0, 1))
+    assert hasher(filepath) == hashlib.sha256(b'two').hexdigest()
+
+
+def test_sidecar(tmp_path, make_tree):
+    make_tree(tmp_path, {'a.bin': b'data'})
+    os.utime(str(tmp_path / 'a.bin'), ns=(0, 1000))
+    make_tree(tmp_path, {'a.bin.sha256': f'{DIGEST_A.upper()}  a.bin\n'.encode()})
+    hasher = checksums.ChecksumHasher(['sidecar'], 'sha256', never_read)
+    assert hasher(str(tmp_path / 'a.bin')) == DIGEST_A
+    # truncated or non-hex digest is not trusted
+    for digest in ('abc123', 'x' * 64, DIGEST_A * 2):
+        make_tree(tmp_path, {'a.bin.sha256': f'{digest}  a.bin\n'.encode()})
+        with pytest.raises(AssertionError):
+            hasher(str(tmp_path / 'a.bin'))
+    make_tree(tmp_path, {'a.bin.sha256': f'{DIGEST_A}  a.bin\n'.encode()})
+    # sidecar older than the file is not trusted
+    os.utime(str(tmp_path / 'a.bin.sha256'), ns=(0, 10))
+    with pytest.raises(AssertionError):
+        hasher(str(tmp_path / 'a.bin'))
+
+
+def test_bagit(tmp_path, make_tree):
+    make_tree(tmp_path, {'bag/data/a.txt': b'one', 'bag/data/sub/b.txt': b'two',
+                         'other/c.txt': b'three'})
+    for path in ('bag/data/a.txt', 'bag/data/sub/b.txt', 'other/c.txt'):
+        os.utime(str(tmp_path / path), ns=(0, 1000))
+    make_tree(tmp_path, {'bag/bagit.txt': b'BagIt-Version: 1.0\n',
+                         'bag/manifest-sha256.txt':
+                             f'{DIGEST_A}  data/a.txt\n{DIGEST_B} *data/sub/b.txt\n'.encode()})
+    hasher = checksums.ChecksumHasher(['bagit'], 'sha256', lambda path: 'hashed')
+    assert hasher(str(tmp_path / 'bag' / 'data' / 'a.txt')) == DIGEST_A
+    assert hasher(str(tmp_path / 'bag' / 'data' / 'sub' / 'b.txt')) == DIGEST_B
+    assert hasher(str(tmp_path / 'other' / 'c.txt')) == 'hashed'
+
+    # Payload-Oxum matches payload: 6 bytes in 2 files
+    make_tree(tmp_path, {'bag/bag-info.txt': b'Payload-Oxum: 6.2\n'})
+    hasher = checksums.ChecksumHasher(['bagit'], 'sha256', lambda path: 'hashed')
+    assert hasher(str(tmp_path / 'bag' / 'data' / 'a.txt')) == DIGEST_A
+    # payload file was resized, the bag is not trusted
+    make_tree(tmp_path, {'bag/bag-info.txt': b'Payload-Oxum: 7.2\n'})
+    hasher = checksums.ChecksumHasher(['bagit'], 'sha256', lambda path: 'hashed')
+    assert hasher(str(tmp_path / 'bag' / 'data' / 'a.txt')) == 'hashed'
+
+
+def test_trusted_digests_scan(tmp_path, make_tree):
+    make_tree(tmp_path, {'src/a.bin': b'one', 'src/b.bin': b'two'})
+    for name in ('a.bin', 'b.bin'):
+        os.utime(str(tmp_path / 'src' / name), ns=(0, 1000))
+    # sidecars claim equal content: files are not read, digests are trusted
+    make_tree(tmp_path, {'src/a.bin.sha256': f'{DIGEST_A}  a.bin\n'.encode(),
+                         'src/b.bin.sha256': f'{DIGEST_A}  b.bin\n'.encode()})
+    settings = core.Settings(False, False, None, [str(tmp_path / 'src')], False, False,
+                             algorithm='sha256', checksums=['sidecar'])
+    files_dict = core._scan_sources(settings)
+    groups = [group.path for sk in files_dict.keys() for group in files_dict[sk].duplicates()]
+    assert sorted(os.path.basename(path) for path in groups[0]) == ['a.bin', 'b.bin']
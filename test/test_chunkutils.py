@@ -0,0 +1,102 @@
+import sys
+import os
+import random
+import pytest
+from yadupe import chunkutils
+
+EMPTY_FILE = 'test-data/A/a/4e.txt'
+SMALL_FILE = 'test-data/A/a/4.txt'
+SMALL_FILE_SIZE = 325
+
+DATA_SIZE = 512 * 1024
+SMALL_CHUNKING = {'min_size': 256, 'avg_size': 1024, 'max_size': 8192, 'read_size': 16384}
+
+
+@pytest.fixture
+def random_data():
+    rnd = random.Random(42)
+    return bytes(rnd.getrandbits(8) for _ in range(DATA_SIZE))
+
+
+def write_file(path, data):
+    with open(path, 'wb') as fileout:
+        fileout.write(data)
+    return str(path)
+
+
+def test_chunks_empty():
+    assert list(chunkutils.iter_chunks(os.path.abspath(EMPTY_FILE))) == []
+
+
+def test_chunks_small():
+    chunks = list(chunkutils.iter_chunks(os.path.abspath(SMALL_FILE)))
+    assert len(chunks) == 1
+    assert chunks[0].offset == 0
+    assert chunks[0].length == SMALL_FILE_SIZE
+
+
+def test_chunks_cover_file(tmp_path, random_data):
+    path = write_file(tmp_path / 'data.bin', random_data)
+    chunks = list(chunkutils.iter_chunks(path, **SMALL_CHUNKING))
+    offset = 0
+    for chunk in chunks[:-1]:
+        assert chunk.offset == offset
+        assert SMALL_CHUNKING['min_size'] <= chunk.length <= SMALL_CHUNKING['max_size']
+        offset += chunk.length
+    assert offset + chunks[-1].length == DATA_SIZE
+
+
+def test_chunks_read_size_independent(tmp_path, random_data):
+    path = write_file(tmp_path / 'data.bin', random_data)
+    chunks_1 = list(chunkutils.iter_chunks(path, **SMALL_CHUNKING))
+    chunking = dict(SMALL_CHUNKING, read_size=DATA_SIZE)
+    chunks_2 = list(chunkutils.iter_chunks(path, **chunking))
+    assert chunks_1 == chunks_2
+
+
+def test_candidates_numpy_python(random_data):
+    if chunkutils.numpy is None:
+        pytest.skip('NumPy is not available.')
+    strict_below = chunkutils._threshold(12)
+    loose_below = chunkutils._threshold(8)
+    assert chunkutils._candidates_numpy(random_data, strict_below, loose_below) == \
+        chunkutils._candidates_python(random_data, strict_below, loose_below)
+
+
+def test_chunks_shift_resistant(tmp_path, random_data):
+    path_1 = write_file(tmp_path / '1.bin', random_data)
+    path_2 = write_file(tmp_path / '2.bin',
+                        random_data[:1000] + b'inserted' + random_data[1000:])
+    digests_1 = {chunk.digest for chunk in chunkutils.iter_chunks(path_1, **SMALL_CHUNKING)}
+    digests_2 = {chunk.digest for chunk in chunkutils.iter_chunks(path_2, **SMALL_CHUNKING)}
+    assert len(digests_1 - digests_2) <= 2
+
+
+def test_index_shared_bytes(tmp_path, random_data):
+    path_1 = write_file(tmp_path / '1.bin', random_data)
+    path_2 = write_file(tmp_path / '2.bin', random_data[:DATA_SIZE // 2] + b'tail')
+    path_3 = write_file(tmp_path / '3.bin', b'unrelated content')
+    index = chunkutils.ChunkIndex()
+    for path in [path_1, path_2, path_3]:
+        index.add_file(path, **SMALL_CHUNKING)
+
+    shared = {path: (size, shared) for path, size, shared in index.file_shared_bytes()}
+    assert shared[path_1][0] == DATA_SIZE
+    assert DATA_SIZE // 2 - SMALL_CHUNKING['max_size'] <= shared[path_1][1] <= DATA_SIZE // 2
+    assert shared[path_3][1] == 0
+
+    pairs = index.pair_shared_bytes()
+    assert list(pairs.keys()) == [(0, 1)]
+    assert pairs[(0, 1)] == shared[path_1][1]
+
+
+def test_index_save_load(tmp_path, random_data):
+    index = chunkutils.ChunkIndex()
+    index.add_file(write_file(tmp_path / '1.bin', random_data), **SMALL_CHUNKING)
+    index.add_file(os.path.abspath(EMPTY_FILE))
+    index.save(str(tmp_path / 'chunks.idx'))
+
+    loaded = chunkutils.ChunkIndex.load(str(tmp_path / 'chunks.idx'))
+    assert loaded.files == index.files
+    assert loaded.sizes == index.sizes
+    assert loaded.chunks == index.chunks
@@ -0,0 +1,75 @@
+import os
+import errno
+import pytest
+from yadupe import copyutils
+
+
+@pytest.fixture
+def source(tmp_path):
+    filepath = tmp_path / 'source.bin'
+    filepath.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    os.chmod(str(filepath), 0o640)
+    return filepath
+
+
+def check_copy(src, dst):
+    assert dst.read_bytes() == src.read_bytes()
+    assert os.stat(str(dst)).st_mode == os.stat(str(src)).st_mode
+    assert os.stat(str(dst)).st_mtime == os.stat(str(src)).st_mtime
+
+
+def test_copy_file(source, tmp_path):
+    copyutils.copy_file(str(source), str(tmp_path / 'copy.bin'))
+    check_copy(source, tmp_path / 'copy.bin')
+
+
+def test_copy_fallbacks(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(copyutils, '_reflink', lambda infd, outfd: False)
+    monkeypatch.setattr(copyutils, 'COPY_CHUNK_SIZE', 1024 * 1024)
+    monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    copyutils.copy_file(str(source), str(tmp_path / 'sendfile.bin'))
+    check_copy(source, tmp_path / 'sendfile.bin')
+
+    monkeypatch.delattr(os, 'sendfile', raising=False)
+    copyutils.copy_file(str(source), str(tmp_path / 'plain.bin'))
+    check_copy(source, tmp_path / 'plain.bin')
+
+
+def test_copy_files(source, tmp_path):
+    pairs = [(str(source), str(tmp_path / 'out' / f'{idx}' / 'copy.bin')) for idx in range(6)]
+    copyutils.copy_files(pairs, workers=3)
+    for _, dst in pairs:
+        assert os.path.getsize(dst) == os.path.getsize(str(source))
+
+
+def test_move_across_devices(source, tmp_path):
+    def cross_device(src, dst):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    data = source.read_bytes()
+    copyutils.move(str(source), str(tmp_path / 'moved.bin'), cross_device)
+    assert not source.exists()
+    assert (tmp_path / 'moved.bin').read_bytes() == data
+    assert sorted(os.listdir(str(tmp_path))) == ['moved.bin']
+
+
+def test_move_across_devices_throttled(source, tmp_path):
+    charged = []
+
+    class Throttle(object):
+        def io(self, ops=1, nbytes=0):
+            charged.append(nbytes)
+
+    def cross_device(src, dst):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    size = os.path.getsize(str(source))
+    copyutils.move(str(source), str(tmp_path / 'moved.bin'), cross_device, Throttle())
+    assert sum(charged) == size
+
+    # directory tree: each copied file is charged
+    tree = tmp_path / 'tree'
+    (tree / 'sub').mkdir(parents=True)
+    (tree / 'a.bin').write_bytes(b'a' * 100)
+    (tree / 'sub' / 'b.bin').write_bytes(b'b' * 50)
+    charged.clear()
+    copyutils.move(str(tree), str(tmp_path / 'tree-moved'), cross_device, Throttle())
+    assert sum(charged) == 150
@@ -1,9 +1,12 @@
 import sys
 import os
+import errno
 import io
 import re
+import threading
+import time
 import pytest
-from yadupe import core
+from yadupe import core, argutils, journalutils, fsbackend, ioscheduler
 
 FILEPATH_1 = 'test-data/A/2.txt'
 FILEPATH_1EQ = 'test-data/A/3.txt'
@@ -16,6 +19,10 @@ SOURCE_3 = 'test-data/C'
 SOURCE_4 = 'test-data/D'
 RESULT_DIR = 'test-data/res'
 
+SEEN_PATH = 'test-data/C/a/b/d/f/9.txt'
+NOT_SEEN_PATH = 'test-data/C/11.txt'
+NOT_HASHED_PATH = 'test-data/C/a/b/d/g/10.txt'
+
 DUPLICATE_NAME_1 = 'Filename: 3.txt'
 DUPLICATE_NAME_2 = 'Filename: 6.txt'
 DUPLICATE_NAME_3 = 'Filename: 7.txt'
@@ -265,8 +272,9 @@ def test_purgeempty():
     os.makedirs(path, exist_ok=True)
     assert os.access(path, os.F_OK)
 
-    core._remove_empty_subdirs([path])
+    core._purge_dirs([path], [os.path.abspath(TESTDATA_PATH)])
     assert not os.access(path, os.F_OK)
+    assert not os.access(os.path.dirname(path), os.F_OK)
 
 
 def test_uniquemove():
@@ -305,3 +313,580 @@ def test_uniquemove():
             continue
         else:
             assert False, f'{template} not found.'
+
+
+def test_filter_against(tmp_path):
+    filter_path = str(tmp_path / 'filter.bin')
+    settings = core.Settings(False, False, None, [os.path.abspath(SOURCE_2)], False, True,
+                             filter_build=filter_path)
+    core.deduplicate(settings)
+    assert os.path.isfile(filter_path)
+
+    settings = core.Settings(False, False, str(tmp_path), [os.path.abspath(SOURCE_3)], False, True,
+                             filter_against=filter_path)
+    seen = core._check_against_filter(settings)
+    seen_paths = [filepath for filepath, _ in seen]
+    assert os.path.abspath(SEEN_PATH) in seen_paths
+    assert os.path.abspath(NOT_SEEN_PATH) not in seen_paths
+    with open(str(tmp_path / 'report.txt')) as report:
+        assert report.readline().strip() == 'Seen list:'
+
+
+def test_filter_small_files_read_once(tmp_path, monkeypatch):
+    small = tmp_path / 'small.txt'
+    small.write_bytes(b'small' * 100)
+    large = tmp_path / 'large.txt'
+    large.write_bytes(b'large' * 10000)
+    expected = {str(path): core.hash_file(str(path)) for path in (small, large)}
+    read = []
+    monkeypatch.setattr(core, 'hash_file', lambda filepath: read.append(filepath)
+                        or expected[filepath])
+    for path in (small, large):
+        filepath = str(path)
+        digest = core._full_digest(filepath, os.path.getsize(filepath),
+                                   core.partial_hash_file(filepath))
+        assert digest == expected[filepath]
+    assert read == [str(large)]
+
+
+def test_similarfiles_lazy():
+    hashed = []
+
+    def hasher(filepath):
+        hashed.append(filepath)
+        return core.hash_file(filepath)
+
+    simfile = core._SimilarFiles(FILEPATH_1, hasher=hasher)
+    assert len(list(simfile.uniques())) == 1
+    assert hashed == []
+    simfile.add(FILEPATH_1EQ)
+    assert len(list(simfile.duplicates())) == 1
+    assert hashed == [FILEPATH_1, FILEPATH_1EQ]
+
+
+def test_reference_duplicates():
+    hashed = []
+
+    def hasher(filepath):
+        hashed.append(filepath)
+        return core.hash_file(filepath)
+
+    reference = os.path.abspath(SOURCE_2)
+    source = os.path.abspath(SOURCE_3)
+    fd = core.FilepathDict(hasher=hasher, reference_mode=True)
+    core._scan_duplicates(reference, fd, reference=True)
+    core._scan_duplicates(source, fd)
+    fd = core._move_duplicates(fd, [source], os.path.abspath(RESULT_DIR), True)
+
+    groups = [group for sk in fd.keys() for group in fd[sk].duplicates()]
+    assert groups
+    for group in groups:
+        for filepath in group.path[:group.kept]:
+            assert filepath.startswith(reference)
+        for filepath in group.path[group.kept:]:
+            assert filepath.startswith(source)
+            assert ' -> ' in filepath
+    # source-only size buckets are not hashed
+    assert os.path.abspath(NOT_HASHED_PATH) not in hashed
+
+
+def test_shard_merge(tmp_path):
+    sources = [os.path.abspath(path) for path in [SOURCE_1, SOURCE_2, SOURCE_3, SOURCE_4]]
+    fd = core.FilepathDict()
+    for el in sources:
+        core._scan_duplicates(el, fd)
+    expected = sorted(sorted(group.path) for sk in fd.keys() for group in fd[sk].duplicates())
+
+    count = 3
+    partials = []
+    for index in range(count):
+        settings = core.Settings(False, False, str(tmp_path), sources, False, True,
+                                 shard=(index, count))
+        partials.append(core._scan_shard(settings))
+
+    merged = core.merge(partials, str(tmp_path))
+    groups = sorted(sorted(group.path) for sk in merged.keys() for group in merged[sk].duplicates())
+    assert groups == expected
+    assert os.path.isfile(str(tmp_path / 'report.txt'))
+
+    # merge mode of deduplicate, as run by --merge
+    os.remove(str(tmp_path / 'report.txt'))
+    core.deduplicate(core.Settings(False, False, str(tmp_path), partials, False, True,
+                                   merge=True))
+    assert os.path.isfile(str(tmp_path / 'report.txt'))
+
+
+def test_shard_of():
+    for size in [0, 1, 758, 3432, 29483, 175132]:
+        shards = [core._shard_of(size, 4) for _ in range(2)]
+        assert shards[0] == shards[1]
+        assert 0 <= shards[0] < 4
+    assert len({core._shard_of(size * 4096, 4) for size in range(100)}) == 4
+
+
+def test_dir_duplicates_move(tmp_path, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    project = {'src/main.py': b'main', 'src/util.py': b'util', 'README': b'readme'}
+    make_tree(source, {os.path.join('copy1', p): c for p, c in project.items()})
+    make_tree(source, {os.path.join('copy2', p): c for p, c in project.items()})
+    make_tree(source, {'other/README': b'readme', 'other/main.py': b'mainx'})
+
+    settings = core.Settings(True, False, str(dest), [str(source)], False, False, op_dirs=True)
+    core.deduplicate(settings)
+
+    assert os.path.isdir(str(source / 'copy1'))
+    assert not os.path.exists(str(source / 'copy2'))
+    assert os.path.isfile(str(dest / 'copy1' / 'copy2' / 'src' / 'main.py'))
+    # file level duplicate outside identical directories is still moved
+    assert not os.path.exists(str(source / 'other' / 'README'))
+
+    with open(str(dest / 'report.txt')) as fileout:
+        report = fileout.read()
+    assert report.startswith('Duplicate directory list:')
+    assert 'Files: 3' in report
+    assert report.count('Filename: ') == 1
+
+
+def test_dir_duplicates_not_scanned_entries(tmp_path, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    project = {'a.txt': b'same'}
+    for name in ('empty', 'link', 'filtered', 'plain1', 'plain2'):
+        make_tree(source, {os.path.join(name, p): c for p, c in project.items()})
+    (source / 'empty' / 'sub').mkdir()
+    os.symlink(str(source / 'plain1' / 'a.txt'), str(source / 'link' / 'b.txt'))
+    make_tree(source, {'filtered/precious.bin': b'x' * 5000})
+
+    settings = core.Settings(True, False, str(dest), [str(source)], False, False, op_dirs=True,
+                             max_size=100)
+    core.deduplicate(settings)
+
+    # only directories without unscanned entries are moved whole
+    assert os.path.isdir(str(source / 'empty' / 'sub'))
+    assert os.path.isfile(str(source / 'filtered' / 'precious.bin'))
+    assert not os.path.exists(str(source / 'plain2'))
+    with open(str(dest / 'report.txt')) as fileout:
+        dir_report = fileout.read().split('End of list.')[0]
+    assert 'plain1' in dir_report and 'plain2' in dir_report
+    assert not any(name in dir_report for name in ('empty', 'link', 'filtered'))
+
+
+def test_image_duplicates(tmp_path, capfd):
+    Image = pytest.importorskip('PIL.Image')
+    pytest.importorskip('numpy')
+    image = Image.new('RGB', (200, 100), (255, 255, 255))
+    image.paste((0, 0, 0), (0, 0, 100, 100))
+    image.save(str(tmp_path / 'photo.png'))
+    image.resize((100, 50)).save(str(tmp_path / 'photo_small.jpg'), quality=70)
+    Image.new('RGB', (200, 100), (0, 0, 0)).save(str(tmp_path / 'black.png'))
+
+    settings = core.Settings(False, False, None, [str(tmp_path)], False, True, image_hash='dhash')
+    core.deduplicate(settings)
+    out = [line for line in capfd.readouterr()[0].split('\n') if line.strip()]
+    assert out[0] == SHOW_DUPLICATE_REPORT_FIRSTLINE
+    assert len([line for line in out if line.startswith('Filename: ')]) == 1
+    assert any(line.endswith('photo_small.jpg') for line in out)
+    assert not any(line.endswith('black.png') for line in out)
+
+
+def test_archive_duplicates(tmp_path, make_tree):
+    import zipfile
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {'loose/1.txt': b'one', 'loose/2.txt': b'two'})
+    archive = str(source / 'dump.zip')
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('inner/1.txt', b'one')
+        zip_file.writestr('inner/3.txt', b'six')
+
+    settings = core.Settings(True, False, str(dest), [str(source)], False, False, archives=True)
+    core.deduplicate(settings)
+
+    # loose copy is moved, archive member is kept
+    assert not os.path.exists(str(source / 'loose' / '1.txt'))
+    assert os.path.isfile(str(source / 'loose' / '2.txt'))
+    assert os.path.isfile(archive)
+    with open(str(dest / 'report.txt')) as fileout:
+        report = fileout.read()
+    assert f'{archive}!/inner/1.txt\n' in report
+    assert report.count('Filename: ') == 1
+
+
+def test_resolve_within_budget(tmp_path, make_tree):
+    files = {}
+    for size, count in ((100, 3), (1000, 2), (10, 2), (50, 1)):
+        for idx in range(count):
+            files[f'{size}/{idx}.bin'] = bytes([size % 256]) * size
+    make_tree(tmp_path, files)
+    files_dict = core.FilepathDict()
+    for path in files.keys():
+        filepath = os.path.join(str(tmp_path), path)
+        files_dict.add(core.SimpleKey.create(os.path.getsize(filepath)), filepath)
+
+    assert files_dict.resolve_within_budget(byte_budget=2100) == 1
+    assert [sk.size for sk in files_dict.keys()] == [1000, 10, 50]
+    assert files_dict.duplicateslist_count() == 2
+
+    target = io.StringIO()
+    files_dict._save_duplicates_(target)
+    assert target.getvalue().endswith('Budget exhausted: 1 groups of same sized files '
+                                      'were not checked.\nEnd of list.\n')
+
+    files_dict = core.FilepathDict()
+    for path in files.keys():
+        filepath = os.path.join(str(tmp_path), path)
+        files_dict.add(core.SimpleKey.create(os.path.getsize(filepath)), filepath)
+    assert files_dict.resolve_within_budget(time_budget=0) == 3
+
+
+def test_resolve_within_budget_uniques(tmp_path, make_tree):
+    make_tree(tmp_path, {'a/1.txt': b'same', 'b/1.txt': b'same', 'c/2.txt': b'diff'})
+    files_dict = core.FilepathDict(reference_mode=True)
+    for path in ('a/1.txt', 'b/1.txt', 'c/2.txt'):
+        files_dict.add(core.SimpleKey.create(4), os.path.join(str(tmp_path), path))
+
+    # without reference pathes the group is hashed only to find uniques,
+    # it is done within the budget, not later while reporting
+    files_dict.resolve_within_budget(byte_budget=100, uniques=True)
+    assert files_dict[core.SimpleKey.create(4)].unhashed(uniques=True) == []
+    assert files_dict.uniqueslist_count() == 2
+
+
+def test_hash_pending(tmp_path, make_tree):
+    make_tree(tmp_path, {'a/1.txt': b'same', 'b/1.txt': b'same', 'c/2.txt': b'diff',
+                         'd/3.txt': b'unique'})
+    files_dict = core.FilepathDict()
+    for dirpath, _, filenames in os.walk(str(tmp_path)):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            files_dict.add(core.SimpleKey.create(os.path.getsize(filepath)), filepath)
+    hashed = []
+
+    def hash_map(hasher, pathes):
+        hashed.extend(pathes)
+        return {path: hasher(path) for path in pathes}
+
+    files_dict.hash_pending(hash_map)
+    assert len(hashed) == 3
+    assert not any(files_dict[sk].unhashed() for sk in files_dict.keys())
+    assert files_dict.duplicateslist_count() == 1
+
+
+def test_move_batches(tmp_path, monkeypatch, make_tree):
+    monkeypatch.setattr(core, 'MOVE_BATCH_SIZE', 2)
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {f'{name}/{idx}.txt': f'content {idx}'.encode()
+                       for name in ('a', 'b', 'c/d') for idx in range(3)})
+
+    settings = core.Settings(True, False, str(dest), [str(source)], False, False, ordered=True)
+    core.deduplicate(settings)
+
+    kept = [os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(str(source))
+            for filename in filenames]
+    moved = [os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(str(dest))
+             for filename in filenames if filename not in ('report.txt', 'journal.jsonl')]
+    assert len(kept) == 3
+    assert len(moved) == 6
+
+
+def test_parallel_moves(tmp_path, monkeypatch, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {f'{name}/{idx}.txt': f'content {idx}'.encode()
+                       for name in ('a', 'b', 'c') for idx in range(3)})
+    scheduled = []
+    map_by_device = ioscheduler.map_by_device
+
+    def recording_map(function, filepaths, **kwargs):
+        filepaths = list(filepaths)
+        scheduled.append(filepaths)
+        return map_by_device(function, filepaths, **kwargs)
+    monkeypatch.setattr(ioscheduler, 'map_by_device', recording_map)
+
+    settings = core.Settings(True, False, str(dest), [str(source)], False, False,
+                             parallel=True)
+    core.deduplicate(settings)
+    moved = [filename for _, _, filenames in os.walk(str(dest)) for filename in filenames
+             if filename.endswith('.txt') and filename != 'report.txt']
+    assert len(moved) == 6
+    # the last scheduled batch is the moves one
+    assert sorted(os.path.basename(path) for path in scheduled[-1]) == \
+        ['0.txt', '0.txt', '1.txt', '1.txt', '2.txt', '2.txt']
+
+
+def test_move_batch_failure_journaled(tmp_path, make_tree):
+    make_tree(tmp_path, {'source/a.txt': b'a', 'source/b.txt': b'b'})
+    journal = journalutils.Journal(str(tmp_path / 'journal.jsonl'))
+    journal.group('file', 'a.txt', 1, [])
+    batch = core._MoveBatch(journal=journal, move_map=ioscheduler.map_in_order)
+    batch.add(str(tmp_path / 'source' / 'a.txt'), str(tmp_path / 'dest' / 'a.txt'))
+    batch.add(str(tmp_path / 'source' / 'missing.txt'), str(tmp_path / 'dest' / 'missing.txt'))
+    with pytest.raises(OSError):
+        batch.flush()
+    journal.close()
+    state = journalutils.load_journal(str(tmp_path / 'journal.jsonl'))
+    # the move done before the failure is journaled as done
+    assert str(tmp_path / 'source' / 'a.txt') in state.done
+
+
+def test_group_moved_after_flush(tmp_path, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {f'{name}/{idx}.txt': f'content {idx}'.encode()
+                       for name in ('a', 'b', 'c') for idx in range(3)})
+    files_dict = core.FilepathDict()
+    core._scan_duplicates(str(source), files_dict)
+    moved = []
+
+    def groupmovedhook():
+        moved.append(sum(len(filenames) for _, _, filenames in os.walk(str(dest))))
+
+    hooks = core.HookWrapper()
+    hooks.groupmovedhook = groupmovedhook
+    core._move_duplicates(files_dict, [str(source)], str(dest), hooks=hooks)
+    # hook is called when moves of the group are done, not when they are queued
+    assert moved == [6, 6, 6]
+
+
+def test_empty_files_not_opened(tmp_path, make_tree):
+    make_tree(tmp_path, {'a/empty': b'', 'b/empty.txt': b'', 'c/empty.log': b''})
+
+    def hasher(filepath):
+        raise AssertionError(f'{filepath} is opened')
+
+    files_dict = core.FilepathDict(hasher=hasher)
+    core._scan_duplicates(str(tmp_path), files_dict)
+    assert files_dict.duplicateslist_count() == 1
+    group = next(files_dict[core.SimpleKey.create(0)].duplicates())
+    assert len(group.path) == 3
+
+
+def test_pipelined_scan(tmp_path, monkeypatch, make_tree):
+    monkeypatch.setattr(core, 'PIPELINE_QUEUE_SIZE', 2)
+    monkeypatch.setattr(core, 'PIPELINE_HASH_JOBS', 1)
+    make_tree(tmp_path / 'ref', {'1.txt': b'one', '4.txt': b'four'})
+    make_tree(tmp_path / 'src', {'a/1.txt': b'one', 'b/1.txt': b'one', 'c/2.txt': b'two',
+                                 'd/3.txt': b'three', 'e/5.txt': b'fivee'})
+    hashed = []
+
+    def hasher(filepath):
+        hashed.append(filepath)
+        return core.hash_file(filepath)
+
+    files_dict = core.FilepathDict(hasher=hasher, reference_mode=True)
+    core._scan_pipelined([(str(tmp_path / 'ref'), True), (str(tmp_path / 'src'), False)],
+                         files_dict)
+    # size 3 collides with reference file, size 4 is reference only,
+    # size 5 has no reference files
+    assert sorted(os.path.basename(path) for path in hashed) == \
+        ['1.txt', '1.txt', '1.txt', '2.txt']
+    groups = list(files_dict[core.SimpleKey.create(3)].duplicates())
+    assert len(groups) == 1 and groups[0].kept == 1 and len(groups[0].path) == 3
+    assert len(hashed) == 4
+
+
+def test_pipelined_scan_bounded(tmp_path, monkeypatch, make_tree):
+    monkeypatch.setattr(core, 'PIPELINE_HASH_JOBS', 2)
+    make_tree(tmp_path, {f'{idx}/1.txt': b'same' for idx in range(20)})
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def hasher(filepath):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.001)
+        with lock:
+            running[0] -= 1
+        return core.hash_file(filepath)
+
+    files_dict = core.FilepathDict(hasher=hasher)
+    core._scan_pipelined([(str(tmp_path), False)], files_dict)
+    assert running[1] <= 2
+    assert files_dict.duplicateslist_count() == 1
+
+    def failing(filepath):
+        raise OSError('read error')
+
+    with pytest.raises(OSError):
+        core._scan_pipelined([(str(tmp_path), False)], core.FilepathDict(hasher=failing))
+
+
+def test_purge_moved_from(tmp_path, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {'keep/1.txt': b'one', 'a/b/c/1.txt': b'one', 'a/b/2.txt': b'two',
+                       'x/y/z/1.txt': b'one', 'other/3.txt': b'three'})
+    os.makedirs(str(source / 'untouched' / 'empty'))
+
+    settings = core.Settings(True, False, str(dest), [str(source)], True, False)
+    core.deduplicate(settings)
+
+    remaining = sorted(os.path.relpath(dirpath, str(source))
+                       for dirpath, _, _ in os.walk(str(source)))
+    kept = [path for path in ('keep', 'a/b/c', 'x/y/z') if path in remaining]
+    assert len(kept) == 1
+    # emptied directories are removed bottom-up, other empty ones are left
+    if kept[0] != 'a/b/c':
+        assert 'a/b/c' not in remaining
+    if kept[0] != 'x/y/z':
+        assert 'x' not in remaining
+    if kept[0] != 'keep':
+        assert 'keep' not in remaining
+    assert 'a/b' in remaining
+    assert 'untouched/empty' in remaining
+
+
+def test_purge_dirs_keeps_roots(tmp_path, make_tree):
+    make_tree(tmp_path, {'root/a/b/1.txt': b'one'})
+    os.remove(str(tmp_path / 'root' / 'a' / 'b' / '1.txt'))
+    assert core._purge_dirs([str(tmp_path / 'root' / 'a' / 'b')], [str(tmp_path / 'root')]) == 2
+    assert os.listdir(str(tmp_path / 'root')) == []
+
+
+def test_journal_undo(tmp_path, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {'1.txt': b'one', 'a/1.txt': b'one', 'b/2.txt': b'two'})
+
+    core.deduplicate(core.Settings(True, False, str(dest), [str(source)], False, False))
+    state = journalutils.load_journal(journalutils.journal_path(str(dest)))
+    assert state.ended and len(state.done) == 1
+    assert state.groups[0].digest is not None
+
+    core.deduplicate(core.Settings(False, False, str(dest), [], False, False, undo=True))
+    assert os.path.isfile(str(source / '1.txt')) and os.path.isfile(str(source / 'a' / '1.txt'))
+
+
+def test_hash_small_cached(tmp_path, monkeypatch, make_tree):
+    source = tmp_path / 'source'
+    make_tree(source, {'1.txt': b'one', 'a/1.txt': b'one', 'b/2.txt': b'two'})
+    cache = str(tmp_path / 'cache.json')
+    settings = core.Settings(False, False, None, [str(source)], False, False, hash_cache=cache)
+    core.deduplicate(settings)
+    with open(cache) as filein:
+        assert str(source / 'a' / '1.txt') in filein.read()
+
+    hashed = []
+    hash_small_files = core.hash_small_files
+
+    def counting(pathes):
+        hashed.extend(pathes)
+        return hash_small_files(pathes)
+    monkeypatch.setattr(core, 'hash_small_files', counting)
+    core.deduplicate(settings)
+    assert hashed == []
+
+
+def test_keep_oldest(tmp_path, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {'a/1.txt': b'one', 'b/1.txt': b'one'})
+    os.utime(str(source / 'b' / '1.txt'), ns=(10 ** 9, 10 ** 9))
+
+    core.deduplicate(core.Settings(True, False, str(dest), [str(source)], False, False,
+                                   keep='oldest'))
+    assert os.path.isfile(str(source / 'b' / '1.txt'))
+    assert not os.path.exists(str(source / 'a' / '1.txt'))
+
+
+def test_move_across_devices(tmp_path, monkeypatch, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {'1.txt': b'one', 'a/1.txt': b'one', 'b/2.txt': b'two'})
+
+    replace = os.replace
+
+    def cross_device(src, dst):
+        if (str(dest) in src) != (str(dest) in dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', cross_device)
+    core.deduplicate(core.Settings(True, False, str(dest), [str(source)], False, False))
+    moved = [os.path.join(dirpath, filename) for dirpath, _, filenames in os.walk(str(dest))
+             for filename in filenames if filename == '1.txt']
+    assert len(moved) == 1
+    assert len([path for path in (source / '1.txt', source / 'a' / '1.txt')
+                if os.path.isfile(str(path))]) == 1
+
+
+def test_move_across_devices_throttled(tmp_path, monkeypatch, make_tree):
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    make_tree(source, {'big.bin': b'x' * 150000})
+    replace = os.replace
+
+    def cross_device(src, dst):
+        if (str(dest) in src) != (str(dest) in dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', cross_device)
+    limiter = core._make_throttle(core.Settings(False, False, None, [], False, False,
+                                                max_read_rate=100000))
+    batch = core._MoveBatch(throttle=limiter)
+    started = time.monotonic()
+    batch.add(str(source / 'big.bin'), str(dest / 'big.bin'))
+    batch.flush()
+    # one second of burst, the rest is paced by the read rate
+    assert time.monotonic() - started >= 0.45
+    assert (dest / 'big.bin').stat().st_size == 150000
+
+
+def test_memory_backend():
+    backend = fsbackend.MemoryBackend()
+    for idx in range(100):
+        backend.add_file(f'/src/{idx % 10}/{idx}.txt', b'same' if idx % 2 else str(idx).encode())
+    backend.makedirs('/dest')
+    settings = core.Settings(True, False, '/dest', ['/src'], True, False, backend=backend)
+
+    core.deduplicate(argutils.verify_settings(settings))
+    kept = [name for _, _, filenames in backend.walk('/src') for name in filenames]
+    moved = [name for _, _, filenames in backend.walk('/dest') for name in filenames]
+    assert len(kept) == 51 and len(moved) == 50
+    assert 'report.txt' in moved
+    # emptied directories are removed
+    assert len(backend.listdir('/src')) == 6
+
+
+def test_copy_uniques(tmp_path, make_tree):
+    make_tree(tmp_path, {'first/a/1.txt': b'one', 'first/2.txt': b'two',
+                         'second/a/1.txt': b'uno', 'second/b/3.txt': b'one'})
+    sources = [str(tmp_path / 'first'), str(tmp_path / 'second')]
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+
+    settings = core.Settings(False, True, str(dest), sources, False, False, copy=True)
+    core.deduplicate(settings)
+
+    copied = sorted(os.path.relpath(os.path.join(dirpath, filename), str(dest))
+                    for dirpath, _, filenames in os.walk(str(dest)) for filename in filenames
+                    if filename != 'report.txt')
+    assert len(copied) == 3
+    assert '2.txt' in copied and 'a/1.txt' in copied and 'a/1_1.txt' in copied
+    # sources are left intact
+    assert len([filename for root in sources for _, _, filenames in os.walk(root)
+                for filename in filenames]) == 4
+
+
+def test_copy_uniques_existing(tmp_path, make_tree):
+    make_tree(tmp_path, {'source/a/1.txt': b'one', 'dest/a/1.txt': b'kept'})
+    dest = tmp_path / 'dest'
+    settings = core.Settings(False, True, str(dest), [str(tmp_path / 'source')], False, False,
+                             copy=True)
+    core.deduplicate(settings)
+    # file already in dest is not overwritten, the copy gets suffix
+    assert (dest / 'a' / '1.txt').read_bytes() == b'kept'
+    assert (dest / 'a' / '1_1.txt').read_bytes() == b'one'
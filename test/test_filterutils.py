@@ -0,0 +1,46 @@
+import sys
+import os
+import pytest
+from yadupe import filterutils
+
+KEYS_COUNT = 1000
+
+
+def test_bloom_contains():
+    bloom = filterutils.BloomFilter.create(KEYS_COUNT, 1e-3)
+    for i in range(KEYS_COUNT):
+        bloom.add(f'key{i}'.encode())
+    for i in range(KEYS_COUNT):
+        assert f'key{i}'.encode() in bloom
+    false_positives = sum(1 for i in range(KEYS_COUNT) if f'other{i}'.encode() in bloom)
+    assert false_positives < 10
+
+
+def test_seenfilter_levels():
+    seen_filter = filterutils.SeenFilter.create(KEYS_COUNT)
+    seen_filter.add(325, 'partial', 'full')
+    assert seen_filter.may_contain(325, 'partial')
+    assert seen_filter.contains(325, 'full')
+    assert not seen_filter.may_contain(326, 'partial')
+    assert not seen_filter.contains(325, 'other')
+
+
+def test_seenfilter_save_load(tmp_path):
+    seen_filter = filterutils.SeenFilter.create(KEYS_COUNT)
+    for i in range(KEYS_COUNT):
+        seen_filter.add(i, f'partial{i}', f'full{i}')
+    path = str(tmp_path / 'filter.bin')
+    seen_filter.save(path)
+
+    loaded = filterutils.SeenFilter.load(path)
+    assert loaded.partial.bits == seen_filter.partial.bits
+    assert loaded.full.hashes_count == seen_filter.full.hashes_count
+    for i in range(KEYS_COUNT):
+        assert loaded.contains(i, f'full{i}')
+
+
+def test_seenfilter_invalid(tmp_path):
+    path = tmp_path / 'filter.bin'
+    path.write_bytes(b'garbage')
+    with pytest.raises(ValueError):
+        filterutils.SeenFilter.load(str(path))
@@ -0,0 +1,75 @@
+import os
+import time
+import errno
+import pytest
+from yadupe import fsbackend
+from yadupe.hashutils import hash_file
+
+
+@pytest.fixture
+def memory():
+    backend = fsbackend.MemoryBackend()
+    backend.add_file('/src/1.txt', b'one', mtime_ns=10 ** 9)
+    backend.add_file('/src/a/1.txt', b'one')
+    backend.add_file('/src/a/b/2.txt', b'two')
+    return backend
+
+
+def test_memory_walk(memory):
+    walked = [(dirpath, dirnames, filenames) for dirpath, dirnames, filenames
+              in memory.walk('/src')]
+    assert walked == [('/src', ['a'], ['1.txt']), ('/src/a', ['b'], ['1.txt']),
+                      ('/src/a/b', [], ['2.txt'])]
+    # pruned directories are not walked
+    pruned = []
+    for dirpath, dirnames, _ in memory.walk('/src'):
+        pruned.append(dirpath)
+        dirnames[:] = []
+    assert pruned == ['/src']
+
+
+def test_memory_stat_open(memory, tmp_path):
+    file_stat = memory.stat('/src/1.txt')
+    assert file_stat.st_size == 3 and file_stat.st_mtime_ns == 10 ** 9
+    assert file_stat.st_dev == memory.device
+    (tmp_path / '1.txt').write_bytes(b'one')
+    assert hash_file('/src/1.txt', opener=memory.open) == hash_file(str(tmp_path / '1.txt'))
+
+    with memory.open('/src/report.txt', 'wt') as fileout:
+        fileout.write('report')
+    assert memory.open('/src/report.txt', 'rt').read() == 'report'
+    with pytest.raises(FileNotFoundError):
+        memory.stat('/src/3.txt')
+
+
+def test_memory_replace_rmdir(memory):
+    memory.makedirs('/dest/x')
+    memory.replace('/src/a/1.txt', '/dest/x/1.txt')
+    memory.replace('/src/a/b', '/dest/b')
+    assert memory.listdir('/src/a') == []
+    assert sorted(name for _, _, filenames in memory.walk('/dest') for name in filenames) \
+        == ['1.txt', '2.txt']
+    with pytest.raises(OSError) as exinfo:
+        memory.rmdir('/src')
+    assert exinfo.value.errno == errno.ENOTEMPTY
+    memory.rmdir('/src/a')
+    with pytest.raises(OSError) as exinfo:
+        memory.mkdir('/none/a')
+    assert exinfo.value.errno == errno.ENOENT
+
+
+def test_latency(memory):
+    backend = fsbackend.LatencyBackend(memory, latency=0.01, bandwidth=1000)
+    started = time.monotonic()
+    assert backend.stat('/src/1.txt').st_size == 3
+    list(backend.walk('/src'))
+    with backend.open('/src/a/b/2.txt') as filein:
+        assert filein.read() == b'two'
+    assert time.monotonic() - started >= 0.05
+    assert backend.calls['listdir'] == 3 and backend.calls['read'] == 1
+
+
+def test_is_local(memory):
+    assert fsbackend.is_local(None) and fsbackend.is_local(fsbackend.LOCAL)
+    assert not fsbackend.is_local(memory)
+    assert not fsbackend.is_local(fsbackend.LatencyBackend())
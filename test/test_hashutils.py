@@ -1,6 +1,7 @@
 import sys
 import os
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from yadupe import hashutils
 
 NO_FILE = 'aaaaaaaa'
@@ -52,3 +53,148 @@ def test_hashing_invalid():
 def test_hashing_value():
     h = hashutils.hash_file(os.path.abspath(SMALL_FILE))
     assert h == SMALL_FILE_HASH
+
+
+def test_partial_hashing_value():
+    h = hashutils.partial_hash_file(os.path.abspath(SMALL_FILE))
+    assert h == SMALL_FILE_HASH
+    h = hashutils.partial_hash_file(os.path.abspath(SIMPLE_HASH_FILE), 1024)
+    assert h != hashutils.hash_file(os.path.abspath(SIMPLE_HASH_FILE))
+
+
+def test_hash_cache(tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    calls = []
+
+    def hash_function(filepath):
+        calls.append(filepath)
+        return hashutils.hash_file(filepath)
+
+    cache = hashutils.HashCache(cache_path)
+    hasher = cache.hasher(hash_function)
+    assert hasher(os.path.abspath(SMALL_FILE)) == SMALL_FILE_HASH
+    assert hasher(os.path.abspath(SMALL_FILE)) == SMALL_FILE_HASH
+    assert len(calls) == 1
+    cache.save()
+
+    cache = hashutils.HashCache(cache_path)
+    assert cache.hasher(hash_function)(os.path.abspath(SMALL_FILE)) == SMALL_FILE_HASH
+    assert len(calls) == 1
+
+
+def test_hash_cache_invalidation(tmp_path):
+    filepath = tmp_path / 'data.txt'
+    filepath.write_bytes(b'first')
+    cache = hashutils.HashCache()
+    hasher = cache.hasher()
+    first = hasher(str(filepath))
+    filepath.write_bytes(b'second content')
+    assert hasher(str(filepath)) != first
+
+
+def test_sparse_hashing(tmp_path):
+    block = hashutils.SPARSE_BLOCK_SIZE
+    sparse = tmp_path / 'sparse.img'
+    dense = tmp_path / 'dense.img'
+    other = tmp_path / 'other.img'
+    with open(str(sparse), 'wb') as fileout:
+        fileout.seek(10 * block + 100)
+        fileout.write(b'data')
+        fileout.truncate(40 * block + 7)
+    dense.write_bytes(bytes(10 * block + 100) + b'data' + bytes(30 * block - 104 + 7))
+    other.write_bytes(bytes(10 * block + 100) + b'date' + bytes(30 * block - 104 + 7))
+
+    assert os.path.getsize(str(sparse)) == os.path.getsize(str(dense))
+    assert hashutils.hash_sparse_file(str(sparse)) == hashutils.hash_sparse_file(str(dense))
+    assert hashutils.hash_sparse_file(str(sparse)) != hashutils.hash_sparse_file(str(other))
+    # zero runs of different length differ
+    assert hashutils.hash_sparse_file(str(sparse)) != \
+        hashutils.hash_sparse_file(os.path.abspath(SMALL_FILE))
+
+
+def test_sparse_hashing_without_holes(tmp_path):
+    empty = tmp_path / 'empty.img'
+    empty.write_bytes(b'')
+    holes_only = tmp_path / 'holes.img'
+    with open(str(holes_only), 'wb') as fileout:
+        fileout.truncate(3 * hashutils.SPARSE_BLOCK_SIZE)
+    assert hashutils.hash_sparse_file(str(empty)) != hashutils.hash_sparse_file(str(holes_only))
+    zeros = tmp_path / 'zeros.img'
+    zeros.write_bytes(bytes(3 * hashutils.SPARSE_BLOCK_SIZE))
+    assert hashutils.hash_sparse_file(str(zeros)) == hashutils.hash_sparse_file(str(holes_only))
+
+
+def test_hash_cache_namespace(tmp_path):
+    cache = hashutils.HashCache()
+    filepath = os.path.abspath(SMALL_FILE)
+    assert cache.hasher()(filepath) == SMALL_FILE_HASH
+    sparse_hasher = cache.hasher(hashutils.hash_sparse_file, namespace='sparse:')
+    assert sparse_hasher(filepath) == hashutils.hash_sparse_file(filepath)
+
+
+def test_incremental_hashing(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashutils, 'MANIFEST_BLOCK_SIZE', 1024)
+    known_blocks = []
+    block_manifest = hashutils.block_manifest
+
+    def counting_manifest(filepath, known=None, opener=open):
+        known_blocks.append(len(known or []))
+        return block_manifest(filepath, known, opener)
+
+    monkeypatch.setattr(hashutils, 'block_manifest', counting_manifest)
+    cache_path = str(tmp_path / 'cache.json')
+    log = tmp_path / 'app.log'
+    log.write_bytes(os.urandom(3500))
+    cache = hashutils.HashCache(cache_path)
+    assert cache.incremental_hasher()(str(log)) == hashutils.hash_blocks_file(str(log))
+    cache.save()
+
+    with open(str(log), 'ab') as fileout:
+        fileout.write(os.urandom(2000))
+    cache = hashutils.HashCache(cache_path)
+    assert cache.incremental_hasher()(str(log)) == hashutils.hash_blocks_file(str(log))
+    # three full blocks were known, only the tail was read
+    assert known_blocks[-2] == 3
+
+    # rewritten first block fails spot check, file is hashed in full
+    with open(str(log), 'r+b') as fileout:
+        fileout.write(b'rewritten')
+    with open(str(log), 'ab') as fileout:
+        fileout.write(b'tail')
+    assert cache.incremental_hasher()(str(log)) == hashutils.hash_blocks_file(str(log))
+    assert known_blocks[-2] == 0
+
+
+def test_hash_small_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashutils, 'SMALL_FILES_BATCH', 3)
+    pathes = []
+    for idx in range(10):
+        filepath = tmp_path / f'{idx}.bin'
+        filepath.write_bytes(os.urandom(idx * 1000))
+        pathes.append(str(filepath))
+    # file grown over small file limit is still hashed whole
+    big = tmp_path / 'big.bin'
+    big.write_bytes(os.urandom(3 * hashutils.SMALL_FILE_SIZE + 5))
+    pathes.append(str(big))
+    missing = str(tmp_path / 'missing.bin')
+
+    digests = hashutils.hash_small_files(pathes + [missing])
+    assert digests == {path: hashutils.hash_file(path) for path in pathes}
+    assert digests[pathes[0]] == hashutils.EMPTY_DIGEST
+
+
+def test_hash_cache_concurrent_save(tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    cache = hashutils.HashCache(cache_path)
+    file_stat = os.stat(SMALL_FILE)
+
+    def update(worker):
+        for idx in range(200):
+            cache.put(f'{worker}/{idx}', file_stat, 'digest')
+            if idx % 20 == 0:
+                cache.save()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(update, range(4)))
+    cache.save()
+    assert len(hashutils.HashCache(cache_path)._entries_) == 800
@@ -0,0 +1,67 @@
+import sys
+import os
+import random
+import pytest
+from yadupe import imageutils
+
+HASHES_COUNT = 300
+
+
+@pytest.fixture
+def hashes():
+    rnd = random.Random(7)
+    values = [rnd.getrandbits(64) for _ in range(HASHES_COUNT)]
+    # add near copies with few flipped bits
+    for value in values[:50]:
+        for bit in rnd.sample(range(64), rnd.randint(0, 6)):
+            value ^= 1 << bit
+        values.append(value)
+    return values
+
+
+def test_similar_pairs(hashes):
+    for distance in [0, 3, 6]:
+        expected = {(i, j) for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+                    if imageutils.hamming(hashes[i], hashes[j]) <= distance}
+        pairs = list(imageutils.similar_pairs(hashes, distance))
+        assert len(pairs) == len(set(pairs))
+        assert set(pairs) == expected
+
+
+def test_similar_groups():
+    hashes = {'a': 0b0000, 'b': 0b0001, 'c': 0b0011, 'd': 0xFFFF}
+    # a and c are too far apart to be grouped through b
+    assert imageutils.similar_groups(hashes, 1) == [['a', 'b']]
+    assert imageutils.similar_groups(hashes, 2) == [['a', 'b', 'c']]
+    assert imageutils.similar_groups(hashes, 0) == []
+    hashes = {'a': 0b0000, 'b': 0b0001, 'c': 0b0011, 'd': 0b0111, 'e': 0b1111}
+    assert imageutils.similar_groups(hashes, 1) == [['a', 'b'], ['c', 'd']]
+
+
+def save_image(path, size, quality=None):
+    Image = pytest.importorskip('PIL.Image')
+    numpy = pytest.importorskip('numpy')
+    x, y = numpy.meshgrid(numpy.linspace(0, 1, 256), numpy.linspace(0, 1, 256))
+    pixels = (127 + 120 * numpy.sin(6 * x + 3 * y ** 2) * numpy.cos(4 * y)).astype(numpy.uint8)
+    image = Image.fromarray(pixels).convert('RGB').resize((size, size))
+    if quality:
+        image.save(str(path), quality=quality)
+    else:
+        image.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize('method', ['ahash', 'dhash', 'phash'])
+def test_hash_images(tmp_path, method):
+    original = save_image(tmp_path / 'original.png', 256)
+    resized = save_image(tmp_path / 'resized.jpg', 120, quality=60)
+    other = str(tmp_path / 'other.png')
+    pytest.importorskip('PIL.Image').new('RGB', (64, 64), (10, 200, 30)).save(other)
+    broken = str(tmp_path / 'broken.jpg')
+    with open(broken, 'wb') as fileout:
+        fileout.write(b'not an image')
+
+    hashes = imageutils.hash_images([original, resized, other, broken], method)
+    assert broken not in hashes
+    assert imageutils.hamming(hashes[original], hashes[resized]) <= imageutils.DEFAULT_DISTANCE
+    assert imageutils.similar_groups(hashes) == [[original, resized]]
@@ -0,0 +1,84 @@
+import os
+import threading
+import pytest
+from yadupe import ioscheduler
+from yadupe.hashutils import hash_file
+
+
+def make_sys_block(root, device, rotational, partition=False):
+    major, minor = os.major(device), os.minor(device)
+    disk = root / 'devices' / 'sda'
+    (disk / 'queue').mkdir(parents=True)
+    (disk / 'queue' / 'rotational').write_text('1\n' if rotational else '0\n')
+    target = disk
+    if partition:
+        target = disk / 'sda1'
+        target.mkdir()
+    (root / 'block').mkdir()
+    (root / 'block' / f'{major}:{minor}').symlink_to(target)
+    return str(root / 'block')
+
+
+def test_is_rotational(tmp_path, monkeypatch):
+    device = os.makedev(8, 1)
+    monkeypatch.setattr(ioscheduler, '_SYS_DEV_BLOCK',
+                        make_sys_block(tmp_path, device, True, partition=True))
+    assert ioscheduler.is_rotational(device) is True
+    assert ioscheduler.device_workers(device) == ioscheduler.ROTATIONAL_WORKERS
+    assert ioscheduler.is_rotational(os.makedev(8, 2)) is None
+    assert ioscheduler.device_workers(os.makedev(8, 2)) == ioscheduler.DEFAULT_WORKERS
+
+
+def test_map_by_device(tmp_path):
+    pathes = []
+    for idx in range(20):
+        filepath = tmp_path / f'{idx}.bin'
+        filepath.write_bytes(bytes([idx]) * 1000)
+        pathes.append(str(filepath))
+    missing = str(tmp_path / 'archive.zip!/member')
+    main_thread = []
+
+    def function(filepath):
+        if threading.current_thread() is threading.main_thread():
+            main_thread.append(filepath)
+        return 'member' if filepath == missing else hash_file(filepath)
+
+    device = os.stat(str(tmp_path)).st_dev
+    results = ioscheduler.map_by_device(function, pathes + [missing], workers={device: 3})
+    assert results == dict({path: hash_file(path) for path in pathes}, **{missing: 'member'})
+    # unknown device pathes are processed in the calling thread
+    assert main_thread == [missing]
+
+
+def test_map_by_device_error(tmp_path):
+    filepath = tmp_path / '1.bin'
+    filepath.write_bytes(b'data')
+
+    def function(filepath):
+        raise PermissionError(filepath)
+
+    with pytest.raises(PermissionError):
+        ioscheduler.map_by_device(function, [str(filepath)])
+
+
+def test_physical_order(tmp_path, monkeypatch):
+    pathes = []
+    for idx in range(5):
+        filepath = tmp_path / f'{idx}.bin'
+        filepath.write_bytes(bytes([idx]) * 5000)
+        pathes.append(str(filepath))
+    missing = str(tmp_path / 'archive.zip!/member')
+    offsets = {pathes[0]: 300, pathes[1]: None, pathes[2]: 100, pathes[3]: None, pathes[4]: 200}
+    monkeypatch.setattr(ioscheduler, 'physical_offset', offsets.get)
+
+    unknown = sorted(pathes[1:4:2], key=lambda path: os.stat(path).st_ino)
+    expected = [pathes[2], pathes[4], pathes[0]] + unknown + [missing]
+    assert ioscheduler.physical_order([missing] + pathes) == expected
+    assert list(ioscheduler.map_in_order(len, pathes + [missing]).keys()) == expected
+
+
+def test_physical_offset(tmp_path):
+    filepath = tmp_path / 'data.bin'
+    filepath.write_bytes(os.urandom(8192))
+    offset = ioscheduler.physical_offset(str(filepath))
+    assert offset is None or offset >= 0
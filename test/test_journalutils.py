@@ -0,0 +1,90 @@
+import os
+import errno
+import pytest
+from yadupe import journalutils
+
+
+@pytest.fixture
+def interrupted(tmp_path, make_tree):
+    """ Journal of run with two planned moves, crashed after the first one. """
+
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    make_tree(source, {'1.txt': b'one', 'a/1.txt': b'one', 'b/1.txt': b'one'})
+    os.makedirs(str(dest / '1.txt' / 'a'))
+    os.replace(str(source / 'a' / '1.txt'), str(dest / '1.txt' / 'a' / '1.txt'))
+
+    journal = journalutils.Journal(journalutils.journal_path(str(dest)))
+    journal.start([str(source)], str(dest))
+    journal.group('file', '1.txt', 3, [str(source / '1.txt')], digest='abc')
+    for name in ('a', 'b'):
+        journal.move(str(source / name / '1.txt'), str(dest / '1.txt' / name / '1.txt'))
+    journal.sync()
+    journal.done(str(source / 'a' / '1.txt'))
+    journal.close()
+    with open(journalutils.journal_path(str(dest)), 'at') as fileout:
+        fileout.write('{"op": "do')
+    return source, dest
+
+
+def test_load_journal(interrupted):
+    source, dest = interrupted
+    state = journalutils.load_journal(journalutils.journal_path(str(dest)))
+    assert state.sources == [str(source)]
+    assert len(state.groups) == 1 and state.groups[0].digest == 'abc'
+    assert len(list(state.moves())) == 2
+    assert state.done == {str(source / 'a' / '1.txt')}
+    assert not state.finished
+
+
+def test_resume(interrupted):
+    source, dest = interrupted
+    state, moved_from = journalutils.resume(str(dest))
+    assert state.ended
+    assert sorted(os.listdir(str(dest / '1.txt'))) == ['a', 'b']
+    assert not os.path.exists(str(source / 'b' / '1.txt'))
+    assert moved_from == {str(source / 'a'), str(source / 'b')}
+    with open(str(dest / 'report.txt'), 'rt') as filein:
+        report = filein.read()
+    assert 'Filename: 1.txt' in report
+    assert f'{source / "b" / "1.txt"} -> {dest / "1.txt" / "b" / "1.txt"}' in report
+    assert journalutils.load_journal(journalutils.journal_path(str(dest))).finished
+
+
+def test_undo(interrupted):
+    source, dest = interrupted
+    journalutils.resume(str(dest))
+    state = journalutils.undo(str(dest))
+    assert state.rolled_back
+    for name in ('1.txt', 'a/1.txt', 'b/1.txt'):
+        assert os.path.isfile(str(source / name))
+    assert sorted(os.listdir(str(dest))) == ['journal.jsonl', 'report.txt']
+    with pytest.raises(ValueError):
+        journalutils.resume(str(dest))
+
+
+def test_resume_interrupted_copy(interrupted, make_tree):
+    source, dest = interrupted
+    # move between devices crashed after copy, before source removal
+    make_tree(dest, {'1.txt/b/1.txt': b'one'})
+    state, _ = journalutils.resume(str(dest))
+    assert state.finished
+    assert not os.path.exists(str(source / 'b' / '1.txt'))
+    assert (dest / '1.txt' / 'b' / '1.txt').read_bytes() == b'one'
+
+
+def test_undo_across_devices(interrupted, monkeypatch):
+    source, dest = interrupted
+    replace = os.replace
+
+    def cross_device(src, dst):
+        if (str(dest) in src) != (str(dest) in dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', cross_device)
+
+    journalutils.resume(str(dest))
+    journalutils.undo(str(dest))
+    for name in ('1.txt', 'a/1.txt', 'b/1.txt'):
+        assert (source / name).read_bytes() == b'one'
+    assert sorted(os.listdir(str(dest))) == ['journal.jsonl', 'report.txt']
@@ -0,0 +1,53 @@
+import os
+import pytest
+from yadupe import keeputils
+
+
+@pytest.fixture
+def copies(tmp_path):
+    pathes = []
+    for idx, name in enumerate(['a/1.txt', 'b/1.txt', 'c/1.txt']):
+        filepath = tmp_path / name
+        filepath.parent.mkdir()
+        filepath.write_bytes(b'one')
+        os.utime(str(filepath), ns=(10 ** 9, (3 - idx) * 10 ** 9))
+        pathes.append(str(filepath))
+    return pathes
+
+
+def test_oldest(copies):
+    assert keeputils.make_keeper('oldest')(copies) == copies[2]
+
+
+def test_links(copies):
+    os.link(copies[1], copies[1] + '.link')
+    assert keeputils.make_keeper('links')(copies) == copies[1]
+
+
+def test_root(copies, tmp_path):
+    keeper = keeputils.make_keeper('root', roots=[str(tmp_path / 'x'), str(tmp_path / 'b')])
+    assert keeper(copies) == copies[1]
+    assert keeper([copies[0], copies[2]]) == copies[0]
+
+
+def test_device(copies, tmp_path):
+    # all copies on destination device: scan order is kept
+    assert keeputils.make_keeper('device', str(tmp_path))(copies) == copies[0]
+
+    dest_device = os.stat(str(tmp_path)).st_dev
+
+    def fake_stat(filepath):
+        result = os.stat(filepath)
+        if filepath == copies[2]:
+            values = list(result)
+            values[2] = dest_device + 1
+            return os.stat_result(values)
+        return result
+    assert keeputils.make_keeper('device', str(tmp_path), stat=fake_stat)(copies) == copies[2]
+
+
+def test_missing(copies):
+    os.remove(copies[2])
+    assert keeputils.make_keeper('oldest')(copies) == copies[1]
+    with pytest.raises(ValueError):
+        keeputils.make_keeper('newest')
@@ -0,0 +1,101 @@
+import json
+import threading
+import pytest
+from yadupe import lookup, core
+
+
+@pytest.fixture
+def service(tmp_path, make_tree):
+    make_tree(tmp_path, {'archive/a.txt': b'one', 'archive/b/c.txt': b'three',
+                         'archive/empty': b'', 'upload/1.txt': b'one', 'upload/2.txt': b'twofold',
+                         'upload/3.txt': b'other'})
+    hashed = []
+
+    def hasher(filepath):
+        hashed.append(filepath)
+        return core.hash_file(filepath)
+
+    server = lookup.LookupServer(lookup.build_index([str(tmp_path / 'archive')], hasher),
+                                 str(tmp_path / 'lookup.sock'))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = lookup.LookupClient(str(tmp_path / 'lookup.sock'))
+    yield client, hashed
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_lookup_path(service, tmp_path):
+    client, hashed = service
+    assert client.lookup(str(tmp_path / 'upload' / '1.txt')) == str(tmp_path / 'archive' / 'a.txt')
+    # no archive file of the same size: nothing is hashed
+    hashed.clear()
+    assert client.lookup(str(tmp_path / 'upload' / '2.txt')) is None
+    assert hashed == []
+    assert client.lookup(str(tmp_path / 'upload' / '3.txt')) is None
+
+
+def test_lookup_digest(service, tmp_path):
+    client, _ = service
+    digest = core.hash_file(str(tmp_path / 'upload' / '1.txt'))
+    assert client.lookup(size=3, digest=digest) == str(tmp_path / 'archive' / 'a.txt')
+    assert client.lookup(size=3, digest='0' * len(digest)) is None
+    assert client.lookup(size=4, digest=digest) is None
+
+
+def test_add(service, tmp_path, make_tree):
+    client, _ = service
+    client.add(str(tmp_path / 'upload' / '2.txt'))
+    make_tree(tmp_path, {'upload/4.txt': b'twofold'})
+    assert client.lookup(str(tmp_path / 'upload' / '4.txt')) == str(tmp_path / 'upload' / '2.txt')
+    with pytest.raises(ValueError):
+        client.add(str(tmp_path / 'upload' / 'none.txt'))
+
+
+def test_lookup_indexed_file(service, tmp_path, make_tree):
+    client, _ = service
+    archive = tmp_path / 'archive'
+    assert client.lookup(str(archive / 'b' / 'c.txt')) is None
+    make_tree(tmp_path, {'archive/d.txt': b'one'})
+    client.add(str(archive / 'd.txt'))
+    # the query file itself is skipped, another copy is returned
+    assert client.lookup(str(archive / 'd.txt')) == str(archive / 'a.txt')
+    assert client.lookup(str(archive / 'a.txt')) == str(archive / 'd.txt')
+
+
+def test_malformed_request(service, tmp_path):
+    client, _ = service
+    client._stream_.write('{"op": \n')
+    client._stream_.flush()
+    assert 'error' in json.loads(client._stream_.readline())
+    client._stream_.write('[1]\n')
+    client._stream_.flush()
+    assert 'error' in json.loads(client._stream_.readline())
+    # connection is still served
+    assert client.lookup(str(tmp_path / 'upload' / '1.txt')) == str(tmp_path / 'archive' / 'a.txt')
+
+
+def test_lookup_not_blocked_by_hashing(tmp_path, make_tree):
+    make_tree(tmp_path, {'archive/a.txt': b'one', 'archive/b.txt': b'large'})
+    started = threading.Event()
+    release = threading.Event()
+
+    def hasher(filepath):
+        if filepath.endswith('b.txt'):
+            started.set()
+            release.wait(5)
+        return core.hash_file(filepath)
+
+    server = lookup.LookupServer(lookup.build_index([str(tmp_path / 'archive')], hasher),
+                                 str(tmp_path / 'lookup.sock'))
+    slow = threading.Thread(target=server.lookup, args=(5, 'digest'))
+    slow.start()
+    try:
+        assert started.wait(5)
+        # group of other size is served while size 5 is being hashed
+        assert server.lookup(3, core.hash_file(str(tmp_path / 'archive' / 'a.txt'))) == \
+            str(tmp_path / 'archive' / 'a.txt')
+    finally:
+        release.set()
+        slow.join()
+        server.server_close()
@@ -0,0 +1,93 @@
+import os
+import time
+import pytest
+import zipfile
+from yadupe import throttle, core, hashutils, archiveutils
+from yadupe.hashutils import hash_file
+
+
+def test_token_bucket():
+    bucket = throttle.TokenBucket(1000)
+    started = time.monotonic()
+    bucket.consume(1000)    # initial burst
+    bucket.consume(200)     # on credit: waits 0.2 s
+    assert 0.15 <= time.monotonic() - started < 1
+
+
+def test_hash_file(tmp_path):
+    filepath = tmp_path / 'data.bin'
+    filepath.write_bytes(os.urandom(3 * throttle.READ_SIZE + 5))
+    limiter = throttle.Throttle(read_rate=100 * 1024 * 1024, iops=1000)
+    assert limiter.hash_file(str(filepath)) == hash_file(str(filepath))
+
+
+def test_adapt(monkeypatch):
+    monkeypatch.setattr(throttle, 'ADAPT_INTERVAL', 0)
+    limiter = throttle.Throttle(read_rate=1000, iops=100)
+    limiter.observe(0.001)
+    for _ in range(5):
+        limiter.observe(0.1)
+    assert limiter.factor < 1.0
+    slowed = limiter.factor
+    for _ in range(100):
+        limiter.observe(0.001)
+    assert limiter.factor > slowed
+
+
+def test_throttled_scan(tmp_path):
+    for name in ('a', 'b', 'c'):
+        os.makedirs(str(tmp_path / 'source' / name))
+        (tmp_path / 'source' / name / '1.txt').write_bytes(b'x' * 1000)
+    settings = core.Settings(False, False, None, [str(tmp_path / 'source')], False, False,
+                             max_iops=20)
+    limiter = core._make_throttle(settings)
+    started = time.monotonic()
+    files_dict = core._scan_sources(settings, throttle=limiter)
+    assert len([group for sk in files_dict.keys() for group in files_dict[sk].duplicates()]) == 1
+    # 4 listed directories, 3 stats and 3 reads, first 20 operations are burst
+    assert time.monotonic() - started < 1
+    limiter.io(20)
+    started = time.monotonic()
+    limiter.io(2)
+    assert time.monotonic() - started >= 0.05
+
+
+class CountingThrottle(throttle.Throttle):
+    def __init__(self):
+        super().__init__()
+        self.nbytes = 0
+
+    def io(self, ops=1, nbytes=0):
+        self.nbytes += nbytes
+
+
+def test_incremental_paced_on_read_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashutils, 'MANIFEST_BLOCK_SIZE', 1024)
+    log = tmp_path / 'app.log'
+    log.write_bytes(os.urandom(20 * 1024))
+    cache = hashutils.HashCache()
+    limiter = CountingThrottle()
+    hasher = cache.incremental_hasher(limiter.open)
+    hasher(str(log))
+    assert limiter.nbytes == 20 * 1024
+
+    with open(str(log), 'ab') as fileout:
+        fileout.write(os.urandom(2000))
+    limiter.nbytes = 0
+    assert hasher(str(log)) == hashutils.hash_blocks_file(str(log))
+    # spot checked blocks and the appended tail, not the whole file
+    assert 2000 <= limiter.nbytes <= 6 * 1024 + 2000
+
+
+def test_archive_members_paced(tmp_path):
+    archive = str(tmp_path / 'dump.zip')
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('a/1.txt', b'one' * 1000)
+    limiter = CountingThrottle()
+    hasher = archiveutils.ArchiveHasher(opener=limiter.open)
+    plain = archiveutils.ArchiveHasher()
+    for member in archiveutils.iter_members(archive):
+        hasher.add(member)
+        plain.add(member)
+        assert hasher(member.path) == plain(member.path)
+    assert limiter.nbytes >= 3000
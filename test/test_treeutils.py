@@ -0,0 +1,50 @@
+import sys
+import os
+import pytest
+from yadupe import treeutils
+from yadupe.indexutils import FileRecord
+
+
+ROOT = os.path.abspath('root')
+
+
+def record(path, size, digest):
+    return FileRecord(size, os.path.join(ROOT, path), digest)
+
+
+@pytest.fixture
+def records():
+    return [record('a/x/1.txt', 10, 'd1'),
+            record('a/x/y/2.txt', 20, 'd2'),
+            record('a/3.txt', 30, 'd3'),
+            record('b/x/1.txt', 10, 'd1'),
+            record('b/x/y/2.txt', 20, 'd2'),
+            record('b/4.txt', 40, None),
+            record('c/x/1.txt', 10, 'd1'),
+            record('c/x/y/2.txt', 20, 'd2'),
+            record('c/3.txt', 30, 'd3'),
+            record('d/y/2.txt', 20, 'd2'),
+            record('d/y/5.txt', 50, 'd5')]
+
+
+def test_directory_digests(records):
+    digests = treeutils.directory_digests(records, [ROOT])
+    path = lambda p: os.path.join(ROOT, p)
+    assert digests[path('a')] == digests[path('c')]
+    assert digests[path('a/x')] == digests[path('b/x')]
+    assert digests[path('b')] is None
+    assert digests[path('a/x/y')] != digests[path('d/y')]
+
+
+def test_duplicate_dirs(records):
+    groups = treeutils.duplicate_dirs(records, [ROOT])
+    paths = sorted(sorted(os.path.relpath(p, ROOT) for p in group.path) for group in groups)
+    # a/x and c/x are covered by a and c, b/x is left for file level search
+    assert paths == [['a', 'c']]
+    assert groups[0].files == 3
+    assert groups[0].size == 60
+
+
+def test_covered_files(records):
+    covered = treeutils.covered_files(records, [os.path.join(ROOT, 'c')])
+    assert covered == {os.path.join(ROOT, p) for p in ['c/x/1.txt', 'c/x/y/2.txt', 'c/3.txt']}
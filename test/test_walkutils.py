@@ -0,0 +1,61 @@
+import os
+import pytest
+from yadupe import walkutils
+
+
+@pytest.fixture
+def tree(tmp_path, make_tree):
+    make_tree(tmp_path, {'src/main.py': b'x' * 100, 'src/.git/objects/1': b'x' * 100,
+                         'src/node_modules/lib/index.js': b'x' * 10, 'docs/a.txt': b'x' * 1000,
+                         'docs/build/a.txt': b'x' * 5, 'notes.tmp': b''})
+    return tmp_path
+
+
+def walk(root, walk_filter=None):
+    return sorted(os.path.relpath(path, str(root))
+                  for path, _ in walkutils.walk_files(str(root), walk_filter))
+
+
+def test_walk_all(tree):
+    assert len(walk(tree)) == 6
+
+
+def test_exclude_prunes_directories(tree, monkeypatch):
+    listed = []
+    walk_function = os.walk
+
+    def tracking_walk(top, *args, **kwargs):
+        for dirpath, dirnames, filenames in walk_function(top, *args, **kwargs):
+            listed.append(os.path.relpath(dirpath, str(tree)))
+            yield dirpath, dirnames, filenames
+
+    monkeypatch.setattr(walkutils.os, 'walk', tracking_walk)
+    walk_filter = walkutils.WalkFilter(exclude=['.git', 'node_modules', 'docs/build', '*.tmp'])
+    assert walk(tree, walk_filter) == ['docs/a.txt', 'src/main.py']
+    assert not [path for path in listed if '.git' in path or 'node_modules' in path
+                or 'build' in path]
+
+
+def test_include_and_sizes(tree):
+    assert walk(tree, walkutils.WalkFilter(include=['*.txt'])) == ['docs/a.txt', 'docs/build/a.txt']
+    assert walk(tree, walkutils.WalkFilter(include=['docs/*.txt'], max_size=999)) == \
+        ['docs/build/a.txt']
+    assert walk(tree, walkutils.WalkFilter(min_size=100, max_size=100)) == \
+        ['src/.git/objects/1', 'src/main.py']
+
+
+def test_one_file_system(tree, monkeypatch):
+    lstat = os.lstat
+
+    class FakeStat(object):
+        def __init__(self, result, device):
+            self.st_dev = device
+            self.st_size = result.st_size
+
+    def fake_lstat(path):
+        result = lstat(path)
+        return FakeStat(result, -1) if os.path.basename(path) == 'docs' else result
+
+    monkeypatch.setattr(walkutils.os, 'lstat', fake_lstat)
+    assert walk(tree, walkutils.WalkFilter(one_file_system=True)) == \
+        ['notes.tmp', 'src/.git/objects/1', 'src/main.py', 'src/node_modules/lib/index.js']
@@ -1,11 +1,11 @@
 """
-Recursively scan one or more given directories for duplicate files. 
+Recursively scan one or more given directories for duplicate files.
 Found duplicates list could be saved into report or printed out in console.
 
-Also, duplicates could be moved into destination directory in safe way, 
-preserving it relative path. In this case file name is written in the report, 
+Also, duplicates could be moved into destination directory in safe way,
+preserving it relative path. In this case file name is written in the report,
 as well as new path for the file.
-If empty sub-directories turn up after duplicates removal, the could be 
+If empty sub-directories turn up after duplicates removal, the could be
 deleted as well.
 
 Modules:
@@ -13,6 +13,23 @@ Modules:
     core.py     - core functions: search for duplicates, move files,
                     log operations.
     argutils.py - command line argument parser, settings validation.
+    chunkutils.py - content-defined chunking, chunk-level shared bytes analysis.
+    filterutils.py - persistent probabilistic filter for "seen before" checks.
+    indexutils.py - (size, path, digest) file records.
+    agent.py    - remote index agent and coordinator for multi-host search.
+    treeutils.py - identical directories search with Merkle directory hashes.
+    imageutils.py - similar images search with perceptual hashes.
+    archiveutils.py - zip and tar members search without extraction.
+    ioscheduler.py - per-device parallel file processing.
+    walkutils.py - directory walk with include/exclude patterns and size bounds.
+    journalutils.py - crash-safe journal of duplicates moves, resume and undo.
+    lookup.py   - resident duplicate lookup service over Unix socket.
+    copyutils.py - zero-copy file export with reflink, copy_file_range, sendfile.
+    throttle.py - shared read rate and I/O operations limiter, process priority.
+    checksums.py - trusted digests from xattrs, sidecar files and BagIt manifests.
+    bucketutils.py - vectorized size collision search over scanned files.
+    keeputils.py - policies choosing which copy of duplicates is kept.
+    fsbackend.py - local, in-memory and latency-simulating file system backends.
 
 To use package without CLI, use:
 from yadupe import core
@@ -24,4 +41,8 @@ from yadupe import argutils, core
 
 __version__ = "1.1.0"
 
-__all__ = ['core', 'argutils']
+__all__ = ['core', 'argutils', 'chunkutils', 'filterutils', 'indexutils', 'agent',
+           'treeutils', 'imageutils', 'archiveutils',
+           'ioscheduler', 'walkutils', 'journalutils',
+           'lookup', 'copyutils', 'throttle', 'checksums',
+           'bucketutils', 'keeputils', 'fsbackend']
@@ -0,0 +1,284 @@
+"""
+Remote index agent for multi-host deduplication.
+
+Agent runs next to the data, scans and hashes its own paths locally and sends
+only file records to the coordinator, so file content never crosses the
+network. Protocol is newline-delimited JSON over TCP:
+
+    agent:       {"challenge": ...}
+    coordinator: {"auth": ...}, HMAC-SHA256 of challenge keyed by shared token
+    agent:       {"end": true} or {"error": ...} and connection is closed
+    coordinator: {"op": "scan"}
+    agent:       {"size": ..., "path": ...} for each file, then {"end": true}
+    coordinator: {"op": "hash", "sizes": [...]}
+    agent:       {"size": ..., "path": ..., "digest": ...} for each file of
+                 given sizes, then {"end": true}
+    coordinator: {"op": "close"}
+
+Coordinator asks to hash only sizes colliding among all agents and local
+sources. Remote files are reported as "HOST:PORT:path".
+
+Shared token is taken from YADUPE_AGENT_TOKEN environment variable on both
+sides. Agent without token listens on loopback address only, reach it through
+SSH tunnel. Traffic itself is not encrypted.
+
+"""
+
+import os
+import hmac
+import json
+import socket
+import typing
+import hashlib
+import secrets
+import argparse
+import ipaddress
+import socketserver
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .hashutils import HashCache, get_simple_key, hash_file
+from .indexutils import FileRecord, dump_record, add_records
+
+
+DEFAULT_ADDRESS = '127.0.0.1:7477'
+TOKEN_VARIABLE = 'YADUPE_AGENT_TOKEN'
+HANDSHAKE_TIMEOUT = 30
+
+
+def parse_address(address: str) -> typing.Tuple[str, int]:
+    """ Split "HOST:PORT" string. """
+
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'{address}: must be valid HOST:PORT address.')
+    return host, int(port)
+
+
+def is_loopback(address: str) -> bool:
+    host, _ = parse_address(address)
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host.strip('[]')).is_loopback
+    except ValueError:
+        return False
+
+
+def sign(token: str, challenge: str) -> str:
+    return hmac.new(token.encode(), challenge.encode(), hashlib.sha256).hexdigest()
+
+
+class _AgentHandler(socketserver.BaseRequestHandler):
+    """ Serve one coordinator connection. """
+
+    def handle(self):
+        stream = self.request.makefile('rw', encoding='utf-8',
+                                       errors='surrogateescape', newline='\n')
+        files = {}
+        try:
+            if not self._authenticate_(stream):
+                return
+            for line in stream:
+                request = json.loads(line)
+                op = request.get('op')
+                if op == 'close':
+                    break
+                try:
+                    if op == 'scan':
+                        files = self._scan_(stream)
+                    elif op == 'hash':
+                        self._hash_(stream, files, request['sizes'])
+                    else:
+                        raise ValueError(f'Unknown operation: {op}')
+                except (OSError, ValueError, KeyError) as ex:
+                    stream.write(json.dumps({'error': str(ex)}) + '\n')
+                else:
+                    stream.write(json.dumps({'end': True}) + '\n')
+                stream.flush()
+        finally:
+            stream.close()
+
+    def _authenticate_(self, stream) -> bool:
+        """ Check coordinator knows the token, before any request is served. """
+
+        challenge = secrets.token_hex(16)
+        self.request.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            stream.write(json.dumps({'challenge': challenge}) + '\n')
+            stream.flush()
+            response = json.loads(stream.readline() or '{}')
+        except (OSError, ValueError):
+            return False
+        self.request.settimeout(None)
+        token = self.server.token
+        auth = response.get('auth') if isinstance(response, dict) else None
+        if token and not (isinstance(auth, str)
+                          and hmac.compare_digest(auth, sign(token, challenge))):
+            stream.write(json.dumps({'error': 'authentication failed.'}) + '\n')
+            stream.flush()
+            return False
+        stream.write(json.dumps({'end': True}) + '\n')
+        stream.flush()
+        return True
+
+    def _scan_(self, stream) -> typing.Dict[int, typing.List[str]]:
+        files = {}
+        for root in self.server.roots:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    absfilename = os.path.join(dirpath, filename)
+                    size = get_simple_key(absfilename).size
+                    files.setdefault(size, []).append(absfilename)
+                    dump_record(FileRecord(size, absfilename), stream)
+        return files
+
+    def _hash_(self, stream, files: typing.Dict[int, typing.List[str]],
+               sizes: typing.List[int]) -> None:
+        for size in sizes:
+            for filepath in files.get(size, []):
+                dump_record(FileRecord(size, filepath, self.server.hasher(filepath)), stream)
+        if self.server.hash_cache:
+            self.server.hash_cache.save()
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """ Agent serving scan and hash requests for given root paths.
+    Coordinators are served only if they know the token, if it is given. """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, roots: typing.List[str], address: str = DEFAULT_ADDRESS,
+                 hash_cache: str = None, token: str = None):
+        if not token and not is_loopback(address):
+            raise ValueError(f'{address}: agent without token must listen on loopback address.')
+        self.token = token
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.hash_cache = HashCache(hash_cache) if hash_cache else None
+        self.hasher = self.hash_cache.hasher() if self.hash_cache else hash_file
+        super().__init__(parse_address(address), _AgentHandler)
+
+
+class RemoteAgent(object):
+    """ Coordinator side connection to the agent. Token is taken from
+    environment, if it is not given. """
+
+    def __init__(self, address: str, token: str = None):
+        self.name = address
+        self._socket_ = socket.create_connection(parse_address(address))
+        self._stream_ = self._socket_.makefile('rw', encoding='utf-8',
+                                               errors='surrogateescape', newline='\n')
+        try:
+            self._authenticate_(token or os.environ.get(TOKEN_VARIABLE, ''))
+        except BaseException:
+            self._stream_.close()
+            self._socket_.close()
+            raise
+
+    def _authenticate_(self, token: str) -> None:
+        response = json.loads(self._stream_.readline() or '{}')
+        if 'challenge' not in response:
+            raise ConnectionError(f'{self.name}: no handshake, not yadupe-agent.')
+        self._stream_.write(json.dumps({'auth': sign(token, response['challenge'])}) + '\n')
+        self._stream_.flush()
+        response = json.loads(self._stream_.readline() or '{}')
+        if 'end' not in response:
+            raise ConnectionError(f'{self.name}: {response.get("error", "connection closed.")}')
+
+    def _request_(self, **request) -> typing.Iterator[FileRecord]:
+        self._stream_.write(json.dumps(request) + '\n')
+        self._stream_.flush()
+        for line in self._stream_:
+            response = json.loads(line)
+            if 'end' in response:
+                return
+            if 'error' in response:
+                raise ConnectionError(f'{self.name}: {response["error"]}')
+            yield FileRecord(response['size'], response['path'], response.get('digest'))
+        raise ConnectionError(f'{self.name}: connection closed.')
+
+    def scan(self) -> typing.List[FileRecord]:
+        return list(self._request_(op='scan'))
+
+    def hash(self, sizes: typing.List[int]) -> typing.List[FileRecord]:
+        return list(self._request_(op='hash', sizes=sizes))
+
+    def close(self):
+        try:
+            self._stream_.write(json.dumps({'op': 'close'}) + '\n')
+            self._stream_.flush()
+        finally:
+            self._stream_.close()
+            self._socket_.close()
+
+
+def collect(addresses: typing.List[str], files_dict: dict, pathscannedhook=None) -> None:
+    """ Scan remote agents and merge their files into FilepathDict.
+    Agents work concurrently, only files with sizes colliding across agents
+    and files already in files_dict are hashed. """
+
+    agents = [RemoteAgent(address) for address in addresses]
+    try:
+        with ThreadPoolExecutor(max_workers=len(agents) or 1) as executor:
+            scanned = []
+            for records in executor.map(RemoteAgent.scan, agents):
+                scanned.append(records)
+                if pathscannedhook:
+                    pathscannedhook()
+
+            sizes = Counter({key.size: len(files_dict[key]) for key in files_dict.keys()})
+            for records in scanned:
+                sizes.update(record.size for record in records)
+            colliding = [[size for size in {record.size for record in records} if sizes[size] > 1]
+                         for records in scanned]
+            hashed = list(executor.map(RemoteAgent.hash, agents, colliding))
+
+        for agent, records, hashed_records in zip(agents, scanned, hashed):
+            add_records(files_dict, hashed_records, prefix=f'{agent.name}:')
+            add_records(files_dict, (record for record in records if sizes[record.size] < 2),
+                        prefix=f'{agent.name}:')
+    finally:
+        for agent in agents:
+            agent.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        prog='yadupe-agent',
+        description='Scan and hash given paths locally, serve file records '
+                    'to yadupe coordinator (yadupe --agent HOST:PORT). Coordinator '
+                    f'must know the token from {TOKEN_VARIABLE} environment variable, '
+                    'if it is set.')
+    arg_parser.add_argument('source', nargs='+',
+                            help='Source path to serve.',
+                            metavar='PATH')
+    arg_parser.add_argument('-l', '--listen', default=DEFAULT_ADDRESS,
+                            help=f'Address to listen on, default {DEFAULT_ADDRESS}. Address other than '
+                                 f'loopback requires {TOKEN_VARIABLE} to be set.',
+                            metavar='HOST:PORT')
+    arg_parser.add_argument('--hash-cache',
+                            help='Persistent hash cache FILE.',
+                            metavar='FILE', dest='hash_cache')
+    args = arg_parser.parse_args()
+
+    for source in args.source:
+        if not os.path.isdir(source):
+            print(f'{source}: must be valid path to directory.')
+            exit()
+    try:
+        server = AgentServer(args.source, args.listen, args.hash_cache,
+                             os.environ.get(TOKEN_VARIABLE))
+    except (ValueError, OSError) as ex:
+        print(f'{ex}')
+        exit()
+    print(f'Serving {", ".join(server.roots)} on {args.listen}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Archive-aware scanning: zip and tar members are searched for duplicates
+without extraction.
+
+Members are listed with their recorded sizes and go through the same size
+then hash pipeline as regular files. Member is reported as
+"archive.zip!/inner/path". Members are hashed by streaming them out of the
+archive, one pass per archive for all members which could have duplicates.
+
+Zip records CRC-32 of each member, so in size group consisting of zip members
+only, member with unique CRC can't have duplicates and is never read.
+
+"""
+
+import os
+import zlib
+import typing
+import hashlib
+import tarfile
+import zipfile
+from collections import Counter
+from .hashutils import hash_file
+
+
+MEMBER_SEPARATOR = '!/'
+ZIP_EXTENSIONS = ('.zip', '.jar')
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+READ_SIZE = 64 * 1024
+# errors of broken, truncated or changed archive
+ARCHIVE_ERRORS = (OSError, EOFError, KeyError, zlib.error, zipfile.BadZipFile, tarfile.TarError)
+
+
+class ArchiveMember(typing.NamedTuple):
+    """ Regular file inside archive. CRC is known for zip members only. """
+    archive: str
+    name: str
+    size: int
+    crc: int = None
+
+    @property
+    def path(self) -> str:
+        return f'{self.archive}{MEMBER_SEPARATOR}{self.name}'
+
+
+def is_zip(filepath: str) -> bool:
+    return filepath.lower().endswith(ZIP_EXTENSIONS)
+
+
+def is_archive(filepath: str) -> bool:
+    return filepath.lower().endswith(ZIP_EXTENSIONS + TAR_EXTENSIONS)
+
+
+def iter_members(archive: str) -> typing.Iterator[ArchiveMember]:
+    """ Iterator, return each regular file member of the archive.
+    Broken or unreadable archive has no members. """
+
+    try:
+        if is_zip(archive):
+            with zipfile.ZipFile(archive) as zip_file:
+                members = [ArchiveMember(archive, info.filename, info.file_size, info.CRC)
+                           for info in zip_file.infolist() if not info.is_dir()]
+        else:
+            with tarfile.open(archive) as tar_file:
+                members = [ArchiveMember(archive, info.name, info.size)
+                           for info in tar_file if info.isreg()]
+    except ARCHIVE_ERRORS:
+        return
+    yield from members
+
+
+def _hash_stream(stream) -> str:
+    hash_obj = hashlib.blake2b()
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            break
+        hash_obj.update(data)
+    return hash_obj.hexdigest()
+
+
+def crc_prefilter(members: typing.List[ArchiveMember],
+                  sizes: typing.Dict[int, int]) -> typing.Dict[str, str]:
+    """ Return {member path: digest} for zip members which can't have duplicates:
+    there are no other files of the same size, except zip members, and member
+    CRC is unique among them. Digest is made of CRC, so it never equals to
+    content hash. Sizes are counts of other (non-member) files by size. """
+
+    by_size = {}
+    for member in members:
+        by_size.setdefault(member.size, []).append(member)
+    digests = {}
+    for size, group in by_size.items():
+        if sizes.get(size, 0) or any(member.crc is None for member in group):
+            continue
+        crcs = Counter(member.crc for member in group)
+        for member in group:
+            if crcs[member.crc] == 1:
+                digests[member.path] = f'crc32:{member.crc:08x}'
+    return digests
+
+
+class ArchiveHasher(object):
+    """ Hasher for regular files and archive members.
+    Member digests are calculated in one pass over the archive for all wanted
+    members of it, so compressed tar is decompressed once. Regular files are
+    hashed with given hasher, archives are read with opener, e.g. throttled one.
+    Members, which can't be read, get own digest made of their path, so they
+    never have duplicates and the rest of the run is not affected. """
+
+    def __init__(self, hasher: typing.Callable = hash_file, opener: typing.Callable = open):
+        self._hasher_ = hasher
+        self._opener_ = opener
+        self._members_: typing.Dict[str, ArchiveMember] = {}
+        self._wanted_: typing.Dict[str, typing.Set[str]] = {}
+        self._digests_: typing.Dict[str, str] = {}
+
+    def add(self, member: ArchiveMember, wanted: bool = True) -> None:
+        """ Register member. Wanted members are hashed together with other
+        members of the archive. """
+
+        self._members_[member.path] = member
+        if wanted:
+            self._wanted_.setdefault(member.archive, set()).add(member.name)
+
+    def _hash_archive_(self, archive: str, names: typing.Set[str]) -> None:
+        try:
+            self._read_archive_(archive, names)
+        except ARCHIVE_ERRORS:
+            for name in names:
+                path = f'{archive}{MEMBER_SEPARATOR}{name}'
+                self._digests_.setdefault(path, f'unreadable:{path}')
+
+    def _read_archive_(self, archive: str, names: typing.Set[str]) -> None:
+        with self._opener_(archive, 'rb') as archive_file:
+            if is_zip(archive):
+                with zipfile.ZipFile(archive_file) as zip_file:
+                    for name in names:
+                        with zip_file.open(name) as stream:
+                            self._digests_[f'{archive}{MEMBER_SEPARATOR}{name}'] = \
+                                _hash_stream(stream)
+            else:
+                with tarfile.open(fileobj=archive_file) as tar_file:
+                    for info in tar_file:
+                        if info.isreg() and info.name in names:
+                            stream = tar_file.extractfile(info)
+                            self._digests_[f'{archive}{MEMBER_SEPARATOR}{info.name}'] = \
+                                _hash_stream(stream)
+
+    def __call__(self, filepath: str) -> str:
+        member = self._members_.get(filepath)
+        if member is None:
+            return self._hasher_(filepath)
+        if filepath not in self._digests_:
+            names = self._wanted_.pop(member.archive, set())
+            names.add(member.name)
+            self._hash_archive_(member.archive, names)
+        # member may be missing from archive changed after listing
+        return self._digests_.pop(filepath, f'unreadable:{filepath}')
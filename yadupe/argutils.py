@@ -1,10 +1,19 @@
 import sys
 import os
+import stat
 import typing
 import argparse
 from configparser import ConfigParser
 import shlex
 from .core import Settings
+from .agent import parse_address
+from . import imageutils
+from . import journalutils
+from . import throttle
+from . import checksums
+from . import keeputils
+from . import fsbackend
+from .hashutils import DEFAULT_ALGORITHM
 
 
 def parse_arguments(parameter_list: str = '') -> Settings:
@@ -14,7 +23,7 @@ def parse_arguments(parameter_list: str = '') -> Settings:
     arg_parser = argparse.ArgumentParser(
         prog='yadupe',
         description=sys.modules['yadupe.core'].__doc__)
-    arg_parser.add_argument('source', nargs='+',
+    arg_parser.add_argument('source', nargs='*',
                             help='Source path to search duplicated files.',
                             metavar='PATH')
     arg_parser.add_argument('-d', '--deduplicate',
@@ -25,8 +34,164 @@ def parse_arguments(parameter_list: str = '') -> Settings:
                             help='Scan and move mode. Unique files will be moved into given \
                                 directory.',
                             action='store_true', dest='unique')
+    arg_parser.add_argument('--copy',
+                            help='Copy unique files into given directory, preserving their \
+                                pathes relative to source, instead of moving them. Sources \
+                                are left intact. Requires -u.',
+                            action='store_true', dest='copy')
+    arg_parser.add_argument('--keep',
+                            help=f'Which copy of duplicates to keep in place: device (on \
+                                other device than destination, so fewest bytes are copied \
+                                across devices), oldest, links (most hard links) or root \
+                                (under --keep-root). Default {keeputils.DEFAULT_POLICY}.',
+                            choices=keeputils.POLICIES, default=keeputils.DEFAULT_POLICY,
+                            metavar='POLICY', dest='keep')
+    arg_parser.add_argument('--keep-root',
+                            help='Preferred root of kept copies for root policy. Could be \
+                                given several times, the first matching root wins.',
+                            metavar='PATH', action='append', dest='keep_root')
+    arg_parser.add_argument('--include',
+                            help='Scan only files matching PATTERN (file name, or path \
+                                relative to source if PATTERN contains "/").',
+                            metavar='PATTERN', action='append', dest='include')
+    arg_parser.add_argument('--exclude',
+                            help='Skip files and directories matching PATTERN, excluded \
+                                directories are not walked at all.',
+                            metavar='PATTERN', action='append', dest='exclude')
+    arg_parser.add_argument('--min-size',
+                            help='Skip files smaller than BYTES.',
+                            type=int, metavar='BYTES', dest='min_size')
+    arg_parser.add_argument('--max-size',
+                            help='Skip files larger than BYTES.',
+                            type=int, metavar='BYTES', dest='max_size')
+    arg_parser.add_argument('-x', '--one-file-system',
+                            help='Do not descend into directories on other file systems.',
+                            action='store_true', dest='one_file_system')
+    arg_parser.add_argument('-c', '--chunks',
+                            help='Chunk analysis mode. Report bytes shared by files and pairs \
+                                of files at content-defined chunk level.',
+                            action='store_true', dest='chunks')
+    arg_parser.add_argument('--dirs',
+                            help='Find identical directories, report and move each of them \
+                                as single unit.',
+                            action='store_true', dest='dirs')
+    arg_parser.add_argument('--images',
+                            help='Search similar images (resized or re-encoded copies) \
+                                instead of identical files, using given perceptual hash.',
+                            choices=sorted(imageutils.HASH_FUNCTIONS.keys()), dest='image_hash')
+    arg_parser.add_argument('--distance',
+                            help=f'Max number of different perceptual hash bits for similar \
+                                images, default {imageutils.DEFAULT_DISTANCE}.',
+                            type=int, default=imageutils.DEFAULT_DISTANCE, metavar='N',
+                            dest='image_distance')
+    arg_parser.add_argument('--archives',
+                            help='Search duplicates among zip and tar members too, without \
+                                extraction. Members are reported as ARCHIVE!/MEMBER and are \
+                                never moved.',
+                            action='store_true', dest='archives')
+    arg_parser.add_argument('--sparse',
+                            help='Hash files skipping their holes, so sparse files are read \
+                                only where data is allocated.',
+                            action='store_true', dest='sparse')
+    arg_parser.add_argument('--incremental',
+                            help='Keep block hashes of files in hash cache, hash only \
+                                appended blocks of grown append-only files (logs, journals). \
+                                Requires --hash-cache.',
+                            action='store_true', dest='incremental')
+    arg_parser.add_argument('--algorithm',
+                            help=f'Digest algorithm, default {DEFAULT_ALGORITHM}, or sha256 \
+                                with --checksums.',
+                            choices=['blake2b', 'md5', 'sha1', 'sha256', 'sha512'],
+                            dest='algorithm')
+    arg_parser.add_argument('--checksums',
+                            help='Take trusted digests from SOURCE instead of reading files: \
+                                xattr ("user.checksum.ALGORITHM" attributes), sidecar \
+                                (FILE.ALGORITHM files) or bagit (BagIt manifests). Could be \
+                                given several times.',
+                            choices=sorted(checksums.SOURCES.keys()), metavar='SOURCE',
+                            action='append', dest='checksums')
+    arg_parser.add_argument('--write-checksums',
+                            help='Write computed digests into xattrs, so next runs do not \
+                                read the files.',
+                            action='store_true', dest='write_checksums')
+    arg_parser.add_argument('--time-budget',
+                            help='Spend at most SECONDS on hashing. Groups of same sized files \
+                                with the largest expected savings are checked first, the rest \
+                                is skipped and the report is marked as partial. Moving files \
+                                and writing the report are not limited.',
+                            type=float, metavar='SECONDS', dest='time_budget')
+    arg_parser.add_argument('--byte-budget',
+                            help='Hash at most BYTES, largest expected savings first.',
+                            type=int, metavar='BYTES', dest='byte_budget')
+    arg_parser.add_argument('--parallel',
+                            help='Hash and move files in parallel, with own workers for each \
+                                source device: one for spinning disk, several for SSD.',
+                            action='store_true', dest='parallel')
+    arg_parser.add_argument('--ordered',
+                            help='Hash files in physical order of their data on disk (inode \
+                                order, if unknown), so spinning disk is read in one sweep.',
+                            action='store_true', dest='ordered')
+    arg_parser.add_argument('--pipeline',
+                            help='Walk directories and hash same sized files at the same \
+                                time: files are hashed in worker threads as soon as they \
+                                could have duplicates.',
+                            action='store_true', dest='pipeline')
+    arg_parser.add_argument('--max-read-rate',
+                            help='Read at most BYTES per second. Limit is shared by walk, \
+                                hash, copy and move (files copied across devices), and is \
+                                lowered while read latency is high.',
+                            type=int, metavar='BYTES', dest='max_read_rate')
+    arg_parser.add_argument('--max-iops',
+                            help='Do at most N I/O operations per second (directory \
+                                listings, stats, reads, renames, directory removals, \
+                                journal syncs).',
+                            type=int, metavar='N', dest='max_iops')
+    arg_parser.add_argument('--nice',
+                            help='Lower CPU priority by N, from 0 to 19.',
+                            type=int, metavar='N', dest='nice')
+    arg_parser.add_argument('--ionice',
+                            help='Lower I/O priority (Linux only): the lowest best-effort \
+                                level or idle class.',
+                            choices=sorted(throttle.IONICE_CLASSES.keys()), dest='ionice')
+    arg_parser.add_argument('--build-filter',
+                            help='Save compact filter of all source files into FILTER file.',
+                            metavar='FILTER', dest='filter_build')
+    arg_parser.add_argument('--against',
+                            help='Report source files already present in FILTER file, built \
+                                with --build-filter.',
+                            metavar='FILTER', dest='filter_against')
+    arg_parser.add_argument('--reference',
+                            help='Read-only reference path. Its files are never moved, only \
+                                source files duplicating them are reported or moved.',
+                            metavar='PATH', action='append', dest='reference')
+    arg_parser.add_argument('--hash-cache',
+                            help='Persistent hash cache FILE. Unchanged files are not \
+                                read again on next run.',
+                            metavar='FILE', dest='hash_cache')
+    arg_parser.add_argument('--agent',
+                            help='Address of remote yadupe-agent. Its files are merged into \
+                                the search, only file records are sent over network. Shared token \
+                                is taken from YADUPE_AGENT_TOKEN environment variable.',
+                            metavar='HOST:PORT', action='append', dest='agents')
+    arg_parser.add_argument('--shard',
+                            help='Batch worker mode. Scan and hash only I-th of N size \
+                                partitions (I from 0 to N-1), save partial index into \
+                                given directory. Combine partial indexes with --merge.',
+                            metavar='I/N', dest='shard')
+    arg_parser.add_argument('--merge',
+                            help='Merge partial indexes, saved by --shard workers and given \
+                                instead of source paths, into duplicates report.',
+                            action='store_true', dest='merge')
+    arg_parser.add_argument('--resume',
+                            help='Finish interrupted duplicates move from journal in result \
+                                directory, without scan.',
+                            action='store_true', dest='resume')
+    arg_parser.add_argument('--undo',
+                            help='Move duplicates back into their places, using only journal \
+                                in result directory.',
+                            action='store_true', dest='undo')
     arg_parser.add_argument('-p', '--purge',
-                            help='Remove empty subdirs after duplicates move.',
+                            help='Remove subdirs emptied by duplicates or uniques move.',
                             action='store_true', dest='rem_empty')
     arg_parser.add_argument('-r', '--result',
                             help='Path to report dir (optional for default search mode) OR \
@@ -34,13 +199,82 @@ def parse_arguments(parameter_list: str = '') -> Settings:
                             metavar='PATH')
     args = arg_parser.parse_args(
         parameter_list if len(parameter_list) else None)
+    if not (args.source or args.agents or args.resume or args.undo):
+        arg_parser.error('the following arguments are required: PATH')
+    shard = None
+    if args.shard:
+        index, _, count = args.shard.partition('/')
+        if not (index.isdigit() and count.isdigit()):
+            arg_parser.error(f'argument --shard: invalid value: {args.shard}')
+        shard = (int(index), int(count))
 
     return Settings(args.deduplicate,
                     args.unique,
                     args.result,
                     args.source,
                     args.rem_empty,
-                    False)
+                    False,
+                    op_chunks=args.chunks,
+                    filter_build=args.filter_build,
+                    filter_against=args.filter_against,
+                    reference=args.reference,
+                    hash_cache=args.hash_cache,
+                    agents=args.agents,
+                    shard=shard,
+                    op_dirs=args.dirs,
+                    image_hash=args.image_hash,
+                    image_distance=args.image_distance,
+                    archives=args.archives,
+                    sparse=args.sparse,
+                    incremental=args.incremental,
+                    time_budget=args.time_budget,
+                    byte_budget=args.byte_budget,
+                    parallel=args.parallel,
+                    ordered=args.ordered,
+                    pipeline=args.pipeline,
+                    include=args.include,
+                    exclude=args.exclude,
+                    min_size=args.min_size,
+                    max_size=args.max_size,
+                    one_file_system=args.one_file_system,
+                    resume=args.resume,
+                    undo=args.undo,
+                    copy=args.copy,
+                    max_read_rate=args.max_read_rate,
+                    max_iops=args.max_iops,
+                    nice=args.nice,
+                    ionice=args.ionice,
+                    algorithm=args.algorithm or ('sha256' if args.checksums
+                                                 else DEFAULT_ALGORITHM),
+                    checksums=args.checksums,
+                    write_checksums=args.write_checksums,
+                    keep=args.keep,
+                    keep_root=args.keep_root,
+                    merge=args.merge)
+
+
+def _isdir(backend, path: str) -> bool:
+    """ os.path.isdir of the path in file system backend. """
+
+    try:
+        return stat.S_ISDIR(backend.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+# Settings fields, which mean the same in every mode
+_COMMON_FIELDS = ('dest_path', 'op_test', 'nice', 'ionice', 'backend')
+
+
+def _options_set(arguments: Settings, used: typing.Iterable[str]) -> typing.List[str]:
+    """ Return names of Settings fields changed from their defaults, except
+    common and given used ones. """
+
+    defaults = Settings._field_defaults
+    used = set(used) | set(_COMMON_FIELDS)
+    return [name for name in Settings._fields if name not in used
+            and (getattr(arguments, name) != defaults[name] if name in defaults
+                 else bool(getattr(arguments, name)))]
 
 
 def verify_settings(arguments: Settings, make_abs_path: bool = True) -> Settings:
@@ -51,15 +285,66 @@ def verify_settings(arguments: Settings, make_abs_path: bool = True) -> Settings
     if not arguments.dest_path is None:
         abspath = os.path.abspath(arguments.dest_path)
 
+    if not fsbackend.is_local(arguments.backend):
+        if arguments.resume or arguments.undo or arguments.op_chunks or arguments.filter_build \
+                or arguments.filter_against or arguments.hash_cache or arguments.agents \
+                or arguments.shard or arguments.image_hash or arguments.archives \
+                or arguments.sparse or arguments.incremental or arguments.parallel \
+                or arguments.ordered or arguments.copy or arguments.checksums \
+                or arguments.write_checksums:
+            raise ValueError(
+                f'File system backend can not be combined with resume, undo, chunk analysis, '
+                f'filter, hash cache, agent, shard, image, archive, sparse, incremental, '
+                f'parallel, ordered, copy or checksum modes.')
+    backend = arguments.backend or fsbackend.LOCAL
+
+    if arguments.merge:
+        if _options_set(arguments, ('merge', 'source')):
+            raise ValueError(f'Merge mode can not be combined with other modes or options.')
+        verify_merge_arguments(arguments.source, arguments.dest_path)
+        return arguments._replace(dest_path=abspath) \
+            if make_abs_path and arguments.dest_path is not None else arguments
+
+    if arguments.resume or arguments.undo:
+        # only resume purges directories emptied by finished moves
+        used = ('resume', 'remove_empty') if arguments.resume else ('undo',)
+        if (arguments.resume and arguments.undo) or _options_set(arguments, used):
+            raise ValueError(f'Resume and undo modes can not be combined with other modes, '
+                             f'options or source paths.')
+        if arguments.dest_path is None \
+                or not os.path.isfile(journalutils.journal_path(arguments.dest_path)):
+            raise ValueError(f'{arguments.dest_path}: must be valid path to directory '
+                             f'with journal.')
+        return arguments._replace(dest_path=abspath) if make_abs_path else arguments
+
     if arguments.op_dedup and arguments.op_unique:
         raise  ValueError(
                 f'Select exactly one mode: remove duplicates or move unique files.')
 
+    if arguments.op_chunks and (arguments.op_dedup or arguments.op_unique):
+        raise ValueError(
+            f'Chunk analysis mode can not be combined with files moving.')
+
+    if arguments.filter_build or arguments.filter_against:
+        if (arguments.filter_build and arguments.filter_against) or arguments.op_chunks \
+                or arguments.op_dedup or arguments.op_unique:
+            raise ValueError(f'Filter modes can not be combined with other modes.')
+        if arguments.filter_against and not os.path.isfile(arguments.filter_against):
+            raise ValueError(f'{arguments.filter_against}: must be valid path to filter file.')
+        if arguments.filter_build:
+            rootname, _ = os.path.split(os.path.abspath(arguments.filter_build))
+            if not os.path.isdir(rootname):
+                raise ValueError(f'{arguments.filter_build} must be valid path to file to create.')
+
     if arguments.op_dedup or arguments.op_unique:
         # Arguments.dest_path must be directory path
-        if arguments.dest_path is None or not os.path.isdir(abspath):
+        if arguments.dest_path is None or not _isdir(backend, abspath):
             raise ValueError(
                 f'{arguments.dest_path}: must be valid path to directory.')
+        journal = journalutils.journal_path(abspath)
+        if arguments.op_dedup and os.path.isfile(journal) \
+                and not journalutils.load_journal(journal).finished:
+            raise ValueError(f'{journal}: interrupted run, use --resume or --undo.')
     else:
         if not arguments.dest_path is None:
             # Arguments.dest_path must be valid filepath for new file.
@@ -69,12 +354,155 @@ def verify_settings(arguments: Settings, make_abs_path: bool = True) -> Settings
                     f'{arguments.dest_path} must be valid path to file to create.')
 
     isrelative = False
-    for source in arguments.source:
-        if not os.path.isdir(os.path.abspath(source)):
+    for source in arguments.source + (arguments.reference or []):
+        if not _isdir(backend, os.path.abspath(source)):
             raise ValueError(f'{source}: must be valid path to directory.')
         elif not os.path.isabs(source):
             isrelative = True
 
+    if arguments.reference:
+        if arguments.op_chunks or arguments.filter_build or arguments.filter_against:
+            raise ValueError(
+                f'Reference mode can not be combined with chunk analysis or filter modes.')
+        for reference in arguments.reference:
+            absref = os.path.abspath(reference)
+            for source in arguments.source:
+                common = os.path.commonpath([absref, os.path.abspath(source)])
+                if common in (absref, os.path.abspath(source)):
+                    raise ValueError(f'{reference}: reference path must not overlap source paths.')
+
+    if arguments.agents:
+        if arguments.op_dedup or arguments.op_unique or arguments.op_chunks \
+                or arguments.filter_build or arguments.filter_against or arguments.reference:
+            raise ValueError(f'Remote agents can be used only in search mode.')
+        for address in arguments.agents:
+            parse_address(address)
+
+    if arguments.shard:
+        index, count = arguments.shard
+        if not 0 <= index < count:
+            raise ValueError(f'{index}/{count}: shard index must be in range from 0 to N-1.')
+        if arguments.op_dedup or arguments.op_unique or arguments.op_chunks \
+                or arguments.filter_build or arguments.filter_against \
+                or arguments.reference or arguments.agents:
+            raise ValueError(f'Shard mode can be used only in search mode.')
+        if arguments.dest_path is None or not _isdir(backend, abspath):
+            raise ValueError(f'{arguments.dest_path}: must be valid path to directory.')
+
+    if arguments.op_dirs:
+        if arguments.op_unique or arguments.op_chunks or arguments.filter_build \
+                or arguments.filter_against or arguments.reference or arguments.agents \
+                or arguments.shard:
+            raise ValueError(
+                f'Directory mode can be used only in search or remove duplicates mode.')
+        if arguments.include or arguments.exclude or arguments.min_size is not None \
+                or arguments.max_size is not None or arguments.one_file_system:
+            # directories are moved whole, so all their files must be compared
+            raise ValueError(
+                f'Directory mode can not be combined with include, exclude, size or '
+                f'file system filters.')
+
+    if arguments.image_hash:
+        if arguments.op_unique or arguments.op_chunks or arguments.filter_build \
+                or arguments.filter_against or arguments.reference or arguments.agents \
+                or arguments.shard or arguments.op_dirs:
+            raise ValueError(
+                f'Image mode can be used only in search or remove duplicates mode.')
+        if not 0 <= arguments.image_distance < imageutils.HASH_BITS:
+            raise ValueError(f'{arguments.image_distance}: distance must be in range '
+                             f'from 0 to {imageutils.HASH_BITS - 1}.')
+        if not imageutils.available():
+            raise ValueError(f'Image mode requires NumPy and Pillow packages.')
+
+    if arguments.archives:
+        if arguments.op_unique or arguments.op_chunks or arguments.filter_build \
+                or arguments.filter_against or arguments.agents or arguments.shard \
+                or arguments.op_dirs or arguments.image_hash:
+            raise ValueError(
+                f'Archive mode can be used only in search or remove duplicates mode.')
+
+    if arguments.sparse:
+        if arguments.op_chunks or arguments.filter_build or arguments.filter_against \
+                or arguments.agents or arguments.image_hash or arguments.archives:
+            # archive members are hashed whole, their digests never match sparse ones
+            raise ValueError(
+                f'Sparse hashing can not be combined with chunk analysis, filter, agent, '
+                f'image or archive modes.')
+
+    if arguments.incremental:
+        if not arguments.hash_cache:
+            raise ValueError(f'Incremental hashing requires hash cache file.')
+        if arguments.sparse or arguments.op_chunks or arguments.filter_build \
+                or arguments.filter_against or arguments.agents or arguments.image_hash \
+                or arguments.archives:
+            # archive members are hashed whole, their digests never match manifest roots
+            raise ValueError(
+                f'Incremental hashing can not be combined with sparse hashing, chunk analysis, '
+                f'filter, agent, image or archive modes.')
+
+    if arguments.time_budget is not None or arguments.byte_budget is not None:
+        if (arguments.time_budget is not None and arguments.time_budget < 0) \
+                or (arguments.byte_budget is not None and arguments.byte_budget < 0):
+            raise ValueError(f'Budget must not be negative.')
+        if arguments.op_chunks or arguments.filter_build or arguments.filter_against \
+                or arguments.shard or arguments.op_dirs or arguments.image_hash:
+            raise ValueError(
+                f'Budget can not be combined with chunk analysis, filter, shard, directory '
+                f'or image modes.')
+
+    if arguments.pipeline:
+        if arguments.op_chunks or arguments.filter_build or arguments.filter_against \
+                or arguments.shard or arguments.image_hash or arguments.archives \
+                or arguments.time_budget is not None or arguments.byte_budget is not None \
+                or arguments.ordered:
+            raise ValueError(
+                f'Pipeline can not be combined with chunk analysis, filter, shard, image, '
+                f'archive, budget or ordered modes.')
+
+    if arguments.max_read_rate is not None or arguments.max_iops is not None:
+        if (arguments.max_read_rate is not None and arguments.max_read_rate <= 0) \
+                or (arguments.max_iops is not None and arguments.max_iops <= 0):
+            raise ValueError(f'Read rate and I/O operations limits must be positive.')
+        if arguments.op_chunks or arguments.filter_build or arguments.filter_against \
+                or arguments.image_hash:
+            raise ValueError(
+                f'Throttling can not be combined with chunk analysis, filter or image modes.')
+
+    if arguments.checksums or arguments.write_checksums \
+            or arguments.algorithm != DEFAULT_ALGORITHM:
+        if arguments.sparse or arguments.incremental or arguments.op_chunks \
+                or arguments.filter_build or arguments.filter_against or arguments.agents \
+                or arguments.image_hash or arguments.archives:
+            raise ValueError(
+                f'Checksum sources and digest algorithm can not be combined with sparse or '
+                f'incremental hashing, chunk analysis, filter, agent, image or archive modes.')
+
+    if arguments.nice is not None and not 0 <= arguments.nice <= 19:
+        raise ValueError(f'{arguments.nice}: nice must be in range from 0 to 19.')
+
+    if arguments.copy and not arguments.op_unique:
+        raise ValueError(f'Copy mode can be used only in move uniques mode.')
+
+    if arguments.keep not in keeputils.POLICIES:
+        raise ValueError(f'{arguments.keep}: unknown keeper policy.')
+    if (arguments.keep == 'root') != bool(arguments.keep_root):
+        raise ValueError(f'Root keeper policy requires preferred roots and vice versa.')
+    for root in arguments.keep_root or []:
+        if not _isdir(backend, root):
+            raise ValueError(f'{root}: must be valid path to directory.')
+
+    if (arguments.min_size is not None and arguments.min_size < 0) \
+            or (arguments.max_size is not None and arguments.max_size < 0):
+        raise ValueError(f'File size bounds must not be negative.')
+    if arguments.min_size is not None and arguments.max_size is not None \
+            and arguments.min_size > arguments.max_size:
+        raise ValueError(f'{arguments.min_size}: min size must not exceed max size.')
+
+    if arguments.hash_cache:
+        rootname, _ = os.path.split(os.path.abspath(arguments.hash_cache))
+        if not os.path.isdir(rootname):
+            raise ValueError(f'{arguments.hash_cache} must be valid path to file to create.')
+
     if arguments.dest_path and not os.path.isabs(arguments.dest_path):
         isrelative = True
 
@@ -86,13 +514,20 @@ def verify_settings(arguments: Settings, make_abs_path: bool = True) -> Settings
             dest = os.path.abspath(arguments.dest_path)
         else:
             dest = None
-        resargs = Settings(arguments.op_dedup,
-                           arguments.op_unique,
-                           dest,
-                           sources,
-                           arguments.remove_empty,
-                           arguments.op_test)
+        references = [os.path.abspath(ref) for ref in arguments.reference] \
+            if arguments.reference else arguments.reference
+        resargs = arguments._replace(dest_path=dest, source=sources, reference=references)
     else:
         resargs = arguments
 
     return resargs
+
+
+def verify_merge_arguments(partials: typing.List[str], dest_path: str):
+    """ Check "yadupe --merge" parameters, raise exception if invalid. """
+
+    for partial in partials:
+        if not os.path.isfile(partial):
+            raise ValueError(f'{partial}: must be valid path to partial index file.')
+    if dest_path is not None and not os.path.isdir(dest_path):
+        raise ValueError(f'{dest_path}: must be valid path to directory.')
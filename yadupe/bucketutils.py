@@ -0,0 +1,56 @@
+"""
+Size bucketing of scanned files.
+
+Scanned files are collected into contiguous arrays of sizes, reference flags
+and a list of pathes, without per file key objects. Sizes colliding with
+other files are found in one vectorized pass (sort and unique with counts),
+so only files which could have duplicates go into FilepathDict.
+
+NumPy is used if installed, otherwise sizes are counted in pure Python.
+
+"""
+
+import typing
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SizeBuckets(object):
+    """ Scanned (path, size, reference) records in scan order. """
+
+    def __init__(self):
+        self.pathes: typing.List[str] = []
+        self.sizes = array('q')
+        self.reference = array('b')
+
+    def add(self, filepath: str, size: int, reference: bool = False) -> None:
+        self.pathes.append(filepath)
+        self.sizes.append(size)
+        self.reference.append(reference)
+
+    def __len__(self):
+        return len(self.pathes)
+
+    def _colliding_numpy_(self) -> typing.List[int]:
+        sizes = numpy.frombuffer(self.sizes, dtype=numpy.int64)
+        values, counts = numpy.unique(sizes, return_counts=True)
+        return numpy.flatnonzero(numpy.isin(sizes, values[counts > 1])).tolist()
+
+    def _colliding_python_(self) -> typing.List[int]:
+        counts = Counter(self.sizes)
+        return [idx for idx, size in enumerate(self.sizes) if counts[size] > 1]
+
+    def colliding(self) -> typing.Iterator[typing.Tuple[str, int, bool]]:
+        """ Iterator, return (path, size, reference) of each file, which has
+        other files of the same size, in scan order. """
+
+        if not self.pathes:
+            return
+        indexes = self._colliding_numpy_() if numpy is not None else self._colliding_python_()
+        for idx in indexes:
+            yield self.pathes[idx], self.sizes[idx], bool(self.reference[idx])
@@ -0,0 +1,231 @@
+"""
+Checksum sources: trusted digests already stored next to the file data.
+
+Source returns digest of the file without reading its data, or None:
+
+    xattr   - "user.checksum.ALGORITHM" extended attribute, trusted while
+              "user.checksum.mtime" (st_mtime_ns) and "user.checksum.size"
+              attributes, written together with it, match the file.
+    sidecar - "FILE.ALGORITHM" file in sha256sum format next to the file.
+    bagit   - "manifest-ALGORITHM.txt" of BagIt bag the file belongs to.
+
+Sidecar and manifest digests are trusted, if the file was not modified after
+the manifest was written. Sidecar has no size, its trust rests on mtime only.
+Bag with "Payload-Oxum" in bag-info.txt is trusted only while sizes of its
+payload files sum up to it. Digests which are not hex of the algorithm digest
+length are ignored. If no source knows the digest, the file is hashed and,
+optionally, the digest is written into xattrs for future runs.
+
+"""
+
+import os
+import string
+import typing
+import hashlib
+import threading
+from .hashutils import hash_file
+
+
+XATTR_PREFIX = 'user.checksum.'
+XATTR_MTIME = XATTR_PREFIX + 'mtime'
+XATTR_SIZE = XATTR_PREFIX + 'size'
+
+
+def _getxattr(filepath: str, name: str) -> typing.Optional[str]:
+    try:
+        return os.getxattr(filepath, name).decode('ascii').strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _digest_length(algorithm: str) -> int:
+    return hashlib.new(algorithm).digest_size * 2
+
+
+def _valid(digest: typing.Optional[str], length: int) -> typing.Optional[str]:
+    """ Return lowercase digest, if it is hex of given length, otherwise None. """
+
+    if not digest or len(digest) != length:
+        return None
+    digest = digest.lower()
+    return digest if all(char in string.hexdigits for char in digest) else None
+
+
+def _parse_line(line: str) -> typing.Tuple[str, str]:
+    """ Return (digest, path) of "DIGEST  PATH" or "DIGEST *PATH" line. """
+
+    digest, _, path = line.rstrip('\n').partition(' ')
+    return digest.lower(), path.lstrip(' *')
+
+
+class XattrSource(object):
+    """ Digest from extended attributes, written by ingest tools or write(). """
+
+    def __init__(self, algorithm: str):
+        self.name = XATTR_PREFIX + algorithm
+        self.length = _digest_length(algorithm)
+
+    def __call__(self, filepath: str, file_stat: os.stat_result) -> typing.Optional[str]:
+        if not hasattr(os, 'getxattr'):
+            return None
+        digest = _getxattr(filepath, self.name)
+        if not digest or _getxattr(filepath, XATTR_MTIME) != str(file_stat.st_mtime_ns):
+            return None
+        size = _getxattr(filepath, XATTR_SIZE)
+        if size is not None and size != str(file_stat.st_size):
+            return None
+        return _valid(digest, self.length)
+
+    def write(self, filepath: str, file_stat: os.stat_result, digest: str) -> None:
+        """ Store digest with file mtime and size, silently skip if unsupported. """
+
+        if not hasattr(os, 'setxattr'):
+            return
+        try:
+            os.setxattr(filepath, self.name, digest.encode('ascii'))
+            os.setxattr(filepath, XATTR_MTIME, str(file_stat.st_mtime_ns).encode('ascii'))
+            os.setxattr(filepath, XATTR_SIZE, str(file_stat.st_size).encode('ascii'))
+        except OSError:
+            pass
+
+
+class SidecarSource(object):
+    """ Digest from "FILE.ALGORITHM" file, e.g. "data.bin.sha256".
+    Sidecar does not record file size: it is trusted by mtime only. """
+
+    def __init__(self, algorithm: str):
+        self.extension = f'.{algorithm}'
+        self.length = _digest_length(algorithm)
+
+    def __call__(self, filepath: str, file_stat: os.stat_result) -> typing.Optional[str]:
+        sidecar = filepath + self.extension
+        try:
+            if os.stat(sidecar).st_mtime_ns < file_stat.st_mtime_ns:
+                return None
+            with open(sidecar, 'rt', encoding='utf-8', errors='surrogateescape') as filein:
+                line = filein.readline()
+        except OSError:
+            return None
+        digest, path = _parse_line(line)
+        if path and os.path.basename(path) != os.path.basename(filepath):
+            return None
+        return _valid(digest, self.length)
+
+
+class BagItSource(object):
+    """ Digest from manifest of BagIt bag: directory with "bagit.txt" and
+    "manifest-ALGORITHM.txt", listing pathes relative to the bag. If bag-info.txt
+    has Payload-Oxum, "OCTETS.COUNT", manifest is used only while payload
+    files match it. """
+
+    def __init__(self, algorithm: str):
+        self.manifest_name = f'manifest-{algorithm}.txt'
+        self.length = _digest_length(algorithm)
+        self._lock_ = threading.Lock()
+        # bag root: (manifest mtime, {absolute path: digest}), None if not a bag
+        self._bags_: typing.Dict[str, typing.Optional[typing.Tuple[int, dict]]] = {}
+        self._roots_: typing.Dict[str, typing.Optional[str]] = {}
+
+    def _load_(self, bagpath: str) -> typing.Optional[typing.Tuple[int, dict]]:
+        manifest = os.path.join(bagpath, self.manifest_name)
+        if not os.path.isfile(os.path.join(bagpath, 'bagit.txt')):
+            return None
+        try:
+            mtime = os.stat(manifest).st_mtime_ns
+            with open(manifest, 'rt', encoding='utf-8', errors='surrogateescape') as filein:
+                digests = {}
+                for line in filein:
+                    digest, path = _parse_line(line)
+                    digest = _valid(digest, self.length)
+                    if digest and path:
+                        digests[os.path.normpath(os.path.join(bagpath, path))] = digest
+        except OSError:
+            return None
+        if not self._oxum_matches_(bagpath, digests.keys()):
+            # payload was changed since the bag was made, nothing is trusted
+            return mtime, {}
+        return mtime, digests
+
+    @staticmethod
+    def _oxum_matches_(bagpath: str, payload: typing.Iterable[str]) -> bool:
+        """ Check payload files against Payload-Oxum of bag-info.txt, True if
+        there is no Payload-Oxum. """
+
+        oxum = None
+        try:
+            with open(os.path.join(bagpath, 'bag-info.txt'), 'rt', encoding='utf-8',
+                      errors='surrogateescape') as filein:
+                for line in filein:
+                    name, _, value = line.partition(':')
+                    if name.strip().lower() == 'payload-oxum':
+                        oxum = value.strip()
+        except OSError:
+            return True
+        if oxum is None:
+            return True
+        octets, _, count = oxum.partition('.')
+        payload = list(payload)
+        try:
+            total = sum(os.stat(path).st_size for path in payload)
+        except OSError:
+            return False
+        return octets == str(total) and count == str(len(payload))
+
+    def _bag_of_(self, dirpath: str) -> typing.Optional[str]:
+        """ Return root of the bag containing dirpath, None if there is no bag. """
+
+        visited = []
+        root = None
+        while True:
+            if dirpath in self._roots_:
+                root = self._roots_[dirpath]
+                break
+            visited.append(dirpath)
+            if dirpath not in self._bags_:
+                self._bags_[dirpath] = self._load_(dirpath)
+            if self._bags_[dirpath] is not None:
+                root = dirpath
+                break
+            parent = os.path.dirname(dirpath)
+            if parent == dirpath:
+                break
+            dirpath = parent
+        for path in visited:
+            self._roots_[path] = root
+        return root
+
+    def __call__(self, filepath: str, file_stat: os.stat_result) -> typing.Optional[str]:
+        with self._lock_:
+            root = self._bag_of_(os.path.dirname(filepath))
+            if root is None:
+                return None
+            mtime, digests = self._bags_[root]
+        if mtime < file_stat.st_mtime_ns:
+            return None
+        return digests.get(os.path.normpath(filepath))
+
+
+SOURCES = {'xattr': XattrSource, 'sidecar': SidecarSource, 'bagit': BagItSource}
+
+
+class ChecksumHasher(object):
+    """ File hash function, which takes trusted digest from the first source
+    knowing it and hashes the file otherwise. Computed digests are written
+    into xattrs, if write_back is set. """
+
+    def __init__(self, sources: typing.List[str], algorithm: str,
+                 hash_function: typing.Callable = hash_file, write_back: bool = False):
+        self._sources_ = [SOURCES[name](algorithm) for name in sources]
+        self._hash_function_ = hash_function
+        self._xattr_ = XattrSource(algorithm) if write_back else None
+
+    def __call__(self, filepath: str) -> str:
+        file_stat = os.stat(filepath)
+        for source in self._sources_:
+            digest = source(filepath, file_stat)
+            if digest is not None:
+                return digest
+        digest = self._hash_function_(filepath)
+        if self._xattr_:
+            self._xattr_.write(filepath, file_stat, digest)
+        return digest
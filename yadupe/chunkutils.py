@@ -0,0 +1,278 @@
+"""
+Content-defined chunking and chunk-level duplicate analysis.
+
+Files are split into variable size chunks with a FastCDC-style gear rolling
+hash, so inserted or removed bytes shift only the chunks around the edit.
+Chunk digests of all scanned files are kept in ChunkIndex, which can be saved
+into compact binary table and reports bytes shared by each file and by each
+pair of files.
+
+If NumPy is available, rolling hash is computed for whole read buffer at once,
+otherwise pure Python loop is used. Both produce the same chunk boundaries.
+
+"""
+
+import sys
+import struct
+import typing
+import hashlib
+from bisect import bisect_left
+from itertools import combinations
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MIN_CHUNK_SIZE = 2 * 1024
+AVG_CHUNK_SIZE = 8 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+READ_SIZE = 4 * 1024 * 1024
+DIGEST_SIZE = 16
+
+_WINDOW = 32
+_MASK32 = (1 << 32) - 1
+
+# Gear table: 256 pseudo-random 32 bit values, derived from byte value.
+_GEAR = [int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=4).digest(), 'little')
+         for i in range(256)]
+_GEAR_NP = numpy.array(_GEAR, dtype=numpy.uint32) if numpy is not None else None
+
+
+def _threshold(bits: int) -> int:
+    """ Hash matches, if given number of its highest bits are zero.
+    High bits of gear hash depend on the whole 32 byte window. """
+    return 1 << (32 - bits)
+
+
+class Chunk(typing.NamedTuple):
+    """ Content-defined chunk of the file. """
+    offset: int
+    length: int
+    digest: bytes
+
+
+def _candidates_numpy(data: bytes, strict_below: int, loose_below: int):
+    """ Return positions in data where gear hash is below strict and loose thresholds. """
+
+    hashes = _GEAR_NP.take(numpy.frombuffer(data, dtype=numpy.uint8))
+    shifted = numpy.empty_like(hashes)
+    # h[i] = sum(G[b[i - k]] << k, k < 32): build window sum by doubling.
+    shift = 1
+    while shift < _WINDOW:
+        count = len(hashes) - shift
+        numpy.left_shift(hashes[:count], numpy.uint32(shift), out=shifted[:count])
+        numpy.add(hashes[shift:], shifted[:count], out=hashes[shift:])
+        shift *= 2
+    strict = numpy.flatnonzero(hashes < numpy.uint32(strict_below)).tolist()
+    loose = numpy.flatnonzero(hashes < numpy.uint32(loose_below)).tolist()
+    return strict, loose
+
+
+def _candidates_python(data: bytes, strict_below: int, loose_below: int):
+    """ Pure Python version of _candidates_numpy. """
+
+    strict = []
+    loose = []
+    gear = _GEAR
+    h = 0
+    for pos, byte in enumerate(data):
+        h = ((h << 1) + gear[byte]) & _MASK32
+        if h < loose_below:
+            loose.append(pos)
+            if h < strict_below:
+                strict.append(pos)
+    return strict, loose
+
+
+def _first_in_range(positions: typing.List[int], low: int, high: int):
+    """ Return first position in [low, high) or None. """
+
+    idx = bisect_left(positions, low)
+    if idx < len(positions) and positions[idx] < high:
+        return positions[idx]
+    return None
+
+
+def _cut_points(strict, loose, size: int, eof: bool,
+                min_size: int, avg_size: int, max_size: int) -> typing.List[int]:
+    """ Return chunk end positions for buffer of given size.
+    Tail shorter than max_size is left uncut until end of file. """
+
+    cuts = []
+    start = 0
+    while start < size:
+        remaining = size - start
+        if remaining < max_size and not eof:
+            break
+        if remaining <= min_size:
+            cuts.append(size)
+            break
+        # Chunk ends after matched byte: length = pos + 1 - start.
+        limit = start + min(remaining, max_size) - 1
+        pos = _first_in_range(strict, start + min_size - 1,
+                              min(start + avg_size - 1, limit))
+        if pos is None:
+            pos = _first_in_range(loose, start + avg_size - 1, limit)
+        end = pos + 1 if pos is not None else limit + 1
+        cuts.append(end)
+        start = end
+    return cuts
+
+
+def iter_chunks(filepath: str,
+                min_size: int = MIN_CHUNK_SIZE,
+                avg_size: int = AVG_CHUNK_SIZE,
+                max_size: int = MAX_CHUNK_SIZE,
+                read_size: int = READ_SIZE) -> typing.Iterator[Chunk]:
+    """ Split file into content-defined chunks. """
+
+    bits = max(avg_size.bit_length() - 1, 3)
+    strict_below = _threshold(bits + 2)
+    loose_below = _threshold(bits - 2)
+    candidates = _candidates_numpy if numpy is not None else _candidates_python
+    context = b''   # up to 31 bytes preceding pending data, keep hash exact
+    pending = b''
+    offset = 0
+
+    with open(filepath, 'rb') as openedfile:
+        eof = False
+        while not eof:
+            data = openedfile.read(max(read_size, max_size))
+            eof = not data
+            buffer = pending + data
+            strict, loose = candidates(context + buffer, strict_below, loose_below)
+            skip = len(context)
+            strict = [pos - skip for pos in strict if pos >= skip]
+            loose = [pos - skip for pos in loose if pos >= skip]
+
+            start = 0
+            view = memoryview(buffer)
+            for end in _cut_points(strict, loose, len(buffer), eof,
+                                   min_size, avg_size, max_size):
+                digest = hashlib.blake2b(view[start:end], digest_size=DIGEST_SIZE).digest()
+                yield Chunk(offset + start, end - start, digest)
+                start = end
+            view.release()
+
+            context = (context + buffer[:start])[-(_WINDOW - 1):]
+            pending = buffer[start:]
+            offset += start
+
+
+class ChunkIndex(object):
+    """ Chunk digests for the set of files.
+    Saved table layout: header, then for each file its path, size and chunk
+    count, followed by packed (digest, length) records of all chunks. """
+
+    _MAGIC = b'YDCI\x01'
+    _HEADER = struct.Struct('<5sI')
+    _FILE = struct.Struct('<HQI')
+    _RECORD = struct.Struct(f'<{DIGEST_SIZE}sI')
+
+    def __init__(self):
+        self.files: typing.List[str] = []
+        self.sizes: typing.List[int] = []
+        self.chunks: typing.List[typing.List[typing.Tuple[bytes, int]]] = []
+
+    def add_file(self, filepath: str, **chunking) -> None:
+        records = [(chunk.digest, chunk.length)
+                   for chunk in iter_chunks(filepath, **chunking)]
+        self.files.append(filepath)
+        self.sizes.append(sum(length for _, length in records))
+        self.chunks.append(records)
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, 'wb') as fileout:
+            fileout.write(self._HEADER.pack(self._MAGIC, len(self.files)))
+            for path, size, records in zip(self.files, self.sizes, self.chunks):
+                name = path.encode('utf-8', 'surrogateescape')
+                fileout.write(self._FILE.pack(len(name), size, len(records)))
+                fileout.write(name)
+            for records in self.chunks:
+                fileout.write(b''.join(self._RECORD.pack(digest, length)
+                                       for digest, length in records))
+
+    @staticmethod
+    def load(filepath: str) -> 'ChunkIndex':
+        index = ChunkIndex()
+        with open(filepath, 'rb') as filein:
+            magic, files_count = ChunkIndex._HEADER.unpack(
+                filein.read(ChunkIndex._HEADER.size))
+            if magic != ChunkIndex._MAGIC:
+                raise ValueError(f'{filepath}: not a chunk index file.')
+            counts = []
+            for _ in range(files_count):
+                namelen, size, chunks_count = ChunkIndex._FILE.unpack(
+                    filein.read(ChunkIndex._FILE.size))
+                index.files.append(filein.read(namelen).decode('utf-8', 'surrogateescape'))
+                index.sizes.append(size)
+                counts.append(chunks_count)
+            for chunks_count in counts:
+                data = filein.read(chunks_count * ChunkIndex._RECORD.size)
+                index.chunks.append(list(ChunkIndex._RECORD.iter_unpack(data)))
+        return index
+
+    def _owners_(self) -> typing.Dict[bytes, typing.Dict[int, int]]:
+        """ Map chunk digest to {file id: number of occurrences}. """
+        owners = {}
+        for file_id, records in enumerate(self.chunks):
+            for digest, _ in records:
+                counter = owners.setdefault(digest, {})
+                counter[file_id] = counter.get(file_id, 0) + 1
+        return owners
+
+    def file_shared_bytes(self) -> typing.Iterator[typing.Tuple[str, int, int]]:
+        """ Iterator, return (path, size, bytes shared with other files) for each file. """
+        owners = self._owners_()
+        for file_id, records in enumerate(self.chunks):
+            shared = sum(length for digest, length in records
+                         if len(owners[digest]) > 1)
+            yield self.files[file_id], self.sizes[file_id], shared
+
+    def pair_shared_bytes(self) -> typing.Dict[typing.Tuple[int, int], int]:
+        """ Return {(file id, file id): shared bytes} for each pair with common chunks. """
+        lengths = {}
+        for records in self.chunks:
+            for digest, length in records:
+                lengths[digest] = length
+        pairs = {}
+        for digest, counter in self._owners_().items():
+            if len(counter) < 2:
+                continue
+            for first, second in combinations(sorted(counter.keys()), 2):
+                shared = lengths[digest] * min(counter[first], counter[second])
+                pairs[(first, second)] = pairs.get((first, second), 0) + shared
+        return pairs
+
+    @staticmethod
+    def _percent(part: int, total: int) -> str:
+        return f'{100.0 * part / total:.1f}%' if total else '0.0%'
+
+    def _save_report_(self, target):
+        print('Shared chunks list:', file=target)
+        for path, size, shared in self.file_shared_bytes():
+            if not shared:
+                continue
+            print(f'{path}', file=target)
+            print(f'Size: {size} byte', file=target)
+            print(f'Shared: {shared} byte ({self._percent(shared, size)})', file=target)
+            print('', file=target)
+        print('Shared pairs:', file=target)
+        pairs = self.pair_shared_bytes()
+        for (first, second) in sorted(pairs.keys(), key=lambda pair: -pairs[pair]):
+            shared = pairs[(first, second)]
+            print(f'{self.files[first]}', file=target)
+            print(f'{self.files[second]}', file=target)
+            print(f'Shared: {shared} byte ({self._percent(shared, self.sizes[first])}, '
+                  f'{self._percent(shared, self.sizes[second])})', file=target)
+            print('', file=target)
+        print('End of list.', file=target)
+
+    def print_report(self):
+        self._save_report_(target=sys.stdout)
+
+    def save_report(self, filepath: str):
+        with open(filepath, 'wt') as fileout:
+            self._save_report_(target=fileout)
@@ -0,0 +1,164 @@
+"""
+Zero-copy file export.
+
+File data is copied inside the kernel, without passing through Python
+buffers: by reflink (FICLONE ioctl) if source and destination share copy on
+write file system, else by copy_file_range, else by sendfile. Plain read and
+write loop is the last resort. Several files are copied at once.
+
+Moves between devices fall back to such copy and removal of the source.
+
+"""
+
+import os
+import errno
+import shutil
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+
+COPY_WORKERS = 4
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+_FICLONE = 0x40049409
+# errors meaning "this way of copying is not supported here"
+_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP,
+                errno.ENOTSUP, errno.ENOTTY, errno.EPERM, errno.EBADF}
+
+
+def _reflink(infd: int, outfd: int) -> bool:
+    """ Clone the whole file, return False if reflink is not supported. """
+
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(outfd, _FICLONE, infd)
+    except OSError as ex:
+        if ex.errno in _UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _copy_range(infd: int, outfd: int, offset: int, size: int) -> int:
+    """ Copy with copy_file_range from offset, return offset reached. """
+
+    if not hasattr(os, 'copy_file_range'):
+        return offset
+    while offset < size:
+        try:
+            copied = os.copy_file_range(infd, outfd, min(COPY_CHUNK_SIZE, size - offset),
+                                        offset, offset)
+        except OSError as ex:
+            if ex.errno in _UNSUPPORTED:
+                break
+            raise
+        if not copied:
+            break
+        offset += copied
+    return offset
+
+
+def _sendfile(infd: int, outfd: int, offset: int, size: int) -> int:
+    """ Copy with sendfile from offset, return offset reached. """
+
+    if not hasattr(os, 'sendfile'):
+        return offset
+    os.lseek(outfd, offset, os.SEEK_SET)
+    while offset < size:
+        try:
+            sent = os.sendfile(outfd, infd, offset, min(COPY_CHUNK_SIZE, size - offset))
+        except OSError as ex:
+            if ex.errno in _UNSUPPORTED:
+                break
+            raise
+        if not sent:
+            break
+        offset += sent
+    return offset
+
+
+def copy_file(src: str, dst: str) -> None:
+    """ Copy file data and metadata (mode, times), destination is overwritten. """
+
+    with open(src, 'rb') as filein, open(dst, 'wb') as fileout:
+        infd, outfd = filein.fileno(), fileout.fileno()
+        size = os.fstat(infd).st_size
+        if not _reflink(infd, outfd):
+            offset = _copy_range(infd, outfd, 0, size)
+            if offset < size:
+                offset = _sendfile(infd, outfd, offset, size)
+            # file could be grown during copy, the rest is copied as well
+            filein.seek(offset)
+            fileout.seek(offset)
+            shutil.copyfileobj(filein, fileout)
+    shutil.copystat(src, dst)
+
+
+def remove(path: str) -> None:
+    """ Remove file, symbolic link or directory tree. """
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _paced_copy(throttle) -> typing.Callable:
+    """ Return copy_file, which waits for throttle for the file size first. """
+
+    def paced_copy(src: str, dst: str) -> None:
+        if throttle:
+            throttle.io(0, os.path.getsize(src))
+        copy_file(src, dst)
+    return paced_copy
+
+
+def move(src: str, dst: str, replace: typing.Callable = None, throttle=None) -> None:
+    """ Move file, symbolic link or directory with replace, os.replace by
+    default. If they are on
+    different devices, src is copied into temporary path next to dst, which
+    is renamed into dst, and src is removed after that. So interrupted move
+    leaves either src alone, or complete src and dst. Copied bytes of each
+    file are charged to throttle, if it is given. """
+
+    try:
+        (replace or os.replace)(src, dst)
+        return
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+    dirname, name = os.path.split(dst)
+    tmppath = os.path.join(dirname, f'.{name}.yadupe-tmp')
+    if os.path.lexists(tmppath):
+        remove(tmppath)
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), tmppath)
+    elif os.path.isdir(src):
+        shutil.copytree(src, tmppath, symlinks=True, copy_function=_paced_copy(throttle))
+    else:
+        _paced_copy(throttle)(src, tmppath)
+    os.replace(tmppath, dst)
+    remove(src)
+
+
+def copy_files(pairs: typing.Iterable[typing.Tuple[str, str]],
+               workers: int = COPY_WORKERS, throttle=None) -> None:
+    """ Copy each (source, destination) pair, several files at once.
+    Destination directories are created. First raised exception is re-raised.
+    Each file waits for throttle, if it is given. """
+
+    pairs = list(pairs)
+    for dirname in {os.path.dirname(dst) for _, dst in pairs}:
+        os.makedirs(dirname, exist_ok=True)
+
+    def copy_pair(pair):
+        if throttle:
+            throttle.io(1, os.path.getsize(pair[0]))
+        copy_file(*pair)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(copy_pair, pairs):
+            pass
@@ -1,25 +1,50 @@
 """
-Recursively scan one or more given directories for duplicate files. 
+Recursively scan one or more given directories for duplicate files.
 Found duplicates list could be saved into report or printed out in console.
 
-Also, duplicates could be moved into destination directory in safe way, 
-preserving it relative path. In this case file name is written in the report, 
+Also, duplicates could be moved into destination directory in safe way,
+preserving it relative path. In this case file name is written in the report,
 as well as new path for the file.
-If empty sub-directories turn up after duplicates removal, the could be 
+If empty sub-directories turn up after duplicates removal, the could be
 deleted as well.
 
 """
 
 import sys
 import os
+import time
+import errno
+import heapq
+import queue
 import typing
-from .hashutils import SimpleKey, get_simple_key, hash_file
-from collections import deque
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from .hashutils import SimpleKey, HashCache, get_simple_key, hash_file, partial_hash_file, \
+    hash_sparse_file, hash_small_files, EMPTY_DIGEST, SMALL_FILE_SIZE, DEFAULT_ALGORITHM, \
+    PARTIAL_HASH_SIZE
+from .chunkutils import ChunkIndex
+from .filterutils import SeenFilter
+from .treeutils import DirGroup, duplicate_dirs, covered_files, save_dir_duplicates
+from . import imageutils
+from . import archiveutils
+from . import ioscheduler
+from .walkutils import WalkFilter, walk_files
+from . import journalutils
+from . import copyutils
+from .throttle import Throttle, set_priority
+from .checksums import ChecksumHasher
+from .bucketutils import SizeBuckets
+from .keeputils import DEFAULT_POLICY, make_keeper
+from .fsbackend import LOCAL, is_local
+from .indexutils import FileRecord, dump_record, load_records, add_records
+from . import agent
+from collections import deque, Counter
 from itertools import count
 
 
 __all__ = ['Settings', 'NamedPath',
-           'FilepathDict', 'HookWrapper', 'deduplicate']
+           'FilepathDict', 'HookWrapper', 'deduplicate', 'merge']
 
 
 class Settings(typing.NamedTuple):
@@ -29,37 +54,74 @@ class Settings(typing.NamedTuple):
     source: typing.List[str]  # path to scan
     remove_empty: bool        # remove empty sub folders after deduplication (op_dedup == True only)
     op_test: bool             # test mode: only report, no real file moving
+    op_chunks: bool = False   # chunk analysis: report bytes shared at content-defined chunk level
+    filter_build: str = None  # path to save filter of source files into
+    filter_against: str = None  # path to filter to check source files against
+    reference: typing.List[str] = None  # read-only paths: files duplicating them are processed
+    hash_cache: str = None    # path to persistent file hash cache
+    agents: typing.List[str] = None  # HOST:PORT addresses of remote agents to merge (search mode only)
+    shard: typing.Tuple[int, int] = None  # (index, count): process only this size partition
+    op_dirs: bool = False     # report and move identical directories as single units
+    image_hash: str = None    # perceptual hash method: search similar images instead of identical files
+    image_distance: int = imageutils.DEFAULT_DISTANCE  # max Hamming distance of similar images
+    archives: bool = False    # search zip and tar members too, members are never moved
+    sparse: bool = False      # hash files skipping their holes
+    incremental: bool = False  # hash only appended blocks of grown files (hash_cache required)
+    time_budget: float = None  # seconds to spend on hashing, largest savings first
+    byte_budget: int = None   # bytes to hash, largest savings first
+    parallel: bool = False    # hash files in parallel with per-device workers
+    ordered: bool = False     # hash files in physical order of their first blocks
+    pipeline: bool = False    # hash same sized files in worker threads while walking
+    include: typing.List[str] = None  # file name or relative path patterns to scan
+    exclude: typing.List[str] = None  # file or directory patterns to skip, dirs are not walked
+    min_size: int = None      # skip files smaller than min_size bytes
+    max_size: int = None      # skip files larger than max_size bytes
+    one_file_system: bool = False  # do not descend into other file systems under source
+    resume: bool = False      # finish interrupted duplicates move from journal in dest_path
+    undo: bool = False        # move journaled duplicates back from dest_path
+    copy: bool = False        # copy uniques into dest_path tree, sources are left intact
+    max_read_rate: int = None  # bytes per second to read, shared by walk, hash and move
+    max_iops: int = None      # I/O operations per second, shared by walk, hash and move
+    nice: int = None          # CPU priority increment
+    ionice: str = None        # I/O priority class: 'best-effort' (lowest level) or 'idle'
+    algorithm: str = DEFAULT_ALGORITHM  # hashlib algorithm of file digests
+    checksums: typing.List[str] = None  # trusted digest sources: 'xattr', 'sidecar', 'bagit'
+    write_checksums: bool = False  # write computed digests into xattrs
+    keep: str = DEFAULT_POLICY  # which copy of duplicates to keep: 'device', 'oldest', 'links', 'root'
+    keep_root: typing.List[str] = None  # preferred roots of kept copies for 'root' policy
+    backend: object = None    # file system backend of scan, hash, move and purge, local if None
+    merge: bool = False       # merge partial indexes of shard workers, given as source, into report
 
 
 class HookWrapper(object):
-    """ Wrapper class for some useful hook function, available for progress measuring. 
+    """ Wrapper class for some useful hook function, available for progress measuring.
 
     beforescanhook    - callable that will be called once at the beginning of duplicate search
-                        in given source paths. The callable will be passed one argument: total 
+                        in given source paths. The callable will be passed one argument: total
                         number of source paths.
 
     pathscannedhook   - callable that will be called each time when another source path scanned.
                         The callable will be passed no arguments.
 
-    beforemovehook    - callable that will be called once at the beginning of duplicate 
+    beforemovehook    - callable that will be called once at the beginning of duplicate
                         file moving.
-                        The callable will be passed one arguments: total number of found 
+                        The callable will be passed one arguments: total number of found
                         groups of duplicates.
 
     groupmovedhook    - callable that will be called each time when group of duplicates
                         will be moved into destination.
                         The callable will be passed no arguments.
 
-    beforepurgehook   - callable that will be called once before starting purge of 
+    beforepurgehook   - callable that will be called once before starting purge of
                         source paths.
                         The callable will be passed no arguments.
 
-    afterpurgedhook   - callable that will be called once after finishing purge of 
+    afterpurgedhook   - callable that will be called once after finishing purge of
                         source paths.
                         The callable will be passed no arguments.
 
     beforereporthook  - callable that will be called once at the beginning of report save.
-                        The callable will be passed one arguments: total number of found 
+                        The callable will be passed one arguments: total number of found
                         groups of duplicates.
 
     groupreportedhook - callable that wil be called each time after report another
@@ -80,9 +142,11 @@ class HookWrapper(object):
 
 
 class NamedPath(typing.NamedTuple):
-    """ File name and it's duplicate path list. """
+    """ File name and it's duplicate path list.
+    First kept paths are left in place, when duplicates are moved. """
     name: str
     path: typing.List[str]
+    kept: int = 1
 
     def __eq__(self, other):
         if self.name != other.name:
@@ -103,21 +167,41 @@ class NamedPath(typing.NamedTuple):
     @first_path.setter
     def first_path(self, value):
         self.path[0] = value
-    
+
 
 
 class _SimilarFiles(object):
-    """ File path dictionary-based container, indexed by file content hash. 
-    First added path stored w/o hashing.
-    It will be hashed only on adding second path.
+    """ File path dictionary-based container, indexed by file content hash.
+    Added pathes stored w/o hashing.
+    They will be hashed only on first enumeration, if there are at least two of them.
     So finally each key contains pathes for binary identical files.
+
+    In reference mode, pathes could be marked as reference ones. Such pathes are
+    never moved, and pathes are hashed only if there are reference and
+    non-reference pathes together.
+
+    Path could be added with already known digest, e.g. calculated by remote agent.
+
+    Keeper, if given, chooses the path kept of duplicates (see keeputils),
+    otherwise the first added path is kept.
     """
 
-    def __init__(self, value: str):
-        key = hash_file(value)
+    def __init__(self, value: str, reference: bool = False,
+                 hasher: typing.Callable = hash_file,
+                 reference_mode: bool = False,
+                 digest: str = None,
+                 keeper: typing.Callable = None):
+        self._hasher_ = hasher
+        self._keeper_ = keeper
+        self._reference_mode_ = reference_mode
+        self._reference_ = set()
+        self._pinned_ = set()
+        self._preferred_ = set()
+        self._kept_ = set()
+        self._digests_ = {}
+        self._pending_ = []
         self._pathes_ = {}
-        self._pathes_[key] = NamedPath(os.path.basename(value), [value])
-
+        self.add(value, reference, digest)
 
     def _add_(self, key: str, value: str):
         if key in self._pathes_.keys():
@@ -125,48 +209,229 @@ class _SimilarFiles(object):
         else:
             self._pathes_[key] = NamedPath(os.path.basename(value), [value])
 
+    def add(self, extra_path: str, reference: bool = False, digest: str = None) -> None:
+        if reference:
+            self._reference_.add(extra_path)
+        if digest is not None:
+            self._digests_[extra_path] = digest
+        self._pending_.append(extra_path)
 
-    def add(self, extra_path: str) -> None:
-        new_key = hash_file(extra_path)
-        self._add_(new_key, extra_path)
+    def __len__(self):
+        return len(self._pending_) + sum(len(group.path) for group in self._pathes_.values())
 
+    def unhashed(self, uniques: bool = False, pinned: bool = True) -> typing.List[str]:
+        """ Return pending pathes with unknown digest, which are to be hashed.
+        Pinned pathes (archive members) are skipped, if pinned is False. """
 
-    def duplicates(self) -> typing.Iterator[NamedPath]:
-        """ Iterator, return each list of file path with equivalent hash values."""
+        if not self._needs_hashing_(uniques):
+            return []
+        return [path for path in self._pending_ if path not in self._digests_
+                and (pinned or path not in self._pinned_)]
+
+    def add_digests(self, digests: typing.Dict[str, str]) -> None:
+        """ Set known digests of pending pathes, e.g. hashed in parallel. """
+
+        self._digests_.update((path, digests[path]) for path in self._pending_
+                              if path in digests)
+
+    def _needs_hashing_(self, uniques: bool = False) -> bool:
+        """ Return True, if there could be duplicates among pending pathes.
+        In reference mode duplicates are searched only between reference and
+        non-reference pathes, uniques - among non-reference pathes. """
 
-        for key in self._pathes_.keys():
-            if len(self._pathes_[key].path) > 1:
-                yield self._pathes_[key]
+        if not self._pending_:
+            return False
+        total = len(self)
+        if total < 2:
+            return False
+        if self._reference_mode_:
+            if len(self._reference_) == total:
+                return False
+            if not self._reference_ and not uniques:
+                return False
+        return True
 
+    def _resolve_(self, uniques: bool = False) -> None:
+        """ Hash pending pathes, if there could be duplicates among them. """
+
+        if not self._needs_hashing_(uniques):
+            return
+        self._hash_pending_()
+
+    def _hash_pending_(self) -> None:
+        for path in self._pending_:
+            digest = self._digests_.pop(path, None)
+            self._add_(digest if digest is not None else self._hasher_(path), path)
+        self._pending_ = []
+
+    def find(self, digest: str, exclude: str = None) -> typing.Optional[str]:
+        """ Return the first path with given digest other than exclude, None if
+        there is no such path. Pending pathes are hashed, even single one. """
+
+        self._hash_pending_()
+        group = self._pathes_.get(digest)
+        if group is None:
+            return None
+        return next((path for path in group.path if path != exclude), None)
+
+    def _ordered_(self, group: NamedPath, keep: bool = False) -> NamedPath:
+        """ Put reference and pinned pathes first and keep all of them.
+        Otherwise, if keep is set, put the path chosen by keeper first. """
+
+        if self._reference_mode_ or self._pinned_:
+            reference = [path for path in group.path if path in self._reference_]
+            reference += [path for path in group.path
+                          if path in self._pinned_ and path not in self._reference_]
+            if reference:
+                other = [path for path in group.path
+                         if path not in self._reference_ and path not in self._pinned_]
+                return NamedPath(os.path.basename(reference[0]), reference + other,
+                                 len(reference))
+        if not keep or self._keeper_ is None or len(group.path) < 2 \
+                or group.first_path in self._kept_:
+            return group
+        # preferred pathes (e.g. of kept directories) stay first whatever the policy is
+        candidates = [path for path in group.path if path in self._preferred_] or group.path
+        kept = self._keeper_(candidates)
+        self._kept_.add(kept)
+        if kept == group.first_path:
+            return group
+        other = [path for path in group.path if path != kept]
+        return NamedPath(os.path.basename(kept), [kept] + other, group.kept)
+
+    def _groups_(self, uniques: bool = False) -> typing.Iterator[NamedPath]:
+        self._resolve_(uniques)
+        for key in list(self._pathes_.keys()):
+            group = self._ordered_(self._pathes_[key], keep=not uniques)
+            self._pathes_[key] = group
+            yield group
+        for path in self._pending_:
+            yield NamedPath(os.path.basename(path), [path])
+
+    def duplicates(self) -> typing.Iterator[NamedPath]:
+        """ Iterator, return each list of file path with equivalent hash values.
+        In reference mode only groups with reference and non-reference pathes are returned. """
+
+        for group in self._groups_():
+            if len(group.path) > 1:
+                if self._reference_mode_ and (group.first_path not in self._reference_
+                                              or group.kept == len(group.path)):
+                    continue
+                yield group
 
     def uniques(self) -> typing.Iterator[NamedPath]:
-        """ Iterator, return one path for each unique hash value. """
-        for key in self._pathes_.keys():
-            yield self._pathes_[key]
+        """ Iterator, return one path for each unique hash value.
+        In reference mode groups with reference pathes are skipped. """
+
+        for group in self._groups_(uniques=True):
+            if self._reference_mode_ and group.first_path in self._reference_:
+                continue
+            yield group
+
+    def discard(self, filepaths: typing.Set[str]) -> None:
+        """ Remove given pathes from the container. """
+
+        for key in list(self._pathes_.keys()):
+            group = self._pathes_[key]
+            group.path[:] = [path for path in group.path if path not in filepaths]
+            if not group.path:
+                del self._pathes_[key]
+        self._pending_ = [path for path in self._pending_ if path not in filepaths]
+
+    def prefer(self, filepaths: typing.Set[str]) -> None:
+        """ Put given pathes first, so they are kept when duplicates are moved. """
+
+        for group in self._pathes_.values():
+            group.path.sort(key=lambda path: path not in filepaths)
+            self._preferred_.update(path for path in group.path if path in filepaths)
+        self._pending_.sort(key=lambda path: path not in filepaths)
+        self._preferred_.update(path for path in self._pending_ if path in filepaths)
+
+    def pin(self, filepaths: typing.Set[str]) -> None:
+        """ Put given pathes first and never move them, e.g. archive members. """
+
+        self._pinned_.update(path for path in self._pending_ if path in filepaths)
+        for group in self._pathes_.values():
+            self._pinned_.update(path for path in group.path if path in filepaths)
+
+    def digest_of(self, group: NamedPath) -> typing.Optional[str]:
+        """ Return digest of the group returned by duplicates() or uniques(). """
+
+        for key, value in self._pathes_.items():
+            if value is group:
+                return key
+        return None
+
+    def digests(self) -> typing.Iterator[typing.Tuple[str, str]]:
+        """ Iterator, return (path, digest) for each path.
+        Digest is None for the path which has no same sized pathes. """
+
+        self._resolve_(uniques=True)
+        for key, group in self._pathes_.items():
+            for path in group.path:
+                yield path, key
+        for path in self._pending_:
+            yield path, self._digests_.get(path)
 
     def __eq__(self, other):
+        self._resolve_(uniques=True)
+        other._resolve_(uniques=True)
         if not len(self._pathes_.keys()) == len(other._pathes_.keys()):
             return False
-        return self._pathes_ == other._pathes_
+        return self._pathes_ == other._pathes_ and self._pending_ == other._pending_
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
 
 class FilepathDict(dict):
-    """ Customized dictionary contains pairs {file-key : file-path-info}. 
+    """ Customized dictionary contains pairs {file-key : file-path-info}.
     file-key - simple file key (size based)
     file-path-info - object with multiply appropriate file path
+
+    hasher         - callable to get file content hash by file path.
+    reference_mode - only files duplicating reference ones are reported and moved.
+    keeper         - callable to choose the kept path of duplicates, None to keep the first one.
     """
 
+    def __init__(self, hasher: typing.Callable = hash_file, reference_mode: bool = False,
+                 keeper: typing.Callable = None):
+        super().__init__()
+        self.hasher = hasher
+        self.reference_mode = reference_mode
+        self.keeper = keeper
+        self.dropped = 0
+
     def __setitem__(self, key, value):
-        """ The very first value with associated key must be added, 
+        """ The very first value with associated key must be added,
         subsequent values will be appened to exist value. """
 
+        self.add(key, value)
+
+    def add(self, key, value: str, reference: bool = False, digest: str = None):
+        if digest is None and key.size == 0:
+            # all empty files are the same, they are never opened
+            digest = EMPTY_DIGEST
         if not key in self:
-            super().__setitem__(key, _SimilarFiles(value))
+            super().__setitem__(key, _SimilarFiles(value, reference, self.hasher,
+                                                   self.reference_mode, digest, self.keeper))
         else:
-            super().__getitem__(key).add(value)
+            super().__getitem__(key).add(value, reference, digest)
+
+    def lookup(self, size: int, digest: str, exclude: str = None) -> typing.Optional[str]:
+        """ Return path of a file with given size and digest other than exclude,
+        None if there is no such file. Only files of the same size are hashed,
+        if not yet. """
+
+        key = SimpleKey.create(size)
+        if key not in self:
+            return None
+        return self[key].find(digest, exclude)
+
+    def _save_budget_note_(self, target):
+        if self.dropped:
+            print(f'Budget exhausted: {self.dropped} groups of same sized files '
+                  f'were not checked.', file=target)
 
     def _save_duplicates_(self, target, hooks=HookWrapper()):
         if hooks.beforereporthook and hooks.groups_count_cache > 0:
@@ -182,6 +447,7 @@ class FilepathDict(dict):
                 print('', file=target)
                 if hooks.groupreportedhook:
                     hooks.groupreportedhook()
+        self._save_budget_note_(target)
         print('End of list.', file=target)
 
     def print_duplicates(self, hooks=HookWrapper()):
@@ -202,6 +468,7 @@ class FilepathDict(dict):
                 print(f'{unique.first_path}', file=target)
                 if hooks.groupreportedhook:
                     hooks.groupreportedhook()
+        self._save_budget_note_(target)
         print('End of list.', file=target)
 
     def print_uniques(self, hooks=HookWrapper()):
@@ -232,97 +499,713 @@ class FilepathDict(dict):
             total_cnt += FilepathDict._iter_len(self[sk].uniques())
         return total_cnt
 
+    def discard(self, filepaths: typing.Set[str]) -> None:
+        """ Remove given file pathes, e.g. moved together with their directory. """
+        for sk in list(self.keys()):
+            self[sk].discard(filepaths)
+            if not len(self[sk]):
+                del self[sk]
+
+    def prefer(self, filepaths: typing.Set[str]) -> None:
+        """ Put given file pathes first in their groups, so they are kept. """
+        for sk in self.keys():
+            self[sk].prefer(filepaths)
+
+    def hash_small(self, limit: int = SMALL_FILE_SIZE, uniques: bool = False,
+                   hash_cache: HashCache = None) -> None:
+        """ Hash files smaller than limit at once with hash_small_files.
+        Their digests are the same as hash_file ones. Archive members are
+        left to the hasher. If hash_cache is given, cached digests are used
+        and new ones are stored into it. """
+
+        pathes = [path for sk in self.keys() if sk.size < limit
+                  for path in self[sk].unhashed(uniques, pinned=False)]
+        digests = {}
+        stats = {}
+        if hash_cache:
+            for path in pathes:
+                try:
+                    stats[path] = os.stat(path)
+                except OSError:
+                    continue
+                digest = hash_cache.get(path, stats[path])
+                if digest is not None:
+                    digests[path] = digest
+            pathes = [path for path in stats if path not in digests]
+        hashed = hash_small_files(pathes)
+        if hash_cache:
+            for path, digest in hashed.items():
+                hash_cache.put(path, stats[path], digest)
+        digests.update(hashed)
+        for sk in self.keys():
+            if sk.size < limit:
+                self[sk].add_digests(digests)
+
+    def hash_pending(self, hash_map: typing.Callable = ioscheduler.map_by_device,
+                     uniques: bool = False) -> None:
+        """ Hash all pathes to be hashed at once with hash_map(hasher, pathes),
+        which returns {path: digest}, e.g. in parallel. """
+
+        pathes = [path for sk in self.keys() for path in self[sk].unhashed(uniques)]
+        digests = hash_map(self.hasher, pathes)
+        for sk in self.keys():
+            self[sk].add_digests(digests)
+
+    def resolve_within_budget(self, time_budget: float = None, byte_budget: int = None,
+                              hash_map: typing.Callable = None, uniques: bool = False) -> int:
+        """ Hash groups of same sized files in order of expected savings,
+        size * (count - 1), until time or bytes budget is exhausted.
+        Groups left unchecked are removed, so the rest is complete and consistent.
+        Keys are reordered by savings as well. Return number of removed groups.
+        If hash_map is given, files of each group are hashed with it.
+        The time budget covers hashing only, moving files and writing the
+        report afterwards are not limited. """
+
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        hashed = 0
+        exhausted = False
+        keys = sorted(self.keys(), key=lambda sk: sk.size * (len(self[sk]) - 1), reverse=True)
+        ordered = []
+        for sk in keys:
+            group = self[sk]
+            if len(group) > 1:
+                cost = sk.size * len(group)
+                if deadline is not None and time.monotonic() >= deadline:
+                    exhausted = True
+                if exhausted or (byte_budget is not None and hashed + cost > byte_budget):
+                    # smaller groups still could fit into the bytes budget
+                    self.dropped += 1
+                    continue
+                if hash_map:
+                    group.add_digests(hash_map(self.hasher, group.unhashed(uniques)))
+                group._resolve_(uniques)
+                hashed += cost
+            ordered.append((sk, group))
+        self.clear()
+        for sk, group in ordered:
+            super().__setitem__(sk, group)
+        return self.dropped
+
+    def pin(self, filepaths: typing.Set[str]) -> None:
+        """ Keep given file pathes in place, they are never moved. """
+        for sk in self.keys():
+            self[sk].pin(filepaths)
+
+    def records(self) -> typing.Iterator[FileRecord]:
+        """ Iterator, return record for each file, same sized files are hashed. """
+        for sk in self.keys():
+            for filepath, digest in self[sk].digests():
+                yield FileRecord(sk.size, filepath, digest)
+
 
 def _append_filename_id_(filename: str, id: int):
     name, ext = os.path.splitext(filename)
     return "{name}_{uid}{ext}".format(name=name, uid=id, ext=ext)
 
 
-def _scan_duplicates(rootpath: str, files_dict: dict):
-    """ Scan rootpath for duplicates. """
+def _shard_of(size: int, count: int) -> int:
+    """ Return partition index for file size. Same sized files are always in
+    the same partition, sizes are spread evenly by multiplicative hashing. """
+
+    return ((size * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * count >> 64
+
+
+def _walk_filter(settings: Settings, throttle: Throttle = None) -> WalkFilter:
+    return WalkFilter(settings.include, settings.exclude, settings.min_size,
+                      settings.max_size, settings.one_file_system, throttle,
+                      _backend(settings), track_tree=settings.op_dirs)
+
+
+def _backend(settings: Settings):
+    return settings.backend or LOCAL
+
+
+def _make_throttle(settings: Settings) -> typing.Optional[Throttle]:
+    """ Return limiter shared by walk, hash and move phases, None if unlimited. """
+
+    if settings.max_read_rate is None and settings.max_iops is None:
+        return None
+    return Throttle(settings.max_read_rate, settings.max_iops)
+
+
+def _make_keeper(settings: Settings) -> typing.Optional[typing.Callable]:
+    """ Return keeper of duplicates for settings, None if nothing is moved. """
+
+    if not settings.op_dedup:
+        return None
+    return make_keeper(settings.keep, settings.dest_path, settings.keep_root,
+                       _backend(settings).stat)
+
+
+def _scan_duplicates(rootpath: str, files_dict: dict, reference: bool = False,
+                     shard: typing.Tuple[int, int] = None, members: list = None,
+                     walk_filter: WalkFilter = None, buckets: SizeBuckets = None):
+    """ Scan rootpath for duplicates.
+    If shard (index, count) is given, only files of this size partition are added.
+    If members list is given, (member, reference) for each archive member is appended.
+    If buckets are given, files are collected into them instead of files_dict. """
+
+    if not os.path.isabs(rootpath):
+        rootpath = os.path.abspath(rootpath)
+    for absfilename, size in walk_files(rootpath, walk_filter):
+        if shard and _shard_of(size, shard[1]) != shard[0]:
+            continue
+        if buckets is not None:
+            buckets.add(absfilename, size, reference)
+            continue
+        files_dict.add(SimpleKey.create(size), absfilename, reference)
+        if members is not None and archiveutils.is_archive(absfilename):
+            members.extend((member, reference)
+                           for member in archiveutils.iter_members(absfilename))
+
+
+PIPELINE_QUEUE_SIZE = 1024
+PIPELINE_HASH_JOBS = 256
+PIPELINE_WORKERS = 4
+
+
+def _walk_files(roots: typing.List[typing.Tuple[str, bool]], files: queue.Queue,
+                walk_filter: WalkFilter = None):
+    """ Pipeline producer: put ('file', (path, size, reference)) for each file,
+    ('root', path) after each root, then ('end', None) or ('error', exception). """
+
+    try:
+        for rootpath, reference in roots:
+            for absfilename, size in walk_files(rootpath, walk_filter):
+                files.put(('file', (absfilename, size, reference)))
+            files.put(('root', rootpath))
+        files.put(('end', None))
+    except Exception as ex:
+        files.put(('error', ex))
+
+
+def _scan_pipelined(roots: typing.List[typing.Tuple[str, bool]], files_dict: FilepathDict,
+                    uniques: bool = False, hooks=HookWrapper(), walk_filter: WalkFilter = None):
+    """ Scan (rootpath, reference) roots for duplicates. Roots are walked in
+    producer thread, files of each size are hashed in worker threads as soon
+    as they could have duplicates, while walking continues. Queues are bounded:
+    walker waits for bucketing, bucketing waits for hashing. Digests are
+    stored as jobs finish, so at most PIPELINE_HASH_JOBS are kept in flight. """
+
+    files = queue.Queue(PIPELINE_QUEUE_SIZE)
+    results = queue.SimpleQueue()
+    walker = threading.Thread(target=_walk_files, args=(roots, files, walk_filter),
+                              daemon=True)
+    walker.start()
+
+    def hash_job(key: SimpleKey, filepath: str) -> None:
+        try:
+            results.put((key, filepath, files_dict.hasher(filepath), None))
+        except BaseException as error:
+            results.put((key, filepath, None, error))
+
+    pending = 0
+
+    def collect(wait: bool = False) -> None:
+        """ Store digests of finished jobs, wait for one at least, if wait is set. """
+        nonlocal pending
+        while pending:
+            try:
+                key, filepath, digest, error = results.get(block=wait)
+            except queue.Empty:
+                return
+            wait = False
+            pending -= 1
+            if error is not None:
+                raise error
+            files_dict[key].add_digests({filepath: digest})
+
+    active = set()
+    with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as executor:
+        while True:
+            kind, item = files.get()
+            if kind == 'end':
+                break
+            if kind == 'error':
+                raise item
+            if kind == 'root':
+                if hooks.pathscannedhook:
+                    hooks.pathscannedhook()
+                continue
+            filepath, size, reference = item
+            key = SimpleKey.create(size)
+            files_dict.add(key, filepath, reference)
+            if key in active:
+                candidates = [filepath]
+            else:
+                candidates = files_dict[key].unhashed(uniques)
+                if candidates:
+                    active.add(key)
+            for path in candidates:
+                while pending >= PIPELINE_HASH_JOBS:
+                    collect(wait=True)
+                executor.submit(hash_job, key, path)
+                pending += 1
+            collect()
+        while pending:
+            collect(wait=True)
+    walker.join()
+
+
+def _add_archive_members(files_dict: dict, members: list,
+                         hasher: archiveutils.ArchiveHasher):
+    """ Add archive members into files_dict and pin them: members are never moved.
+    Only members of colliding sizes are hashed, zip members with unique CRC
+    are not read at all. """
+
+    sizes = Counter({sk.size: len(files_dict[sk]) for sk in files_dict.keys()})
+    known = archiveutils.crc_prefilter([member for member, _ in members], sizes)
+    sizes.update(member.size for member, _ in members)
+    for member, reference in members:
+        digest = known.get(member.path)
+        hasher.add(member, wanted=digest is None and sizes[member.size] > 1)
+        files_dict.add(SimpleKey.create(member.size), member.path, reference, digest)
+    files_dict.pin({member.path for member, _ in members})
+
+
+def _make_hasher(settings: Settings, hash_cache: HashCache = None,
+                 throttle: Throttle = None) -> typing.Callable:
+    """ Return file hash function for settings, cached if hash_cache is given
+    and paced by throttle if it is given. Trusted digests are taken from
+    checksum sources, if they are set. Files are read by settings backend. """
+
+    if settings.incremental:
+        # only read blocks are paced, not the whole grown file
+        return hash_cache.incremental_hasher(throttle.open) if throttle \
+            else hash_cache.incremental_hasher()
+    if settings.sparse:
+        hash_function = partial(hash_sparse_file, opener=throttle.open) if throttle \
+            else hash_sparse_file
+    else:
+        hash_function = throttle.hash_file if throttle else hash_file
+        options = {}
+        if settings.algorithm != DEFAULT_ALGORITHM:
+            options['algorithm'] = settings.algorithm
+        if not is_local(settings.backend):
+            options['opener'] = settings.backend.open
+        if options:
+            hash_function = partial(hash_function, **options)
+    if settings.checksums or settings.write_checksums:
+        hash_function = ChecksumHasher(settings.checksums or [], settings.algorithm,
+                                       hash_function, settings.write_checksums)
+    if hash_cache:
+        namespace = 'sparse:' if settings.sparse else ''
+        if settings.algorithm != DEFAULT_ALGORITHM:
+            namespace = f'{settings.algorithm}:'
+        return hash_cache.hasher(hash_function, namespace=namespace)
+    return hash_function
+
+
+def _partial_index_name(shard: typing.Tuple[int, int]) -> str:
+    return f'index-{shard[0]}-of-{shard[1]}.jsonl'
+
+
+def _scan_shard(settings: Settings, hooks=HookWrapper(), throttle: Throttle = None) -> str:
+    """ Scan and hash files of one size partition, save partial index into
+    destination dir. Return partial index path. """
+
+    hash_cache = HashCache(settings.hash_cache) if settings.hash_cache else None
+    file_data_dict = FilepathDict(hasher=_make_hasher(settings, hash_cache, throttle))
+    if hooks.beforescanhook:
+        hooks.beforescanhook(len(settings.source))
+    for el in settings.source:
+        _scan_duplicates(os.path.abspath(el), file_data_dict, shard=settings.shard,
+                         walk_filter=_walk_filter(settings, throttle))
+        if hooks.pathscannedhook:
+            hooks.pathscannedhook()
+
+    filepath = os.path.join(os.path.abspath(settings.dest_path),
+                            _partial_index_name(settings.shard))
+    with open(filepath, 'wt', encoding='utf-8', errors='surrogateescape') as fileout:
+        for record in file_data_dict.records():
+            dump_record(record, fileout)
+    if hash_cache:
+        hash_cache.save()
+    return filepath
+
+
+def merge(partials: typing.List[str], dest_path: str = None, hooks=HookWrapper()) -> FilepathDict:
+    """ Merge partial indexes saved by shard workers, report duplicates. """
+
+    file_data_dict = FilepathDict()
+    if hooks.beforescanhook:
+        hooks.beforescanhook(len(partials))
+    for filepath in partials:
+        with open(filepath, 'rt', encoding='utf-8', errors='surrogateescape') as filein:
+            add_records(file_data_dict, load_records(filein))
+        if hooks.pathscannedhook:
+            hooks.pathscannedhook()
+
+    if dest_path:
+        file_data_dict.save_duplicates(filepath=os.path.join(os.path.abspath(dest_path),
+                                                             'report.txt'), hooks=hooks)
+    else:
+        file_data_dict.print_duplicates(hooks=hooks)
+    return file_data_dict
+
+
+def _scan_chunks(rootpath: str, chunk_index: ChunkIndex, walk_filter: WalkFilter = None):
+    """ Split each file in rootpath into chunks, add them into index. """
+
+    if not os.path.isabs(rootpath):
+        rootpath = os.path.abspath(rootpath)
+    for absfilename, _ in walk_files(rootpath, walk_filter):
+        chunk_index.add_file(absfilename)
+
+
+def _analyse_chunks(settings: Settings, hooks=HookWrapper()):
+    """ Chunk analysis mode: report bytes shared by files and pairs of files. """
+
+    chunk_index = ChunkIndex()
+    if hooks.beforescanhook:
+        hooks.beforescanhook(len(settings.source))
+    for el in settings.source:
+        _scan_chunks(os.path.abspath(el), chunk_index, _walk_filter(settings))
+        if hooks.pathscannedhook:
+            hooks.pathscannedhook()
+
+    if settings.dest_path:
+        dest = os.path.abspath(settings.dest_path)
+        chunk_index.save(os.path.join(dest, 'chunks.idx'))
+        chunk_index.save_report(os.path.join(dest, 'report.txt'))
+    else:
+        chunk_index.print_report()
+
+
+def _scan_sizes(rootpath: str, files: list, walk_filter: WalkFilter = None):
+    """ Append (path, size) for each file in rootpath. """
 
     if not os.path.isabs(rootpath):
         rootpath = os.path.abspath(rootpath)
-    for dirpath, _, filenames in os.walk(rootpath):
-        for filename in filenames:
-            absfilename = os.path.join(dirpath, filename)
-            key = get_simple_key(absfilename)
-            files_dict[key] = absfilename
+    files.extend(walk_files(rootpath, walk_filter))
+
+
+def _scan_all_sizes(settings: Settings, hooks=HookWrapper()) -> list:
+    files = []
+    if hooks.beforescanhook:
+        hooks.beforescanhook(len(settings.source))
+    for el in settings.source:
+        _scan_sizes(os.path.abspath(el), files, _walk_filter(settings))
+        if hooks.pathscannedhook:
+            hooks.pathscannedhook()
+    return files
+
+
+def _full_digest(filepath: str, size: int, partial_digest: str) -> str:
+    """ Return full hash of the file. Partial hash of small file already
+    covers all of its content and is the same, so file is not read again. """
+
+    if size <= PARTIAL_HASH_SIZE:
+        return partial_digest
+    return hash_file(filepath)
+
+
+def _build_filter(settings: Settings, hooks=HookWrapper()):
+    """ Save filter of all files in sources, to check other files against it later. """
+
+    files = _scan_all_sizes(settings, hooks)
+    seen_filter = SeenFilter.create(len(files))
+    for filepath, size in files:
+        partial_digest = partial_hash_file(filepath)
+        seen_filter.add(size, partial_digest, _full_digest(filepath, size, partial_digest))
+    seen_filter.save(settings.filter_build)
+
+
+def _save_seen_(seen: list, target):
+    print('Seen list:', file=target)
+    for filepath, size in seen:
+        print(f'Filename: {os.path.basename(filepath)}', file=target)
+        print(f'Size: {size} byte', file=target)
+        print(f'{filepath}', file=target)
+        print('', file=target)
+    print('End of list.', file=target)
+
+
+def _check_against_filter(settings: Settings, hooks=HookWrapper()) -> list:
+    """ Report source files already present in the filter.
+    Full hash is calculated only for files passed partial hash check. """
+
+    seen_filter = SeenFilter.load(settings.filter_against)
+    seen = []
+    for filepath, size in _scan_all_sizes(settings, hooks):
+        partial_digest = partial_hash_file(filepath)
+        if not seen_filter.may_contain(size, partial_digest):
+            continue
+        if seen_filter.contains(size, _full_digest(filepath, size, partial_digest)):
+            seen.append((filepath, size))
+
+    if settings.dest_path:
+        with open(os.path.join(os.path.abspath(settings.dest_path), 'report.txt'), 'wt') as fileout:
+            _save_seen_(seen, fileout)
+    else:
+        _save_seen_(seen, sys.stdout)
+    return seen
+
+
+def _dest_group_name(name: str, name_check_dict: dict) -> str:
+    """ Return unique name for group of duplicates in destination dir. """
+
+    if name in name_check_dict.keys():
+        idx = name_check_dict[name]
+        shortname = _append_filename_id_(name, idx)
+        name_check_dict[name] += 1
+    else:
+        name_check_dict[name] = 1
+        shortname = name
+    return shortname
+
+
+def _replace(src: str, dst: str, backend=LOCAL, throttle: Throttle = None) -> None:
+    """ Move file or directory, data is copied if they are on different devices.
+    Copied bytes are charged to throttle, if it is given. """
+
+    copyutils.move(src, dst, backend.replace, throttle)
+
+
+def _move_dir_duplicates(dir_groups: typing.List[DirGroup],
+                         sources: typing.List[str],
+                         dest: str,
+                         testmode=False,
+                         name_check_dict: dict = None,
+                         moved_from: typing.Set[str] = None,
+                         journal: journalutils.Journal = None,
+                         throttle: Throttle = None,
+                         backend=LOCAL,
+                         move_map: typing.Callable = None):
+    """ Move each identical directory except the first one into new location
+    with single rename, log operation. Parent directories of moved ones are
+    added into moved_from set. Moves are recorded in journal, if given, and
+    done by move_map, if given (see _MoveBatch). """
+
+    if name_check_dict is None:
+        name_check_dict = {}
+
+    batch = _MoveBatch(testmode, moved_from, journal, throttle, backend, move_map)
+    for duplicates in dir_groups:
+        shortname = os.path.join(dest, _dest_group_name(duplicates.name, name_check_dict))
+        batch.mkdir(shortname)
+        if batch.journal:
+            batch.journal.group('dir', duplicates.name, duplicates.size, duplicates.path[:1],
+                                files=duplicates.files)
+
+        for idx in range(1, len(duplicates.path)):
+            dirpath = duplicates.path[idx]
+            for src in sources:
+                if src == os.path.commonpath([src, dirpath]):
+                    destpath = os.path.join(shortname, os.path.relpath(dirpath, src))
+                    # log directory move operation
+                    duplicates.path[idx] = f'{dirpath} -> {destpath}'
+                    batch.add(dirpath, destpath)
+                    break
+    batch.flush()
+    return dir_groups
+
+
+MOVE_BATCH_SIZE = 1024
+
+
+class _MoveBatch(object):
+    """ Pending file moves. Moves are done by batches in order of source
+    directory, each destination directory is created once.
+    If journal is given, planned moves are synced into it before batch is done,
+    and done moves - after. Each move waits for throttle, if given.
+    Directories are made and files are moved by backend.
+    Callbacks of finished groups are called once their moves are done.
+    If move_map is given, moves of the batch are done with it, e.g. by
+    per-device workers of ioscheduler.map_by_device keyed on source device:
+    move to another device is a full copy and remove (see copyutils.move),
+    so it is scheduled the same way as hashing. Otherwise moves are done one
+    by one in the calling thread. """
+
+    def __init__(self, testmode=False, moved_from: typing.Set[str] = None,
+                 journal: journalutils.Journal = None, throttle: Throttle = None,
+                 backend=LOCAL, move_map: typing.Callable = None):
+        self.testmode = testmode
+        self.journal = None if testmode else journal
+        self.throttle = throttle
+        self.backend = backend
+        self.move_map = move_map
+        self.moves: typing.List[typing.Tuple[str, str]] = []
+        self.done_callbacks: typing.List[typing.Callable] = []
+        self.made: typing.Set[str] = set()
+        self.moved_from = moved_from if moved_from is not None else set()
+
+    def mkdir(self, dirpath: str) -> None:
+        if not self.testmode:
+            self.backend.mkdir(dirpath)
+        self.made.add(dirpath)
+
+    def add(self, filepath: str, destpath: str) -> None:
+        if self.journal:
+            self.journal.move(filepath, destpath)
+        self.moves.append((filepath, destpath))
+        if len(self.moves) >= MOVE_BATCH_SIZE:
+            self.flush()
+
+    def end_group(self, callback: typing.Callable = None) -> None:
+        """ Mark all moves of the group added, callback is called after them. """
+        if callback:
+            self.done_callbacks.append(callback)
+
+    def flush(self) -> None:
+        self._move_()
+        callbacks, self.done_callbacks = self.done_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _move_(self) -> None:
+        moves, self.moves = self.moves, []
+        if self.testmode:
+            return
+        if self.journal:
+            self.journal.sync()
+        destpaths = dict(sorted(moves, key=lambda move: os.path.dirname(move[0])))
+        for destpath in destpaths.values():
+            dirname = os.path.dirname(destpath)
+            if dirname not in self.made:
+                self.backend.makedirs(dirname, exist_ok=True)
+                self.made.add(dirname)
+        done = []
+
+        def move(filepath: str) -> None:
+            if self.throttle:
+                self.throttle.io()
+            _replace(filepath, destpaths[filepath], self.backend, self.throttle)
+            done.append(filepath)
+
+        try:
+            if self.move_map:
+                self.move_map(move, list(destpaths))
+            else:
+                for filepath in destpaths:
+                    move(filepath)
+        finally:
+            # moves done before a failure are journaled as well
+            for filepath in done:
+                self.moved_from.add(os.path.dirname(filepath))
+                if self.journal:
+                    self.journal.done(filepath)
+            if self.journal:
+                self.journal.sync()
 
 
 def _move_duplicates(files_dict: dict,
                      sources: typing.List[str],
                      dest: str,
                      testmode=False,
-                     hooks=HookWrapper()):
-    """ Move duplicates into new location, log operation."""
-
-    name_check_dict = {}
+                     hooks=HookWrapper(),
+                     name_check_dict: dict = None,
+                     moved_from: typing.Set[str] = None,
+                     journal: journalutils.Journal = None,
+                     throttle: Throttle = None,
+                     backend=LOCAL,
+                     move_map: typing.Callable = None):
+    """ Move duplicates into new location, log operation.
+    Source directories of moved files are added into moved_from set.
+    Groups and moves are recorded in journal, if given. Moves are done by
+    move_map, if given (see _MoveBatch). """
+
+    if name_check_dict is None:
+        name_check_dict = {}
 
     if hooks.beforemovehook and hooks.groups_count_cache > 0:
         hooks.beforemovehook(hooks.groups_count_cache)
 
+    batch = _MoveBatch(testmode, moved_from, journal, throttle, backend, move_map)
     for sk in files_dict.keys():
         for duplicates in files_dict[sk].duplicates():
 
-            if duplicates.name in name_check_dict.keys():
-                idx = name_check_dict[duplicates.name]
-                shortname = _append_filename_id_(duplicates.name, idx)
-                name_check_dict[duplicates.name] += 1
-            else:
-                name_check_dict[duplicates.name] = 1
-                shortname = duplicates.name
-            shortname = os.path.join(dest, shortname)
-            if not testmode:
-                os.mkdir(shortname)
-
-            idx = 1
-            iters = iter(duplicates.path[1:])
-            for filepath in iters:
+            shortname = os.path.join(dest, _dest_group_name(duplicates.name, name_check_dict))
+            if duplicates.kept < len(duplicates.path):
+                batch.mkdir(shortname)
+            if batch.journal:
+                batch.journal.group('file', duplicates.name, sk.size,
+                                    duplicates.path[:duplicates.kept],
+                                    digest=files_dict[sk].digest_of(duplicates))
+
+            for idx in range(duplicates.kept, len(duplicates.path)):
+                filepath = duplicates.path[idx]
                 for src in sources:
                     if src == os.path.commonpath([src, filepath]):
                         destpath = os.path.relpath(filepath, src)
                         destpath = os.path.join(shortname, destpath)
-                        if not testmode:
-                            os.makedirs(os.path.dirname(
-                                destpath), exist_ok=True)
                         # log file move operation
-                        duplicates.path[idx] = f'{duplicates.path[idx]} -> {destpath}'
-                        idx += 1
+                        duplicates.path[idx] = f'{filepath} -> {destpath}'
                         # move file
-                        if not testmode:
-                            os.replace(filepath, destpath)
+                        batch.add(filepath, destpath)
                         break
-            if hooks.groupmovedhook:
-                hooks.groupmovedhook()
+            batch.end_group(hooks.groupmovedhook)
+    batch.flush()
     return files_dict
 
 
-def _remove_empty_subdirs(root=typing.List[str]):
-    """ Remove empty subdirs recursively. """
-
-    for dir in root:
-        for dirpath, dirnames, files in os.walk(dir):
-            if not (files or dirnames):
-                os.removedirs(dirpath)
+def _purge_dirs(candidates: typing.Iterable[str], roots: typing.List[str],
+                backend=LOCAL, throttle: Throttle = None) -> int:
+    """ Remove empty directories among candidates, e.g. emptied by moves, and
+    their parents, which become empty, bottom-up. Roots are never removed.
+    Cost depends on number of candidates, not on tree size. Each removal
+    waits for throttle, if it is given.
+    Return number of removed directories. """
+
+    roots = {os.path.abspath(root) for root in roots}
+    heap = [(-dirpath.count(os.sep), dirpath) for dirpath in set(candidates)]
+    heapq.heapify(heap)
+    seen = {dirpath for _, dirpath in heap}
+    removed = 0
+    while heap:
+        _, dirpath = heapq.heappop(heap)
+        if dirpath in roots:
+            continue
+        if throttle:
+            throttle.io()
+        try:
+            backend.rmdir(dirpath)
+        except OSError as ex:
+            if ex.errno in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                continue
+            raise
+        removed += 1
+        parent = os.path.dirname(dirpath)
+        if parent not in seen and parent != dirpath:
+            seen.add(parent)
+            heapq.heappush(heap, (-parent.count(os.sep), parent))
+    return removed
 
 
 def _move_uniques(files_dict: dict,
                 sources: typing.List[str],
                 dest: str,
                 testmode=False,
-                hooks=HookWrapper()):
-    """ Move uniques into new location, log operation."""
+                hooks=HookWrapper(),
+                moved_from: typing.Set[str] = None,
+                copy: bool = False,
+                throttle: Throttle = None,
+                backend=LOCAL,
+                move_map: typing.Callable = None):
+    """ Move uniques into new location, log operation.
+    Source directories of moved files are added into moved_from set.
+    Moves are done by move_map, if given (see _MoveBatch).
+    In copy mode uniques are copied into dest preserving their pathes relative
+    to source, several files at once. """
 
     name_check_dict = {}
+    copies = {}
+    batch = _MoveBatch(testmode, moved_from, throttle=throttle, backend=backend,
+                       move_map=move_map)
 
     if hooks.beforemovehook and hooks.groups_count_cache > 0:
         hooks.beforemovehook(hooks.groups_count_cache)
 
     for sk in files_dict.keys():
-        
+
         for unique in files_dict[sk].uniques():
 
+            if copy:
+                full_dest_name = _copy_dest_path(unique.first_path, sources, dest, copies)
+                copies[full_dest_name] = unique.first_path
+                unique.first_path = f'{unique.first_path} -> {full_dest_name}'
+                continue
+
             if unique.name in name_check_dict.keys():
                 idx = name_check_dict[unique.name]
                 short_dest_name = _append_filename_id_(unique.name, idx)
@@ -331,31 +1214,233 @@ def _move_uniques(files_dict: dict,
                 name_check_dict[unique.name] = 1
                 short_dest_name = unique.name
             full_dest_name = os.path.join(dest, short_dest_name)
-
-            if not testmode:
-                os.replace(unique.first_path, full_dest_name)
+            batch.add(unique.first_path, full_dest_name)
 
             # log file move operation
             unique.first_path = f'{unique.first_path} -> {full_dest_name}'
+            batch.end_group(hooks.groupmovedhook)
+
+    batch.flush()
+    if copies and not testmode:
+        copyutils.copy_files(((src, dst) for dst, src in copies.items()), throttle=throttle)
+    if hooks.groupmovedhook:
+        # copies are made at once, groups are done after all of them
+        for _ in copies:
+            hooks.groupmovedhook()
+    return files_dict
 
-            if hooks.groupmovedhook:
-                hooks.groupmovedhook()
 
-    return files_dict
+def _copy_dest_path(filepath: str, sources: typing.List[str], dest: str,
+                    taken: typing.Dict[str, str]) -> str:
+    """ Return path in dest for a copy of filepath, relative to its source.
+    Path taken by a file of another source or existing in dest already gets
+    numeric suffix, so nothing in dest is overwritten. """
 
+    relpath = os.path.basename(filepath)
+    for src in sources:
+        if src == os.path.commonpath([src, filepath]):
+            relpath = os.path.relpath(filepath, src)
+            break
+    destpath = os.path.join(dest, relpath)
+    idx = 1
+    while destpath in taken or os.path.lexists(destpath):
+        destpath = os.path.join(dest, _append_filename_id_(relpath, idx))
+        idx += 1
+    return destpath
 
-def deduplicate(settings: Settings, hooks=HookWrapper()):
-    file_data_dict = FilepathDict()
 
-    # search for duplicates
+def _scan_images(settings: Settings, hooks=HookWrapper()) -> FilepathDict:
+    """ Group similar images in sources by perceptual hash.
+    Each group is stored under its own key with common digest, so it is
+    reported and moved as group of duplicates. """
+
+    filepaths = []
     if hooks.beforescanhook:
         hooks.beforescanhook(len(settings.source))
-
     for el in settings.source:
-        _scan_duplicates(os.path.abspath(el), file_data_dict)
+        filepaths.extend(filepath for filepath, _ in walk_files(os.path.abspath(el),
+                                                                _walk_filter(settings))
+                         if imageutils.is_image(filepath))
         if hooks.pathscannedhook:
             hooks.pathscannedhook()
 
+    hashes = imageutils.hash_images(filepaths, settings.image_hash)
+    file_data_dict = FilepathDict(keeper=_make_keeper(settings))
+    for idx, group in enumerate(imageutils.similar_groups(hashes, settings.image_distance)):
+        key = imageutils.ImageKey(idx, get_simple_key(group[0]).size)
+        for filepath in group:
+            file_data_dict.add(key, filepath, digest=f'image:{idx}')
+    return file_data_dict
+
+
+def _find_dir_duplicates(files_dict: FilepathDict,
+                         sources: typing.List[str],
+                         keeper: typing.Callable = None,
+                         tree: dict = None) -> typing.List[DirGroup]:
+    """ Find identical directories, remove their files from files_dict,
+    except files of the first directory in each group, which are kept.
+    Kept directory is chosen by keeper, if given. Tree is directory listing
+    of the walk (WalkFilter.tree), directories with not scanned entries
+    are never identical. """
+
+    records = list(files_dict.records())
+    dir_groups = duplicate_dirs(records, sources, tree)
+    if keeper:
+        for idx, group in enumerate(dir_groups):
+            kept = keeper(group.path)
+            dir_groups[idx] = group._replace(
+                path=[kept] + [dirpath for dirpath in group.path if dirpath != kept])
+    files_dict.discard(covered_files(records, [dirpath for group in dir_groups
+                                               for dirpath in group.path[1:]]))
+    files_dict.prefer(covered_files(records, [group.path[0] for group in dir_groups]))
+    return dir_groups
+
+
+def _report_duplicates(files_dict: FilepathDict,
+                       dir_groups: typing.List[DirGroup],
+                       dest_path: str,
+                       hooks=HookWrapper(),
+                       backend=LOCAL):
+    """ Save duplicate directories and files report, or print it, if dest_path is empty. """
+
+    if dest_path:
+        with backend.open(os.path.join(os.path.abspath(dest_path), 'report.txt'),
+                          'wt') as fileout:
+            if dir_groups is not None:
+                save_dir_duplicates(dir_groups, fileout)
+            files_dict._save_duplicates_(target=fileout, hooks=hooks)
+    else:
+        if dir_groups is not None:
+            save_dir_duplicates(dir_groups, sys.stdout)
+        files_dict.print_duplicates(hooks=hooks)
+
+
+def _scan_sources(settings: Settings, hash_cache: HashCache = None,
+                  hooks=HookWrapper(), throttle: Throttle = None,
+                  walk_filter: WalkFilter = None) -> FilepathDict:
+    """ Scan reference, source paths and remote agents for duplicates.
+    All paths are walked with given walk_filter, if it is given. """
+
+    walk_filter = walk_filter or _walk_filter(settings, throttle)
+    hasher = _make_hasher(settings, hash_cache, throttle)
+    if settings.archives:
+        hasher = archiveutils.ArchiveHasher(hasher, throttle.open) if throttle \
+            else archiveutils.ArchiveHasher(hasher)
+    members = [] if settings.archives else None
+    file_data_dict = FilepathDict(hasher=hasher, reference_mode=bool(settings.reference),
+                                  keeper=_make_keeper(settings))
+
+    # search for duplicates
+    if hooks.beforescanhook:
+        hooks.beforescanhook(len(settings.source) + len(settings.reference or [])
+                             + len(settings.agents or []))
+
+    if settings.pipeline:
+        roots = [(os.path.abspath(el), True) for el in settings.reference or []]
+        roots += [(os.path.abspath(el), False) for el in settings.source]
+        _scan_pipelined(roots, file_data_dict, settings.op_unique, hooks,
+                        walk_filter)
+    else:
+        # files of unique sizes are needed for uniques, identical directories,
+        # archive members and remote agents, otherwise they are never added
+        buckets = None
+        if not (settings.op_unique or settings.op_dirs or settings.archives or settings.agents):
+            buckets = SizeBuckets()
+
+        for el in settings.reference or []:
+            _scan_duplicates(os.path.abspath(el), file_data_dict, reference=True,
+                             members=members, walk_filter=walk_filter,
+                             buckets=buckets)
+            if hooks.pathscannedhook:
+                hooks.pathscannedhook()
+
+        for el in settings.source:
+            _scan_duplicates(os.path.abspath(el), file_data_dict, members=members,
+                             walk_filter=walk_filter, buckets=buckets)
+            if hooks.pathscannedhook:
+                hooks.pathscannedhook()
+
+        if buckets is not None:
+            for filepath, size, reference in buckets.colliding():
+                file_data_dict.add(SimpleKey.create(size), filepath, reference)
+
+    if members:
+        _add_archive_members(file_data_dict, members, hasher)
+
+    if settings.agents:
+        agent.collect(settings.agents, file_data_dict, hooks.pathscannedhook)
+    return file_data_dict
+
+
+def _resume(settings: Settings, hooks=HookWrapper()):
+    """ Finish interrupted duplicates move from journal, without scan. """
+
+    state, moved_from = journalutils.resume(settings.dest_path)
+    if settings.remove_empty:
+        if hooks.beforepurgehook:
+            hooks.beforepurgehook()
+        _purge_dirs(moved_from, state.sources)
+        if hooks.afterpurgedhook:
+            hooks.afterpurgedhook()
+
+
+def deduplicate(settings: Settings, hooks=HookWrapper()):
+    set_priority(settings.nice, settings.ionice)
+    if settings.merge:
+        merge(settings.source, settings.dest_path, hooks)
+        return
+    if settings.undo:
+        journalutils.undo(settings.dest_path)
+        return
+    if settings.resume:
+        _resume(settings, hooks)
+        return
+    if settings.op_chunks:
+        _analyse_chunks(settings, hooks)
+        return
+    if settings.filter_build:
+        _build_filter(settings, hooks)
+        return
+    if settings.filter_against:
+        _check_against_filter(settings, hooks)
+        return
+    if settings.shard:
+        _scan_shard(settings, hooks, _make_throttle(settings))
+        return
+
+    hash_cache = HashCache(settings.hash_cache) if settings.hash_cache else None
+    throttle = _make_throttle(settings)
+    walk_filter = _walk_filter(settings, throttle)
+    if settings.image_hash:
+        file_data_dict = _scan_images(settings, hooks)
+    else:
+        file_data_dict = _scan_sources(settings, hash_cache, hooks, throttle, walk_filter)
+
+    hash_map = None
+    move_map = None
+    if settings.parallel:
+        hash_map = partial(ioscheduler.map_by_device, ordered=settings.ordered)
+        # moves, copies across devices especially, run on the same device workers
+        move_map = ioscheduler.map_by_device
+    elif settings.ordered:
+        hash_map = ioscheduler.map_in_order
+    budget = settings.time_budget is not None or settings.byte_budget is not None
+    if not (budget or settings.sparse or settings.incremental or settings.image_hash
+            or throttle or settings.checksums or settings.write_checksums
+            or settings.algorithm != DEFAULT_ALGORITHM or not is_local(settings.backend)):
+        # small files digests are the same as hash_file ones
+        file_data_dict.hash_small(uniques=settings.op_unique, hash_cache=hash_cache)
+    if budget:
+        file_data_dict.resolve_within_budget(settings.time_budget, settings.byte_budget,
+                                             hash_map, uniques=settings.op_unique)
+    elif hash_map:
+        file_data_dict.hash_pending(hash_map, uniques=settings.op_unique)
+
+    dir_groups = None
+    if settings.op_dirs:
+        dir_groups = _find_dir_duplicates(file_data_dict, settings.source,
+                                          _make_keeper(settings), walk_filter.tree)
+
     if hooks.beforereporthook or hooks.beforemovehook:
         total_count = 0
         if settings.op_dedup:
@@ -367,37 +1452,70 @@ def deduplicate(settings: Settings, hooks=HookWrapper()):
 
     if not (settings.op_dedup or settings.op_unique):
         # report result
-        if settings.dest_path:
-            file_data_dict.save_duplicates(filepath=os.path.join(os.path.abspath(settings.dest_path),
-                                                                 'report.txt'), hooks=hooks)
-        else:
-            file_data_dict.print_duplicates(hooks=hooks)
+        _report_duplicates(file_data_dict, dir_groups, settings.dest_path, hooks,
+                           _backend(settings))
     else:
+        moved_from = set()
         if settings.op_dedup:
+            name_check_dict = {}
+            journal = None
+            if not settings.op_test and is_local(settings.backend):
+                journal = journalutils.Journal(journalutils.journal_path(settings.dest_path),
+                                               throttle=throttle)
+                journal.start(settings.source, os.path.abspath(settings.dest_path))
+            if dir_groups:
+                dir_groups = _move_dir_duplicates(dir_groups,
+                                                  settings.source,
+                                                  settings.dest_path,
+                                                  settings.op_test,
+                                                  name_check_dict,
+                                                  moved_from,
+                                                  journal,
+                                                  throttle,
+                                                  _backend(settings),
+                                                  move_map)
             file_data_dict = _move_duplicates(file_data_dict,
                                             settings.source,
                                             settings.dest_path,
                                             settings.op_test,
-                                            hooks=hooks)
+                                            hooks=hooks,
+                                            name_check_dict=name_check_dict,
+                                            moved_from=moved_from,
+                                            journal=journal,
+                                            throttle=throttle,
+                                            backend=_backend(settings),
+                                            move_map=move_map)
+            if journal:
+                journal.end()
+                journal.close()
         if settings.op_unique:
             file_data_dict = _move_uniques(file_data_dict,
                                             settings.source,
                                             settings.dest_path,
                                             settings.op_test,
-                                            hooks=hooks)
-
-        # clean up empty sub-dirs in source
+                                            hooks=hooks,
+                                            moved_from=moved_from,
+                                            copy=settings.copy,
+                                            throttle=throttle,
+                                            backend=_backend(settings),
+                                            move_map=move_map)
+
+        # clean up sub-dirs in source emptied by moves
         if settings.remove_empty and not settings.op_test:
             if hooks.beforepurgehook:
                 hooks.beforepurgehook()
-            _remove_empty_subdirs(settings.source)
+            _purge_dirs(moved_from, settings.source, _backend(settings), throttle)
             if hooks.afterpurgedhook:
                 hooks.afterpurgedhook()
 
         # save report
         if settings.op_dedup:
-            file_data_dict.save_duplicates(filepath=os.path.join(os.path.abspath(settings.dest_path),
-                                                                'report.txt'), hooks=hooks)
+            _report_duplicates(file_data_dict, dir_groups, settings.dest_path, hooks,
+                               _backend(settings))
         if settings.op_unique:
-            file_data_dict.save_uniques(filepath=os.path.join(os.path.abspath(settings.dest_path),
-                                                                'report.txt'), hooks=hooks)
\ No newline at end of file
+            with _backend(settings).open(os.path.join(os.path.abspath(settings.dest_path),
+                                                      'report.txt'), 'wt') as fileout:
+                file_data_dict._save_uniques_(target=fileout, hooks=hooks)
+
+    if hash_cache:
+        hash_cache.save()
@@ -0,0 +1,111 @@
+"""
+Persistent probabilistic filters for "seen before" checks.
+
+SeenFilter is built once from reference file tree and saved into compact
+file. Later, new files are tested against it without access to reference
+tree: first level is keyed by (size, partial hash) and rejects most new files
+after reading their first bytes only; files passed first level are fully
+hashed and checked against second level keyed by (size, full hash).
+
+"""
+
+import math
+import struct
+import typing
+import hashlib
+
+
+PARTIAL_ERROR_RATE = 1e-3
+FULL_ERROR_RATE = 1e-6
+
+
+class BloomFilter(object):
+    """ Bloom filter over byte string keys. """
+
+    _HEADER = struct.Struct('<QI')
+
+    def __init__(self, bits_count: int, hashes_count: int, bits: bytearray = None):
+        self.bits_count = max(bits_count, 8)
+        self.hashes_count = max(hashes_count, 1)
+        self.bits = bits if bits is not None else bytearray((self.bits_count + 7) // 8)
+
+    @staticmethod
+    def create(capacity: int, error_rate: float) -> 'BloomFilter':
+        """ Create filter with optimal size for given number of keys and false positive rate. """
+        capacity = max(capacity, 1)
+        bits_count = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hashes_count = int(round(bits_count / capacity * math.log(2)))
+        return BloomFilter(bits_count, hashes_count)
+
+    def _positions_(self, key: bytes) -> typing.Iterator[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes_count):
+            yield (first + i * second) % self.bits_count
+
+    def add(self, key: bytes) -> None:
+        for pos in self._positions_(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        for pos in self._positions_(key):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def write(self, target) -> None:
+        target.write(self._HEADER.pack(self.bits_count, self.hashes_count))
+        target.write(self.bits)
+
+    @staticmethod
+    def read(source) -> 'BloomFilter':
+        bits_count, hashes_count = BloomFilter._HEADER.unpack(
+            source.read(BloomFilter._HEADER.size))
+        bits = bytearray(source.read((bits_count + 7) // 8))
+        return BloomFilter(bits_count, hashes_count, bits)
+
+
+def _key(size: int, digest: str) -> bytes:
+    return f'{size}:{digest}'.encode('ascii')
+
+
+class SeenFilter(object):
+    """ Two-level filter of reference files: (size, partial hash) and (size, full hash). """
+
+    _MAGIC = b'YDSF\x01'
+
+    def __init__(self, partial: BloomFilter, full: BloomFilter):
+        self.partial = partial
+        self.full = full
+
+    @staticmethod
+    def create(capacity: int) -> 'SeenFilter':
+        return SeenFilter(BloomFilter.create(capacity, PARTIAL_ERROR_RATE),
+                          BloomFilter.create(capacity, FULL_ERROR_RATE))
+
+    def add(self, size: int, partial_digest: str, full_digest: str) -> None:
+        self.partial.add(_key(size, partial_digest))
+        self.full.add(_key(size, full_digest))
+
+    def may_contain(self, size: int, partial_digest: str) -> bool:
+        """ Cheap check, if False the file is surely not in reference set. """
+        return _key(size, partial_digest) in self.partial
+
+    def contains(self, size: int, full_digest: str) -> bool:
+        return _key(size, full_digest) in self.full
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, 'wb') as fileout:
+            fileout.write(self._MAGIC)
+            self.partial.write(fileout)
+            self.full.write(fileout)
+
+    @staticmethod
+    def load(filepath: str) -> 'SeenFilter':
+        with open(filepath, 'rb') as filein:
+            if filein.read(len(SeenFilter._MAGIC)) != SeenFilter._MAGIC:
+                raise ValueError(f'{filepath}: not a filter file.')
+            partial = BloomFilter.read(filein)
+            full = BloomFilter.read(filein)
+        return SeenFilter(partial, full)
@@ -0,0 +1,378 @@
+"""
+File system backends for scan, hash, move and purge.
+
+Backend provides the file operations core uses: walk, stat, lstat, open,
+replace, mkdir, makedirs, rmdir, listdir and remove, with os semantics
+(including raised OSError and its errno).
+
+    LocalBackend   - the real file system, plain os calls.
+    MemoryBackend  - file tree kept in memory, e.g. to test or benchmark
+                     scenarios with millions of files without building them.
+    LatencyBackend - wrapper adding per operation latency and shared
+                     bandwidth limit to another backend, e.g. to measure
+                     performance on NFS-like storage on one machine.
+
+Features working with file descriptors or local file metadata directly
+(sparse and incremental hashing, checksums, hash cache, archives, images,
+agents, per-device scheduling, copy export, journal) use the real file
+system only.
+
+"""
+
+import io
+import os
+import stat
+import time
+import errno
+import typing
+import threading
+from collections import Counter
+from .throttle import TokenBucket
+
+
+class LocalBackend(object):
+    """ Real file system. """
+
+    def walk(self, top: str) -> typing.Iterator[typing.Tuple[str, typing.List[str],
+                                                             typing.List[str]]]:
+        return os.walk(top)
+
+    def stat(self, path: str) -> os.stat_result:
+        return os.stat(path)
+
+    def lstat(self, path: str) -> os.stat_result:
+        return os.lstat(path)
+
+    def open(self, path: str, mode: str = 'rb', **kwargs) -> typing.IO:
+        return io.open(path, mode, **kwargs)
+
+    def replace(self, src: str, dst: str) -> None:
+        os.replace(src, dst)
+
+    def mkdir(self, path: str) -> None:
+        os.mkdir(path)
+
+    def makedirs(self, path: str, exist_ok: bool = False) -> None:
+        os.makedirs(path, exist_ok=exist_ok)
+
+    def rmdir(self, path: str) -> None:
+        os.rmdir(path)
+
+    def listdir(self, path: str) -> typing.List[str]:
+        return os.listdir(path)
+
+    def remove(self, path: str) -> None:
+        os.remove(path)
+
+
+LOCAL = LocalBackend()
+
+
+def is_local(backend) -> bool:
+    """ Return True, if backend is the real file system without wrappers. """
+
+    return backend is None or isinstance(backend, LocalBackend)
+
+
+def _error(code: int, path: str) -> OSError:
+    return OSError(code, os.strerror(code), path)
+
+
+class _MemoryFile(object):
+    __slots__ = ('data', 'mtime_ns', 'ino')
+
+    def __init__(self, data: bytes, mtime_ns: int, ino: int):
+        self.data = data
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+
+
+class _MemoryWriter(io.BytesIO):
+    """ Written data is stored into the file on close. """
+
+    def __init__(self, commit: typing.Callable[[bytes], None]):
+        super().__init__()
+        self._commit_ = commit
+
+    def close(self):
+        if not self.closed:
+            self._commit_(self.getvalue())
+        super().close()
+
+
+class MemoryBackend(object):
+    """ File tree in memory. Directory maps names of its entries to file
+    records, None for subdirectories. Pathes are absolute, "/" is the root.
+    Files of the same content could share one bytes object. """
+
+    def __init__(self, device: int = 1):
+        self.device = device
+        self._lock_ = threading.RLock()
+        self._dirs_: typing.Dict[str, typing.Dict[str, typing.Optional[_MemoryFile]]] = \
+            {os.sep: {}}
+        self._inodes_ = iter(range(1, 2 ** 62))
+
+    def add_file(self, path: str, data: bytes = b'', mtime_ns: int = None) -> None:
+        """ Create or overwrite file, parent directories are created. """
+
+        path = os.path.normpath(path)
+        with self._lock_:
+            self.makedirs(os.path.dirname(path), exist_ok=True)
+            self._put_(path, data, mtime_ns)
+
+    def _put_(self, path: str, data: bytes, mtime_ns: int = None) -> None:
+        dirpath, name = os.path.split(path)
+        entries = self._dirs_.get(dirpath)
+        if entries is None:
+            raise _error(errno.ENOENT, path)
+        if name in entries and entries[name] is None:
+            raise _error(errno.EISDIR, path)
+        entries[name] = _MemoryFile(data, time.time_ns() if mtime_ns is None else mtime_ns,
+                                    next(self._inodes_))
+
+    def _file_(self, path: str) -> _MemoryFile:
+        dirpath, name = os.path.split(path)
+        record = self._dirs_.get(dirpath, {}).get(name, False)
+        if record is False:
+            raise _error(errno.ENOENT, path)
+        if record is None:
+            raise _error(errno.EISDIR, path)
+        return record
+
+    def walk(self, top: str) -> typing.Iterator[typing.Tuple[str, typing.List[str],
+                                                             typing.List[str]]]:
+        """ Top-down walk, as os.walk: dirnames could be pruned in place. """
+
+        stack = [os.path.normpath(top)]
+        while stack:
+            dirpath = stack.pop()
+            with self._lock_:
+                entries = self._dirs_.get(dirpath)
+                if entries is None:
+                    continue
+                dirnames = sorted(name for name, record in entries.items() if record is None)
+                filenames = sorted(name for name, record in entries.items()
+                                   if record is not None)
+            yield dirpath, dirnames, filenames
+            stack.extend(os.path.join(dirpath, name) for name in reversed(dirnames))
+
+    def stat(self, path: str) -> os.stat_result:
+        path = os.path.normpath(path)
+        with self._lock_:
+            if path in self._dirs_:
+                mode, ino, size, mtime_ns = stat.S_IFDIR | 0o755, 0, 0, 0
+            else:
+                record = self._file_(path)
+                mode, ino, size, mtime_ns = stat.S_IFREG | 0o644, record.ino, \
+                    len(record.data), record.mtime_ns
+        mtime = mtime_ns / 1e9
+        return os.stat_result((mode, ino, self.device, 1, 0, 0, size, int(mtime), int(mtime),
+                               int(mtime), mtime, mtime, mtime, mtime_ns, mtime_ns, mtime_ns))
+
+    lstat = stat
+
+    def open(self, path: str, mode: str = 'rb', buffering: int = -1,
+             encoding: str = None, errors: str = None, **kwargs) -> typing.IO:
+        path = os.path.normpath(path)
+        if 'r' in mode:
+            with self._lock_:
+                fileobj = io.BytesIO(self._file_(path).data)
+        else:
+            with self._lock_:
+                if os.path.dirname(path) not in self._dirs_:
+                    raise _error(errno.ENOENT, path)
+                if path in self._dirs_:
+                    raise _error(errno.EISDIR, path)
+
+            def commit(data: bytes):
+                with self._lock_:
+                    self._put_(path, data)
+            fileobj = _MemoryWriter(commit)
+        if 'b' in mode:
+            return fileobj
+        return io.TextIOWrapper(fileobj, encoding=encoding or 'utf-8', errors=errors)
+
+    def replace(self, src: str, dst: str) -> None:
+        src, dst = os.path.normpath(src), os.path.normpath(dst)
+        with self._lock_:
+            if os.path.dirname(dst) not in self._dirs_:
+                raise _error(errno.ENOENT, dst)
+            if src not in self._dirs_:
+                record = self._file_(src)
+                if dst in self._dirs_:
+                    raise _error(errno.EISDIR, dst)
+                del self._dirs_[os.path.dirname(src)][os.path.basename(src)]
+                self._dirs_[os.path.dirname(dst)][os.path.basename(dst)] = record
+                return
+            if dst in self._dirs_ and self._dirs_[dst]:
+                raise _error(errno.ENOTEMPTY, dst)
+            if dst not in self._dirs_ \
+                    and os.path.basename(dst) in self._dirs_[os.path.dirname(dst)]:
+                raise _error(errno.ENOTDIR, dst)
+            if dst == src or dst.startswith(src + os.sep):
+                raise _error(errno.EINVAL, dst)
+            prefix = src + os.sep
+            for dirpath in [dirpath for dirpath in self._dirs_
+                            if dirpath == src or dirpath.startswith(prefix)]:
+                self._dirs_[dst + dirpath[len(src):]] = self._dirs_.pop(dirpath)
+            del self._dirs_[os.path.dirname(src)][os.path.basename(src)]
+            self._dirs_[os.path.dirname(dst)][os.path.basename(dst)] = None
+
+    def mkdir(self, path: str) -> None:
+        path = os.path.normpath(path)
+        with self._lock_:
+            parent = self._dirs_.get(os.path.dirname(path))
+            if parent is None:
+                raise _error(errno.ENOENT, path)
+            if os.path.basename(path) in parent:
+                raise _error(errno.EEXIST, path)
+            parent[os.path.basename(path)] = None
+            self._dirs_[path] = {}
+
+    def makedirs(self, path: str, exist_ok: bool = False) -> None:
+        path = os.path.normpath(path)
+        with self._lock_:
+            if path in self._dirs_:
+                if not exist_ok:
+                    raise _error(errno.EEXIST, path)
+                return
+            parent = os.path.dirname(path)
+            if parent != path:
+                self.makedirs(parent, exist_ok=True)
+            self.mkdir(path)
+
+    def rmdir(self, path: str) -> None:
+        path = os.path.normpath(path)
+        with self._lock_:
+            entries = self._dirs_.get(path)
+            if entries is None:
+                self._file_(path)
+                raise _error(errno.ENOTDIR, path)
+            if entries:
+                raise _error(errno.ENOTEMPTY, path)
+            if path == os.sep:
+                raise _error(errno.EBUSY, path)
+            del self._dirs_[path]
+            del self._dirs_[os.path.dirname(path)][os.path.basename(path)]
+
+    def listdir(self, path: str) -> typing.List[str]:
+        path = os.path.normpath(path)
+        with self._lock_:
+            entries = self._dirs_.get(path)
+            if entries is None:
+                self._file_(path)
+                raise _error(errno.ENOTDIR, path)
+            return list(entries)
+
+    def remove(self, path: str) -> None:
+        path = os.path.normpath(path)
+        with self._lock_:
+            self._file_(path)
+            del self._dirs_[os.path.dirname(path)][os.path.basename(path)]
+
+
+class _SlowFile(object):
+    """ File object, whose reads are delayed by backend. Writes are buffered,
+    as by page cache, and written bytes are delayed once on close. """
+
+    def __init__(self, fileobj, backend: 'LatencyBackend'):
+        self._fileobj_ = fileobj
+        self._backend_ = backend
+        self._written_ = 0
+
+    def read(self, *args):
+        data = self._fileobj_.read(*args)
+        self._backend_._transfer_('read', len(data))
+        return data
+
+    def write(self, data):
+        self._written_ += len(data)
+        return self._fileobj_.write(data)
+
+    def __iter__(self):
+        for line in self._fileobj_:
+            self._backend_._transfer_('read', len(line))
+            yield line
+
+    def close(self):
+        if self._written_:
+            self._backend_._transfer_('write', self._written_)
+            self._written_ = 0
+        self._fileobj_.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj_, name)
+
+
+class LatencyBackend(object):
+    """ Wrapper of another backend. Each operation, including each read and
+    write call, waits for latency seconds. Read and written bytes share
+    bandwidth limit in bytes per second, if it is given. Concurrent operations
+    wait in parallel, as requests to remote storage do. Number of operations
+    of each kind is counted in calls. """
+
+    def __init__(self, backend=LOCAL, latency: float = 0.0, bandwidth: int = None):
+        self.backend = backend
+        self.latency = latency
+        self._bytes_ = TokenBucket(bandwidth) if bandwidth else None
+        self._lock_ = threading.Lock()
+        self.calls = Counter()
+
+    def _wait_(self, name: str) -> None:
+        with self._lock_:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _transfer_(self, name: str, nbytes: int) -> None:
+        self._wait_(name)
+        if self._bytes_ and nbytes:
+            self._bytes_.consume(nbytes)
+
+    def walk(self, top: str) -> typing.Iterator[typing.Tuple[str, typing.List[str],
+                                                             typing.List[str]]]:
+        for item in self.backend.walk(top):
+            self._wait_('listdir')
+            yield item
+
+    def stat(self, path: str) -> os.stat_result:
+        self._wait_('stat')
+        return self.backend.stat(path)
+
+    def lstat(self, path: str) -> os.stat_result:
+        self._wait_('stat')
+        return self.backend.lstat(path)
+
+    def open(self, path: str, mode: str = 'rb', **kwargs) -> typing.IO:
+        self._wait_('open')
+        return _SlowFile(self.backend.open(path, mode, **kwargs), self)
+
+    def replace(self, src: str, dst: str) -> None:
+        self._wait_('replace')
+        self.backend.replace(src, dst)
+
+    def mkdir(self, path: str) -> None:
+        self._wait_('mkdir')
+        self.backend.mkdir(path)
+
+    def makedirs(self, path: str, exist_ok: bool = False) -> None:
+        self._wait_('mkdir')
+        self.backend.makedirs(path, exist_ok=exist_ok)
+
+    def rmdir(self, path: str) -> None:
+        self._wait_('rmdir')
+        self.backend.rmdir(path)
+
+    def listdir(self, path: str) -> typing.List[str]:
+        self._wait_('listdir')
+        return self.backend.listdir(path)
+
+    def remove(self, path: str) -> None:
+        self._wait_('remove')
+        self.backend.remove(path)
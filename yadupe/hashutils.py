@@ -1,7 +1,21 @@
 import typing
 import os
 import io
+import json
+import errno
+import random
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+PARTIAL_HASH_SIZE = 16 * 1024
+SPARSE_BLOCK_SIZE = 64 * 1024
+_ZERO_BLOCK = bytes(SPARSE_BLOCK_SIZE)
+MANIFEST_BLOCK_SIZE = 1024 * 1024
+SPOT_CHECKS = 4
+SMALL_FILE_SIZE = 64 * 1024
+EMPTY_DIGEST = hashlib.blake2b().hexdigest()
 
 
 class SimpleKey(typing.NamedTuple):
@@ -9,9 +23,6 @@ class SimpleKey(typing.NamedTuple):
 
     size: int
 
-    def __eq__(self, other):
-        return self.size == other.size
-
     @staticmethod
     def create(size: int):
         return SimpleKey(size)
@@ -24,10 +35,11 @@ def get_simple_key(filepath: str) -> SimpleKey:
     return SimpleKey(file_stat.st_size)
 
 
-def file_chunks(filepath, chunksize=io.DEFAULT_BUFFER_SIZE) -> bytes:
-    """ Read file by chunk """
+def file_chunks(filepath, chunksize=io.DEFAULT_BUFFER_SIZE,
+                opener: typing.Callable = open) -> bytes:
+    """ Read file by chunk, file is opened with opener, e.g. backend one. """
 
-    with open(filepath, 'rb') as openedfile:
+    with opener(filepath, 'rb') as openedfile:
         while True:
             data = openedfile.read(chunksize)
             if not data:
@@ -35,8 +47,250 @@ def file_chunks(filepath, chunksize=io.DEFAULT_BUFFER_SIZE) -> bytes:
             yield data
 
 
-def hash_file(filepath: str) -> str:
-    hash_obj = hashlib.blake2b()
-    for chunk in file_chunks(filepath):
+DEFAULT_ALGORITHM = 'blake2b'
+
+
+def hash_file(filepath: str, algorithm: str = DEFAULT_ALGORITHM,
+              opener: typing.Callable = open) -> str:
+    """ Return hex digest of file content, algorithm is hashlib one. """
+
+    hash_obj = hashlib.new(algorithm)
+    for chunk in file_chunks(filepath, opener=opener):
         hash_obj.update(chunk)
     return hash_obj.hexdigest()
+
+
+SMALL_FILES_BATCH = 256
+
+
+def _hash_small_batch(filepaths: typing.List[str]) -> typing.List[typing.Optional[str]]:
+    """ Hash each file read whole with raw os calls, None if it can't be read. """
+
+    digests = []
+    for filepath in filepaths:
+        try:
+            fd = os.open(filepath, os.O_RDONLY)
+        except OSError:
+            digests.append(None)
+            continue
+        try:
+            hash_obj = hashlib.blake2b(os.read(fd, SMALL_FILE_SIZE))
+            while True:
+                data = os.read(fd, SMALL_FILE_SIZE)
+                if not data:
+                    break
+                hash_obj.update(data)
+            digests.append(hash_obj.hexdigest())
+        except OSError:
+            digests.append(None)
+        finally:
+            os.close(fd)
+    return digests
+
+
+def hash_small_files(filepaths: typing.List[str], workers: int = None) -> typing.Dict[str, str]:
+    """ Return {path: digest} for small files. Files are read whole, batches of
+    them are processed in thread pool, so per file overhead is a few os calls.
+    Digest is the same as hash_file one. Files which can't be read are skipped,
+    so they could be hashed in usual way. """
+
+    batches = [filepaths[idx:idx + SMALL_FILES_BATCH]
+               for idx in range(0, len(filepaths), SMALL_FILES_BATCH)]
+    digests = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch, batch_digests in zip(batches, executor.map(_hash_small_batch, batches)):
+            digests.update((filepath, digest) for filepath, digest in zip(batch, batch_digests)
+                           if digest is not None)
+    return digests
+
+
+def partial_hash_file(filepath: str, size: int = PARTIAL_HASH_SIZE) -> str:
+    """ Return hash of the first size bytes of the file. """
+
+    hash_obj = hashlib.blake2b()
+    with open(filepath, 'rb') as openedfile:
+        hash_obj.update(openedfile.read(size))
+    return hash_obj.hexdigest()
+
+
+def _data_extents(fd: int, size: int) -> typing.Iterator[typing.Tuple[int, int]]:
+    """ Iterator, return (start, end) of each data extent, holes are skipped.
+    Whole file is one extent, if file system can't report holes. """
+
+    if not hasattr(os, 'SEEK_DATA'):
+        yield 0, size
+        return
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as ex:
+            if ex.errno != errno.ENXIO:
+                yield offset, size
+            return
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end
+        offset = end
+
+
+def hash_sparse_file(filepath: str, opener: typing.Callable = open) -> str:
+    """ Return hash of the file, not reading its holes.
+    File is hashed by aligned blocks: each run of zero blocks is hashed as its
+    length, other blocks as their content. Zero block is detected by content
+    for allocated blocks and by SEEK_HOLE for holes, so digest depends on the
+    file content only, not on its allocation. It differs from hash_file digest. """
+
+    hash_obj = hashlib.blake2b()
+    zero_run = 0
+    with opener(filepath, 'rb') as openedfile:
+        size = os.fstat(openedfile.fileno()).st_size
+        extents = _data_extents(openedfile.fileno(), size)
+        extent = next(extents, None)
+        block = 0
+        while block < size:
+            while extent is not None and extent[1] <= block:
+                extent = next(extents, None)
+            if extent is None or extent[0] >= block + SPARSE_BLOCK_SIZE:
+                # skip blocks up to the next data extent without reading
+                next_block = size if extent is None else \
+                    extent[0] - extent[0] % SPARSE_BLOCK_SIZE
+                zero_run += min(next_block, size) - block
+                block = next_block
+                continue
+            openedfile.seek(block)
+            data = openedfile.read(SPARSE_BLOCK_SIZE)
+            if not data:
+                break
+            if data == _ZERO_BLOCK[:len(data)]:
+                zero_run += len(data)
+            else:
+                if zero_run:
+                    hash_obj.update(b'Z' + zero_run.to_bytes(8, 'little'))
+                    zero_run = 0
+                hash_obj.update(b'D')
+                hash_obj.update(data)
+            block += len(data)
+    if zero_run:
+        hash_obj.update(b'Z' + zero_run.to_bytes(8, 'little'))
+    return hash_obj.hexdigest()
+
+
+def block_manifest(filepath: str, known: typing.List[str] = None,
+                   opener: typing.Callable = open) -> typing.List[str]:
+    """ Return digests of file blocks of MANIFEST_BLOCK_SIZE. Known digests of
+    leading full blocks are taken as is, only blocks after them are read. """
+
+    blocks = list(known or [])
+    with opener(filepath, 'rb') as openedfile:
+        openedfile.seek(len(blocks) * MANIFEST_BLOCK_SIZE)
+        while True:
+            data = openedfile.read(MANIFEST_BLOCK_SIZE)
+            if not data:
+                break
+            blocks.append(hashlib.blake2b(data, digest_size=16).hexdigest())
+    return blocks
+
+
+def manifest_root(blocks: typing.List[str]) -> str:
+    """ Return root hash of block manifest. """
+
+    hash_obj = hashlib.blake2b()
+    for block in blocks:
+        hash_obj.update(bytes.fromhex(block))
+    return hash_obj.hexdigest()
+
+
+def hash_blocks_file(filepath: str) -> str:
+    """ Return root hash of file block manifest. It differs from hash_file digest. """
+    return manifest_root(block_manifest(filepath))
+
+
+def _spot_check(filepath: str, blocks: typing.List[str], count: int = SPOT_CHECKS,
+                opener: typing.Callable = open) -> bool:
+    """ Check the first, the last and some random blocks of the file against
+    their known digests. """
+
+    indexes = {0, len(blocks) - 1}
+    indexes.update(random.sample(range(len(blocks)), min(count, len(blocks))))
+    with opener(filepath, 'rb') as openedfile:
+        for idx in sorted(indexes):
+            openedfile.seek(idx * MANIFEST_BLOCK_SIZE)
+            data = openedfile.read(MANIFEST_BLOCK_SIZE)
+            if hashlib.blake2b(data, digest_size=16).hexdigest() != blocks[idx]:
+                return False
+    return True
+
+
+class HashCache(object):
+    """ Persistent file hash cache. Entry is valid while file size and
+    modification time are the same as when it was hashed. Cache is shared
+    by hashing threads: updates and saving are serialized. """
+
+    def __init__(self, filepath: str = None):
+        self.filepath = filepath
+        self._lock_ = threading.Lock()
+        self._entries_ = {}
+        if filepath and os.path.isfile(filepath):
+            with open(filepath, 'rt') as filein:
+                self._entries_ = json.load(filein)
+
+    def get(self, filepath: str, file_stat: os.stat_result) -> str:
+        entry = self._entries_.get(filepath)
+        if entry and entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, filepath: str, file_stat: os.stat_result, digest: str,
+            blocks: typing.List[str] = None) -> None:
+        entry = [file_stat.st_size, file_stat.st_mtime_ns, digest]
+        if blocks is not None:
+            entry.append(blocks)
+        with self._lock_:
+            self._entries_[filepath] = entry
+
+    def hasher(self, hash_function: typing.Callable = hash_file,
+               namespace: str = '') -> typing.Callable:
+        """ Return hash_function wrapper, which reads file only on cache miss.
+        Digests of different hash functions are kept apart by namespace prefix. """
+
+        def cached_hash(filepath: str) -> str:
+            file_stat = os.stat(filepath)
+            digest = self.get(f'{namespace}{filepath}', file_stat)
+            if digest is None:
+                digest = hash_function(filepath)
+                self.put(f'{namespace}{filepath}', file_stat, digest)
+            return digest
+
+        return cached_hash
+
+    def incremental_hasher(self, opener: typing.Callable = open) -> typing.Callable:
+        """ Return hash_blocks_file wrapper for append-only files. Block manifest
+        is kept in the cache. If the file has grown and its spot checked blocks
+        are unchanged, only blocks after known full blocks are read.
+        Files are opened with opener, e.g. throttled one. """
+
+        def incremental_hash(filepath: str) -> str:
+            file_stat = os.stat(filepath)
+            key = f'blocks:{filepath}'
+            digest = self.get(key, file_stat)
+            if digest is not None:
+                return digest
+            entry = self._entries_.get(key)
+            known = []
+            if entry and len(entry) > 3 and file_stat.st_size > entry[0]:
+                known = entry[3][:entry[0] // MANIFEST_BLOCK_SIZE]
+                if known and not _spot_check(filepath, known, opener=opener):
+                    known = []
+            blocks = block_manifest(filepath, known, opener)
+            digest = manifest_root(blocks)
+            self.put(key, file_stat, digest, blocks)
+            return digest
+
+        return incremental_hash
+
+    def save(self) -> None:
+        tmppath = f'{self.filepath}.tmp'
+        with self._lock_:
+            with open(tmppath, 'wt') as fileout:
+                json.dump(self._entries_, fileout)
+            os.replace(tmppath, self.filepath)
@@ -0,0 +1,171 @@
+"""
+Near-duplicate image search with perceptual hashes.
+
+Each image is reduced to 64 bit perceptual hash (aHash, dHash or pHash), so
+re-encoded or resized copies of the same picture have hashes within small
+Hamming distance. Similar pairs are found with multi-index hashing: hash is
+split into distance + 1 blocks, and by pigeonhole principle similar hashes
+have at least one equal block, so only hashes sharing a block are compared.
+
+Hashing requires NumPy and Pillow packages, search is pure Python.
+
+"""
+
+import os
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy
+    from PIL import Image
+except ImportError:
+    numpy = None
+    Image = None
+
+
+class ImageKey(typing.NamedTuple):
+    """ Key of similar images group. Size is the first image file size. """
+    group: int
+    size: int
+
+
+HASH_BITS = 64
+DEFAULT_DISTANCE = 4
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def available() -> bool:
+    """ Return True, if packages required for image hashing are installed. """
+    return numpy is not None and Image is not None
+
+
+def is_image(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _load_gray(filepath: str, width: int, height: int):
+    """ Load image as grayscale float array of given size. """
+
+    with Image.open(filepath) as image:
+        # let JPEG decoder downscale while decoding
+        image.draft('L', (width * 4, height * 4))
+        image = image.convert('L').resize((width, height), Image.BILINEAR)
+        return numpy.asarray(image, dtype=numpy.float64)
+
+
+def _bits_to_int(bits) -> int:
+    return int.from_bytes(numpy.packbits(bits.astype(numpy.uint8).ravel()).tobytes(), 'big')
+
+
+def ahash(filepath: str) -> int:
+    """ Average hash: pixels of 8x8 image brighter than the mean. """
+    pixels = _load_gray(filepath, 8, 8)
+    return _bits_to_int(pixels > pixels.mean())
+
+
+def dhash(filepath: str) -> int:
+    """ Difference hash: horizontal gradient signs of 9x8 image. """
+    pixels = _load_gray(filepath, 9, 8)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT_SIZE = 32
+_DCT = None
+
+
+def _dct_matrix():
+    global _DCT
+    if _DCT is None:
+        n = numpy.arange(_DCT_SIZE)
+        _DCT = numpy.cos(numpy.pi * numpy.outer(n, 2 * n + 1) / (2 * _DCT_SIZE))
+    return _DCT
+
+
+def phash(filepath: str) -> int:
+    """ DCT hash: low frequencies of 32x32 image above their median. """
+    dct = _dct_matrix()
+    pixels = _load_gray(filepath, _DCT_SIZE, _DCT_SIZE)
+    low = (dct @ pixels @ dct.T)[:8, :8]
+    return _bits_to_int(low > numpy.median(low.ravel()[1:]))
+
+
+HASH_FUNCTIONS = {'ahash': ahash, 'dhash': dhash, 'phash': phash}
+
+
+def hash_images(filepaths: typing.List[str], method: str = 'phash',
+                workers: int = None) -> typing.Dict[str, int]:
+    """ Return {path: perceptual hash}, unreadable images are skipped.
+    Images are decoded in threads, Pillow releases GIL while decoding. """
+
+    hash_function = HASH_FUNCTIONS[method]
+
+    def safe_hash(filepath: str):
+        try:
+            return hash_function(filepath)
+        except (OSError, ValueError):
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return {filepath: value
+                for filepath, value in zip(filepaths, executor.map(safe_hash, filepaths))
+                if value is not None}
+
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count('1')
+
+
+def _blocks(distance: int) -> typing.List[typing.Tuple[int, int]]:
+    """ Split hash bits into distance + 1 (shift, mask) blocks. """
+    count = min(distance + 1, HASH_BITS)
+    bounds = [HASH_BITS * i // count for i in range(count + 1)]
+    return [(low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])]
+
+
+def similar_pairs(hashes: typing.List[int],
+                  distance: int = DEFAULT_DISTANCE) -> typing.Iterator[typing.Tuple[int, int]]:
+    """ Iterator, return (i, j), i < j, for each pair of hashes within given
+    Hamming distance. Each pair is returned once: from the first block the
+    two hashes share. """
+
+    blocks = _blocks(distance)
+    keys = [[(value >> shift) & mask for shift, mask in blocks] for value in hashes]
+    for block in range(len(blocks)):
+        buckets = {}
+        for idx, key in enumerate(keys):
+            buckets.setdefault(key[block], []).append(idx)
+        for members in buckets.values():
+            for pos, first in enumerate(members):
+                for second in members[pos + 1:]:
+                    if any(keys[first][b] == keys[second][b] for b in range(block)):
+                        continue
+                    if hamming(hashes[first], hashes[second]) <= distance:
+                        yield first, second
+
+
+def similar_groups(hashes: typing.Dict[str, int],
+                   distance: int = DEFAULT_DISTANCE) -> typing.List[typing.List[str]]:
+    """ Return groups of similar images: each image in a group is within given
+    distance of all others, so any of them could be kept. Groups are built
+    greedily in path order, image joins the first group it fits. Chains of
+    similar images (a ~ b ~ c, but a !~ c) are not merged. """
+
+    paths = list(hashes.keys())
+    neighbours = {}
+    for first, second in similar_pairs([hashes[path] for path in paths], distance):
+        neighbours.setdefault(first, set()).add(second)
+        neighbours.setdefault(second, set()).add(first)
+
+    assigned = set()
+    groups = []
+    for idx in range(len(paths)):
+        if idx in assigned or idx not in neighbours:
+            continue
+        group = [idx]
+        for other in sorted(neighbours[idx] - assigned):
+            if all(other in neighbours[member] for member in group[1:]):
+                group.append(other)
+        if len(group) > 1:
+            assigned.update(group)
+            groups.append([paths[member] for member in group])
+    return groups
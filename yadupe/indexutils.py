@@ -0,0 +1,45 @@
+"""
+File index records: (size, path, digest) of scanned files, one JSON object per
+line. Records are sent by remote agents and saved as partial indexes, then
+merged into FilepathDict.
+
+"""
+
+import json
+import typing
+from .hashutils import SimpleKey
+
+
+class FileRecord(typing.NamedTuple):
+    """ Scanned file. Digest is None, if the file was not hashed. """
+    size: int
+    path: str
+    digest: str = None
+
+
+def dump_record(record: FileRecord, target) -> None:
+    """ Write record into text stream. """
+
+    target.write(json.dumps(record._asdict()))
+    target.write('\n')
+
+
+def load_record(line: str) -> FileRecord:
+    obj = json.loads(line)
+    return FileRecord(obj['size'], obj['path'], obj.get('digest'))
+
+
+def load_records(source) -> typing.Iterator[FileRecord]:
+    """ Read records from text stream. """
+
+    for line in source:
+        if line.strip():
+            yield load_record(line)
+
+
+def add_records(files_dict: dict, records: typing.Iterable[FileRecord], prefix: str = '') -> None:
+    """ Add records into FilepathDict, known digests are not calculated again. """
+
+    for record in records:
+        files_dict.add(SimpleKey.create(record.size), f'{prefix}{record.path}',
+                       digest=record.digest)
@@ -0,0 +1,194 @@
+"""
+Per-device I/O scheduler.
+
+Files are grouped by device (st_dev) and each device gets its own set of
+worker threads, so spinning disks are read by one thread without seeking
+back and forth, while SSDs are read in parallel. Default number of workers
+depends on the device type from /sys/dev/block/MAJOR:MINOR/queue/rotational.
+
+Before a worker processes a file, readahead hint (POSIX_FADV_WILLNEED) is
+issued for the next queued file of the same device.
+
+Files could be ordered by their first physical block (FIEMAP ioctl, inode
+number if it is not supported), so spinning disk reads them in one sweep.
+
+Moves are scheduled the same way, keyed on the source device: move to
+another device copies file data and is as heavy as hashing.
+
+"""
+
+import os
+import typing
+import struct
+import threading
+from collections import deque
+
+
+ROTATIONAL_WORKERS = 1
+SOLID_STATE_WORKERS = 8
+DEFAULT_WORKERS = 2         # network and virtual file systems
+READAHEAD_SIZE = 4 * 1024 * 1024
+
+_SYS_DEV_BLOCK = '/sys/dev/block'
+
+_FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP = struct.Struct('=QQLLLL')
+_FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+
+
+def is_rotational(device: int) -> typing.Optional[bool]:
+    """ Return True for spinning disk, False for SSD, None if unknown.
+    For partition the whole disk queue is checked. """
+
+    devpath = os.path.join(_SYS_DEV_BLOCK, f'{os.major(device)}:{os.minor(device)}')
+    devpath = os.path.realpath(devpath)
+    for path in (devpath, os.path.dirname(devpath)):
+        try:
+            with open(os.path.join(path, 'queue', 'rotational'), 'rt') as filein:
+                return filein.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+
+def device_workers(device: int) -> int:
+    """ Return default number of concurrent workers for the device. """
+
+    rotational = is_rotational(device)
+    if rotational is None:
+        return DEFAULT_WORKERS
+    return ROTATIONAL_WORKERS if rotational else SOLID_STATE_WORKERS
+
+
+def readahead(filepath: str, size: int = READAHEAD_SIZE) -> None:
+    """ Ask kernel to start reading the file beginning into page cache. """
+
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, size, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def physical_offset(filepath: str) -> typing.Optional[int]:
+    """ Return physical offset of the first file extent, None if unknown. """
+
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    # map the whole file, room for one extent
+    request = bytearray(_FIEMAP.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+                        + bytes(_FIEMAP_EXTENT.size))
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, _FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if not _FIEMAP.unpack_from(request)[3]:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP.size)[1]
+
+
+def physical_order(filepaths: typing.Iterable[str]) -> typing.List[str]:
+    """ Return pathes sorted by device and physical offset of their first extent.
+    Files with unknown offset (e.g. empty or inline) are sorted by inode number
+    after them. Pathes which can't be stat-ed are at the end, in given order. """
+
+    keys = {}
+    for filepath in filepaths:
+        try:
+            file_stat = os.stat(filepath)
+        except OSError:
+            keys[filepath] = (1, 0, 0, 0)
+            continue
+        offset = physical_offset(filepath)
+        if offset is None:
+            keys[filepath] = (0, file_stat.st_dev, 1, file_stat.st_ino)
+        else:
+            keys[filepath] = (0, file_stat.st_dev, 0, offset)
+    return sorted(keys.keys(), key=keys.get)
+
+
+def map_in_order(function: typing.Callable,
+                 filepaths: typing.Iterable[str]) -> typing.Dict[str, typing.Any]:
+    """ Call function for each path in physical order, return {path: result}. """
+
+    return {filepath: function(filepath) for filepath in physical_order(filepaths)}
+
+
+def group_by_device(filepaths: typing.Iterable[str]) -> typing.Dict[typing.Optional[int],
+                                                                     typing.List[str]]:
+    """ Return {st_dev: pathes}, pathes which can't be stat-ed are under None. """
+
+    groups = {}
+    for filepath in filepaths:
+        try:
+            device = os.stat(filepath).st_dev
+        except OSError:
+            device = None
+        groups.setdefault(device, []).append(filepath)
+    return groups
+
+
+def map_by_device(function: typing.Callable, filepaths: typing.Iterable[str],
+                  workers: typing.Dict[int, int] = None,
+                  ordered: bool = False) -> typing.Dict[str, typing.Any]:
+    """ Call function for each path, return {path: result}.
+    Pathes of each device are processed by own workers, in given order or,
+    if ordered is set, in physical order.
+    Number of workers per device is taken from workers or device_workers().
+    Pathes which can't be stat-ed (e.g. archive members) are processed in the
+    calling thread. First raised exception stops processing and is re-raised. """
+
+    results = {}
+    errors = []
+    groups = group_by_device(physical_order(filepaths) if ordered else filepaths)
+    threads = []
+
+    for device, pathes in groups.items():
+        if device is None:
+            continue
+        queue = deque(pathes)
+        lock = threading.Lock()
+
+        def worker(queue=queue, lock=lock):
+            while True:
+                with lock:
+                    if not queue or errors:
+                        return
+                    filepath = queue.popleft()
+                    following = queue[0] if queue else None
+                if following is not None:
+                    readahead(following)
+                try:
+                    results[filepath] = function(filepath)
+                except Exception as ex:
+                    errors.append(ex)
+                    return
+
+        count = (workers or {}).get(device) or device_workers(device)
+        for _ in range(min(count, len(pathes))):
+            thread = threading.Thread(target=worker, daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    for filepath in groups.get(None, []):
+        results[filepath] = function(filepath)
+    return results
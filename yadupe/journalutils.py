@@ -0,0 +1,278 @@
+"""
+Crash-safe journal of duplicates moves.
+
+Journal is append-only JSON lines file in destination directory. Each group of
+duplicates is recorded with its digest and kept pathes, followed by planned
+moves. Planned moves are synced to disk before files are renamed, completed
+moves are synced by batches:
+
+    {"op": "start", "sources": [...], "dest": ...}
+    {"op": "group", "kind": "file" or "dir", "name": ..., "size": ...,
+     "digest": ..., "kept": [...]}
+    {"op": "move", "src": ..., "dst": ...}
+    {"op": "done", "src": ...}
+    {"op": "end"}
+
+Interrupted run is finished with resume() and any run is rolled back with
+undo(), both using the journal only, without scan or hashing.
+
+"""
+
+import os
+import sys
+import json
+import typing
+from . import copyutils
+
+
+JOURNAL_NAME = 'journal.jsonl'
+SYNC_BATCH = 1024
+
+
+def _truncate_tail(filepath: str) -> None:
+    """ Cut the file after its last complete line. """
+
+    with open(filepath, 'r+b') as fileio:
+        size = fileio.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            fileio.seek(start)
+            pos = fileio.read(end - start).rfind(b'\n')
+            if pos >= 0:
+                end = start + pos + 1
+                break
+            end = start
+        if end != size:
+            fileio.truncate(end)
+
+
+class Journal(object):
+    """ Append-only journal writer. Records are synced to disk by sync() and
+    each SYNC_BATCH records. Record cut by the crash is dropped on append.
+    Each sync waits for throttle, if it is given. """
+
+    def __init__(self, filepath: str, append: bool = False, throttle=None):
+        self.filepath = filepath
+        self.throttle = throttle
+        if append:
+            _truncate_tail(filepath)
+        self._file_ = open(filepath, 'at' if append else 'wt', encoding='utf-8',
+                           errors='surrogateescape')
+        self._unsynced_ = 0
+
+    def _write_(self, **record) -> None:
+        self._file_.write(json.dumps(record) + '\n')
+        self._unsynced_ += 1
+        if self._unsynced_ >= SYNC_BATCH:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._unsynced_:
+            if self.throttle:
+                self.throttle.io()
+            self._file_.flush()
+            os.fsync(self._file_.fileno())
+            self._unsynced_ = 0
+
+    def start(self, sources: typing.List[str], dest: str) -> None:
+        self._write_(op='start', sources=sources, dest=dest)
+
+    def group(self, kind: str, name: str, size: int, kept: typing.List[str],
+              digest: str = None, files: int = None) -> None:
+        self._write_(op='group', kind=kind, name=name, size=size, digest=digest,
+                     kept=kept, files=files)
+
+    def move(self, src: str, dst: str) -> None:
+        self._write_(op='move', src=src, dst=dst)
+
+    def done(self, src: str) -> None:
+        self._write_(op='done', src=src)
+
+    def undo(self, src: str) -> None:
+        self._write_(op='undo', src=src)
+
+    def end(self, op: str = 'end') -> None:
+        self._write_(op=op)
+        self.sync()
+
+    def close(self) -> None:
+        self.sync()
+        self._file_.close()
+
+
+class JournalGroup(typing.NamedTuple):
+    kind: str
+    name: str
+    size: int
+    digest: str
+    kept: typing.List[str]
+    files: int
+    moves: typing.List[typing.Tuple[str, str]]
+
+
+class JournalState(object):
+    """ Journal content: sources, groups with their planned moves and done moves. """
+
+    def __init__(self):
+        self.sources: typing.List[str] = []
+        self.dest: str = None
+        self.groups: typing.List[JournalGroup] = []
+        self.done: typing.Set[str] = set()
+        self.undone: typing.Set[str] = set()
+        self.ended = False
+        self.rolled_back = False
+
+    @property
+    def finished(self) -> bool:
+        return self.ended or self.rolled_back
+
+    def moves(self) -> typing.Iterator[typing.Tuple[str, str]]:
+        for group in self.groups:
+            yield from group.moves
+
+
+def journal_path(dest: str) -> str:
+    return os.path.join(os.path.abspath(dest), JOURNAL_NAME)
+
+
+def load_journal(filepath: str) -> JournalState:
+    """ Read journal, last line could be cut by the crash. """
+
+    state = JournalState()
+    with open(filepath, 'rt', encoding='utf-8', errors='surrogateescape') as filein:
+        for line in filein:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            op = record['op']
+            if op == 'start':
+                state.sources = record['sources']
+                state.dest = record['dest']
+            elif op == 'group':
+                state.groups.append(JournalGroup(record['kind'], record['name'], record['size'],
+                                                 record['digest'], record['kept'],
+                                                 record['files'], []))
+            elif op == 'move':
+                state.groups[-1].moves.append((record['src'], record['dst']))
+            elif op == 'done':
+                state.done.add(record['src'])
+            elif op == 'undo':
+                state.undone.add(record['src'])
+            elif op == 'end':
+                state.ended = True
+            elif op == 'undone':
+                state.rolled_back = True
+    return state
+
+
+def save_report(state: JournalState, target=sys.stdout) -> None:
+    """ Save duplicates report of journaled run, in the same format as search one. """
+
+    dir_groups = [group for group in state.groups if group.kind == 'dir']
+    if dir_groups:
+        print('Duplicate directory list:', file=target)
+        for group in dir_groups:
+            print(f'Dirname: {group.name}', file=target)
+            print(f'Files: {group.files}', file=target)
+            print(f'Size: {group.size} byte', file=target)
+            for dirpath in group.kept:
+                print(f'{dirpath}', file=target)
+            for src, dst in group.moves:
+                print(f'{src} -> {dst}', file=target)
+            print('', file=target)
+        print('End of list.', file=target)
+    print('Duplicate list:', file=target)
+    for group in state.groups:
+        if group.kind != 'file':
+            continue
+        print(f'Filename: {group.name}', file=target)
+        print(f'Size: {group.size} byte', file=target)
+        for filepath in group.kept:
+            print(f'{filepath}', file=target)
+        for src, dst in group.moves:
+            print(f'{src} -> {dst}', file=target)
+        print('', file=target)
+    print('End of list.', file=target)
+
+
+def resume(dest: str) -> typing.Tuple[JournalState, typing.Set[str]]:
+    """ Finish moves of interrupted run. Move is done, if its source is still
+    in place; if there is destination as well, move between devices was
+    interrupted before source removal, and it is copied again. If only
+    destination is in place, the move was done before crash. Return journal
+    state and source directories of done moves. """
+
+    filepath = journal_path(dest)
+    state = load_journal(filepath)
+    if state.rolled_back:
+        raise ValueError(f'{filepath}: run was rolled back, nothing to resume.')
+    moved_from = set()
+    journal = Journal(filepath, append=True)
+    try:
+        for src, dst in state.moves():
+            if src in state.done:
+                moved_from.add(os.path.dirname(src))
+                continue
+            if os.path.lexists(src):
+                if os.path.lexists(dst):
+                    copyutils.remove(dst)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                copyutils.move(src, dst)
+            elif not os.path.lexists(dst):
+                continue
+            journal.done(src)
+            state.done.add(src)
+            moved_from.add(os.path.dirname(src))
+        if not state.ended:
+            journal.end()
+            state.ended = True
+    finally:
+        journal.close()
+    with open(os.path.join(os.path.abspath(dest), 'report.txt'), 'wt') as fileout:
+        save_report(state, fileout)
+    return state, moved_from
+
+
+def undo(dest: str) -> JournalState:
+    """ Move files back to their sources, newest first, using the journal only.
+    Files are copied back, if they are on other device. If source and
+    destination are both in place, destination is a copy left by interrupted
+    move between devices, it is removed, unless source could be changed after
+    the move. Destination directories emptied by undo are removed. """
+
+    filepath = journal_path(dest)
+    state = load_journal(filepath)
+    dest = os.path.abspath(dest)
+    journal = Journal(filepath, append=True)
+    emptied = set()
+    try:
+        for src, dst in reversed(list(state.moves())):
+            if src in state.undone or not os.path.lexists(dst):
+                continue
+            if os.path.lexists(src):
+                if src not in state.done:
+                    # source removal was interrupted, source is intact
+                    copyutils.remove(dst)
+                    emptied.add(os.path.dirname(dst))
+                continue
+            os.makedirs(os.path.dirname(src), exist_ok=True)
+            copyutils.move(dst, src)
+            journal.undo(src)
+            state.undone.add(src)
+            emptied.add(os.path.dirname(dst))
+        journal.end('undone')
+        state.rolled_back = True
+    finally:
+        journal.close()
+
+    # remove group directories, deepest first, up to destination root
+    for dirpath in sorted(emptied, key=lambda path: path.count(os.sep), reverse=True):
+        while dirpath != dest and os.path.commonpath([dest, dirpath]) == dest:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                break
+            dirpath = os.path.dirname(dirpath)
+    return state
@@ -0,0 +1,87 @@
+"""
+Keeper selection: which copy of duplicates stays in place when the others
+are moved into destination directory.
+
+Policies:
+
+    device - keep a copy on another device than destination, so it is not
+             copied across devices, while copies on destination device are
+             just renamed. Minimizes bytes physically moved across devices.
+    oldest - keep the copy with the earliest modification time.
+    links  - keep the copy with the most hard links.
+    root   - keep a copy under the first matching preferred root, other
+             groups by device policy.
+
+Ties keep scan order. Pathes which can't be stat-ed are never preferred.
+
+"""
+
+import os
+import typing
+
+
+POLICIES = ('device', 'oldest', 'links', 'root')
+DEFAULT_POLICY = 'device'
+
+
+def _stat_or_none(stat: typing.Callable) -> typing.Callable:
+    def safe_stat(filepath: str) -> typing.Optional[os.stat_result]:
+        try:
+            return stat(filepath)
+        except OSError:
+            return None
+    return safe_stat
+
+
+def _by_device(dest_device: typing.Optional[int], stat: typing.Callable) -> typing.Callable:
+    def keeper(filepaths: typing.List[str]) -> str:
+        for filepath in filepaths:
+            file_stat = stat(filepath)
+            if file_stat is not None and file_stat.st_dev != dest_device:
+                return filepath
+        return filepaths[0]
+    return keeper
+
+
+def _best(attribute: typing.Callable, stat: typing.Callable) -> typing.Callable:
+    """ Keeper of the path with the least attribute(stat) value. """
+
+    def keeper(filepaths: typing.List[str]) -> str:
+        stats = [(stat(filepath), idx) for idx, filepath in enumerate(filepaths)]
+        known = [(attribute(file_stat), idx) for file_stat, idx in stats if file_stat is not None]
+        return filepaths[min(known)[1]] if known else filepaths[0]
+    return keeper
+
+
+def _under_roots(roots: typing.List[str], fallback: typing.Callable) -> typing.Callable:
+    roots = [os.path.abspath(root) for root in roots]
+
+    def keeper(filepaths: typing.List[str]) -> str:
+        for root in roots:
+            for filepath in filepaths:
+                if os.path.commonpath([root, filepath]) == root:
+                    return filepath
+        return fallback(filepaths)
+    return keeper
+
+
+def make_keeper(policy: str = DEFAULT_POLICY, dest: str = None,
+                roots: typing.List[str] = None,
+                stat: typing.Callable = os.stat) -> typing.Callable[[typing.List[str]], str]:
+    """ Return keeper function: it takes pathes of identical files and returns
+    the one to keep. Files are stat-ed with stat, e.g. file system backend one. """
+
+    stat = _stat_or_none(stat)
+    dest_device = None
+    if dest is not None:
+        dest_stat = stat(dest)
+        dest_device = dest_stat.st_dev if dest_stat is not None else None
+    if policy == 'oldest':
+        return _best(lambda file_stat: file_stat.st_mtime_ns, stat)
+    if policy == 'links':
+        return _best(lambda file_stat: -file_stat.st_nlink, stat)
+    if policy == 'root':
+        return _under_roots(roots or [], _by_device(dest_device, stat))
+    if policy == 'device':
+        return _by_device(dest_device, stat)
+    raise ValueError(f'{policy}: unknown keeper policy.')
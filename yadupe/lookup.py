@@ -0,0 +1,215 @@
+"""
+Resident duplicate lookup service.
+
+Service keeps size -> digest index (FilepathDict) of archive paths in memory
+and answers "is this a duplicate?" questions over a Unix socket, so ingest
+pipeline does not scan the archive for each new file. Archive files are hashed
+lazily, on the first query of their size, query file is hashed only if there
+are archive files of the same size. Protocol is newline-delimited JSON:
+
+    client:  {"op": "lookup", "path": ...} or
+             {"op": "lookup", "size": ..., "digest": ...}
+    service: {"duplicate": archive path or null}
+    client:  {"op": "add", "path": ...[, "digest": ...]}
+    service: {"end": true}
+    client:  {"op": "close"}
+
+Errors, malformed requests as well, are returned as {"error": message}.
+Archive files are hashed under a lock of their size only, lookups of other
+sizes are served meanwhile.
+
+"""
+
+import os
+import json
+import socket
+import typing
+import argparse
+import threading
+import socketserver
+from .hashutils import HashCache, SimpleKey, hash_file, EMPTY_DIGEST
+from .walkutils import walk_files
+from .core import FilepathDict
+
+
+DEFAULT_SOCKET = '/tmp/yadupe.sock'
+
+
+def build_index(roots: typing.List[str], hasher: typing.Callable = hash_file) -> FilepathDict:
+    """ Return index of all files under roots, nothing is hashed. """
+
+    files_dict = FilepathDict(hasher=hasher)
+    for root in roots:
+        for filepath, size in walk_files(os.path.abspath(root)):
+            files_dict.add(SimpleKey.create(size), filepath)
+    return files_dict
+
+
+class _LookupHandler(socketserver.StreamRequestHandler):
+    """ Serve one client connection, requests are answered in order. """
+
+    def handle(self):
+        stream = self.request.makefile('rw', encoding='utf-8',
+                                       errors='surrogateescape', newline='\n')
+        try:
+            for line in stream:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('Request must be JSON object.')
+                    op = request.get('op')
+                    if op == 'close':
+                        break
+                    if op == 'lookup':
+                        response = {'duplicate': self._lookup_(request)}
+                    elif op == 'add':
+                        self.server.add(os.path.abspath(request['path']), request.get('digest'))
+                        response = {'end': True}
+                    else:
+                        raise ValueError(f'Unknown operation: {op}')
+                except (OSError, ValueError, KeyError, TypeError) as ex:
+                    response = {'error': str(ex)}
+                stream.write(json.dumps(response) + '\n')
+                stream.flush()
+        finally:
+            stream.close()
+
+    def _lookup_(self, request: dict) -> typing.Optional[str]:
+        if 'path' in request:
+            return self.server.lookup_file(os.path.abspath(request['path']))
+        return self.server.lookup(request['size'], request['digest'])
+
+
+class LookupServer(socketserver.ThreadingUnixStreamServer):
+    """ Lookup service over given index, listening on Unix socket path. """
+
+    daemon_threads = True
+
+    def __init__(self, files_dict: FilepathDict, socket_path: str = DEFAULT_SOCKET,
+                 hash_cache: HashCache = None):
+        self.files_dict = files_dict
+        self.hash_cache = hash_cache
+        self._lock_ = threading.Lock()
+        self._size_locks_ = {}
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _LookupHandler)
+
+    def _size_lock_(self, size: int) -> threading.Lock:
+        """ Return lock of the files group of given size. Global lock is held
+        only to find it, never while the group is hashed. """
+
+        with self._lock_:
+            return self._size_locks_.setdefault(size, threading.Lock())
+
+    def lookup(self, size: int, digest: str, exclude: str = None) -> typing.Optional[str]:
+        with self._size_lock_(size):
+            return self.files_dict.lookup(size, digest, exclude)
+
+    def lookup_file(self, filepath: str) -> typing.Optional[str]:
+        """ Return archive path of the file duplicate, the file is hashed only
+        if there are archive files of the same size. The file itself is never
+        returned, if it is in the archive too. """
+
+        size = os.stat(filepath).st_size
+        with self._lock_:
+            if SimpleKey.create(size) not in self.files_dict:
+                return None
+        digest = EMPTY_DIGEST if size == 0 else self.files_dict.hasher(filepath)
+        return self.lookup(size, digest, exclude=filepath)
+
+    def add(self, filepath: str, digest: str = None) -> None:
+        """ Add new archive file into the index. """
+
+        size = os.stat(filepath).st_size
+        with self._size_lock_(size):
+            with self._lock_:
+                self.files_dict.add(SimpleKey.create(size), filepath, digest=digest)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        if self.hash_cache:
+            self.hash_cache.save()
+
+
+class LookupClient(object):
+    """ Client connection to the lookup service. """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET):
+        self._socket_ = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket_.connect(socket_path)
+        self._stream_ = self._socket_.makefile('rw', encoding='utf-8',
+                                               errors='surrogateescape', newline='\n')
+
+    def _request_(self, **request) -> dict:
+        self._stream_.write(json.dumps(request) + '\n')
+        self._stream_.flush()
+        line = self._stream_.readline()
+        if not line:
+            raise ConnectionError('Lookup service closed connection.')
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    def lookup(self, path: str = None, size: int = None,
+               digest: str = None) -> typing.Optional[str]:
+        """ Return archive path of the file with the same content as given file
+        or (size, digest) pair, None if there is no such file. """
+
+        if path is not None:
+            return self._request_(op='lookup', path=os.path.abspath(path))['duplicate']
+        return self._request_(op='lookup', size=size, digest=digest)['duplicate']
+
+    def add(self, path: str, digest: str = None) -> None:
+        self._request_(op='add', path=os.path.abspath(path), digest=digest)
+
+    def close(self):
+        try:
+            self._stream_.write(json.dumps({'op': 'close'}) + '\n')
+            self._stream_.flush()
+        finally:
+            self._stream_.close()
+            self._socket_.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        prog='yadupe-lookup',
+        description='Keep index of given paths in memory, answer duplicate lookups '
+                    'over Unix socket.')
+    arg_parser.add_argument('source', nargs='+',
+                            help='Archive path to index.',
+                            metavar='PATH')
+    arg_parser.add_argument('-s', '--socket', default=DEFAULT_SOCKET,
+                            help=f'Unix socket path to listen on, default {DEFAULT_SOCKET}.',
+                            metavar='PATH')
+    arg_parser.add_argument('--hash-cache',
+                            help='Persistent hash cache FILE.',
+                            metavar='FILE', dest='hash_cache')
+    args = arg_parser.parse_args()
+
+    for source in args.source:
+        if not os.path.isdir(source):
+            print(f'{source}: must be valid path to directory.')
+            exit()
+    hash_cache = HashCache(args.hash_cache) if args.hash_cache else None
+    files_dict = build_index(args.source, hash_cache.hasher() if hash_cache else hash_file)
+    try:
+        server = LookupServer(files_dict, args.socket, hash_cache)
+    except OSError as ex:
+        print(f'{ex}')
+        exit()
+    print(f'Serving lookups in {", ".join(args.source)} on {args.socket}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+I/O throttling for runs alongside production load.
+
+Read bandwidth and I/O operations are limited by token buckets, shared by
+walk, hash, copy, move, purge and journal writes and by all their threads.
+Data copied by moves across devices is charged as read bytes. Limits adapt to device
+load: when read latency rises well above the lowest latency seen, limits are
+cut down, and they are restored step by step when latency drops back.
+
+Process CPU and I/O priorities could be lowered as well (nice, ionice).
+
+"""
+
+import os
+import sys
+import time
+import typing
+import hashlib
+import threading
+import platform
+
+
+READ_SIZE = 1024 * 1024
+LATENCY_FACTOR = 2.0        # latency above baseline * factor means device is busy
+LATENCY_SMOOTHING = 0.2     # weight of the last latency sample
+ADAPT_INTERVAL = 0.5        # seconds between limit adjustments
+DECREASE_FACTOR = 0.7
+INCREASE_STEP = 0.05
+MIN_FACTOR = 0.1
+
+IONICE_CLASSES = {'best-effort': 2, 'idle': 3}
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_LOWEST = 7
+_SYS_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'arm64': 30,
+                   'armv7l': 314, 'ppc64le': 273, 's390x': 282, 'riscv64': 30}
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket, holding at most one second of tokens.
+    Request larger than available tokens is granted on credit, caller waits
+    until the debt is paid off, so requests of any size are served. """
+
+    def __init__(self, rate: float):
+        self._lock_ = threading.Lock()
+        self.rate = rate
+        self._tokens_ = rate
+        self._updated_ = time.monotonic()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock_:
+            self._refill_()
+            self.rate = rate
+
+    def _refill_(self) -> None:
+        now = time.monotonic()
+        self._tokens_ = min(self.rate, self._tokens_ + (now - self._updated_) * self.rate)
+        self._updated_ = now
+
+    def consume(self, amount: float) -> None:
+        with self._lock_:
+            self._refill_()
+            self._tokens_ -= amount
+            wait = -self._tokens_ / self.rate if self._tokens_ < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Throttle(object):
+    """ Shared limiter of read bytes per second and I/O operations per second.
+    Either limit could be None. Limits are scaled down while observed read
+    latency is high. """
+
+    def __init__(self, read_rate: int = None, iops: int = None):
+        self.read_rate = read_rate
+        self.iops = iops
+        self._bytes_ = TokenBucket(read_rate) if read_rate else None
+        self._ops_ = TokenBucket(iops) if iops else None
+        self._lock_ = threading.Lock()
+        self.factor = 1.0
+        self._latency_ = None
+        self._baseline_ = None
+        self._adapted_ = time.monotonic()
+
+    def io(self, ops: int = 1, nbytes: int = 0) -> None:
+        """ Wait until given number of operations and bytes could be done. """
+
+        if self._ops_ and ops:
+            self._ops_.consume(ops)
+        if self._bytes_ and nbytes:
+            self._bytes_.consume(nbytes)
+
+    def observe(self, latency: float) -> None:
+        """ Take read latency sample into account, adjust limits. """
+
+        with self._lock_:
+            if self._latency_ is None:
+                self._latency_ = latency
+            else:
+                self._latency_ += LATENCY_SMOOTHING * (latency - self._latency_)
+            if self._baseline_ is None or self._latency_ < self._baseline_:
+                self._baseline_ = self._latency_
+            now = time.monotonic()
+            if now - self._adapted_ < ADAPT_INTERVAL:
+                return
+            self._adapted_ = now
+            if self._latency_ > self._baseline_ * LATENCY_FACTOR:
+                factor = max(MIN_FACTOR, self.factor * DECREASE_FACTOR)
+            else:
+                factor = min(1.0, self.factor + INCREASE_STEP)
+            if factor == self.factor:
+                return
+            self.factor = factor
+        if self._bytes_:
+            self._bytes_.set_rate(self.read_rate * factor)
+        if self._ops_:
+            self._ops_.set_rate(self.iops * factor)
+
+    def hash_file(self, filepath: str, algorithm: str = 'blake2b',
+                  opener: typing.Callable = open) -> str:
+        """ Throttled hash_file: the same digest, file is read by READ_SIZE
+        blocks, each read is paced by the limits and its latency is observed. """
+
+        hash_obj = hashlib.new(algorithm)
+        with opener(filepath, 'rb', buffering=0) as filein:
+            while True:
+                self.io(1)
+                started = time.monotonic()
+                data = filein.read(READ_SIZE)
+                self.observe(time.monotonic() - started)
+                if not data:
+                    break
+                self.io(0, len(data))
+                hash_obj.update(data)
+        return hash_obj.hexdigest()
+
+    def open(self, filepath: str, mode: str = 'rb', **kwargs) -> '_ThrottledFile':
+        """ Open file, which reads are paced by the limits on the bytes
+        actually read, with their latency observed. For readers which seek
+        over the file or read it only partially (sparse, incremental, archive
+        hashing). """
+
+        return _ThrottledFile(open(filepath, mode, **kwargs), self)
+
+
+class _ThrottledFile(object):
+    """ File object wrapper pacing its reads by throttle. """
+
+    def __init__(self, fileobj, throttle: Throttle):
+        self._file_ = fileobj
+        self._throttle_ = throttle
+
+    def read(self, size: int = -1) -> bytes:
+        self._throttle_.io(1)
+        started = time.monotonic()
+        data = self._file_.read(size)
+        self._throttle_.observe(time.monotonic() - started)
+        self._throttle_.io(0, len(data))
+        return data
+
+    def __getattr__(self, name: str):
+        return getattr(self._file_, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file_.close()
+
+
+def set_priority(nice: int = None, ionice: str = None) -> None:
+    """ Lower CPU (nice increment) and I/O (ionice class) priority of the
+    process. Threads started later inherit them. I/O priority is supported
+    on Linux only and silently ignored elsewhere. """
+
+    if nice:
+        os.nice(nice)
+    if ionice and sys.platform.startswith('linux'):
+        number = _SYS_IOPRIO_SET.get(platform.machine())
+        if number is None:
+            return
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioclass = IONICE_CLASSES[ionice]
+        value = (ioclass << _IOPRIO_CLASS_SHIFT) | (_IOPRIO_LOWEST if ioclass == 2 else 0)
+        if libc.syscall(number, _IOPRIO_WHO_PROCESS, 0, value) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f'ioprio_set: {os.strerror(error)}')
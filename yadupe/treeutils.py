@@ -0,0 +1,167 @@
+"""
+Whole-directory duplicate search with Merkle directory hashes.
+
+Directory digest is calculated bottom-up from names and digests of its files
+and sub-directories, so two directories have the same digest only if their
+subtrees are identical. Directory containing file with unique size (which is
+never hashed) has no digest and can't be a duplicate.
+
+If directory listings of the walk are given, directory with entries, which
+are not scanned files (empty sub-directories, symbolic links, special or
+filtered out files), has no digest as well: it is moved whole, so it could
+be a duplicate only if all its content was compared.
+
+Only the topmost identical directories are reported: subtrees of duplicate
+directories are covered by their parents.
+
+"""
+
+import os
+import sys
+import typing
+import hashlib
+
+
+class DirGroup(typing.NamedTuple):
+    """ Identical directories: name, path list, number of files and total size. """
+    name: str
+    path: typing.List[str]
+    files: int
+    size: int
+
+
+class _DirNode(object):
+    def __init__(self):
+        self.files: typing.List[typing.Tuple[str, str]] = []
+        self.dirs: typing.List[str] = []
+        self.count = 0
+        self.size = 0
+
+
+def _build_tree(records, roots: typing.List[str]) -> typing.Dict[str, _DirNode]:
+    """ Return {directory: node} for all directories containing files. """
+
+    roots = set(roots)
+    nodes = {}
+    for record in records:
+        dirpath, filename = os.path.split(record.path)
+        node = nodes.get(dirpath)
+        if node is None:
+            node = nodes[dirpath] = _DirNode()
+            # register directory in its ancestors up to the root
+            child = dirpath
+            while child not in roots:
+                parent, name = os.path.split(child)
+                if parent == child:
+                    break
+                parent_node = nodes.get(parent)
+                new_parent = parent_node is None
+                if new_parent:
+                    parent_node = nodes[parent] = _DirNode()
+                parent_node.dirs.append(name)
+                if not new_parent:
+                    break
+                child = parent
+        node.files.append((filename, record.digest))
+    return nodes
+
+
+def _digest_tree(records, roots: typing.List[str], tree: dict = None):
+    """ Return ({directory: digest or None}, {directory: node}).
+    Tree is {directory: sub-directory names or None} of the walk, if known. """
+
+    records = list(records)
+    sizes = {record.path: record.size for record in records}
+    nodes = _build_tree(records, roots)
+    digests = {}
+    for dirpath in sorted(nodes.keys(), key=lambda path: path.count(os.sep), reverse=True):
+        node = nodes[dirpath]
+        entries = []
+        digest_known = True
+        if tree is not None:
+            listed = tree.get(dirpath)
+            digest_known = listed is not None and set(listed) == set(node.dirs)
+        for filename, digest in node.files:
+            digest_known = digest_known and digest is not None
+            entries.append(f'F {filename} {digest}')
+            node.count += 1
+            node.size += sizes[os.path.join(dirpath, filename)]
+        for name in node.dirs:
+            child = os.path.join(dirpath, name)
+            digest_known = digest_known and digests[child] is not None
+            entries.append(f'D {name} {digests[child]}')
+            node.count += nodes[child].count
+            node.size += nodes[child].size
+        if digest_known:
+            hash_obj = hashlib.blake2b()
+            for entry in sorted(entries):
+                hash_obj.update(entry.encode('utf-8', 'surrogateescape'))
+                hash_obj.update(b'\n')
+            digests[dirpath] = hash_obj.hexdigest()
+        else:
+            digests[dirpath] = None
+    return digests, nodes
+
+
+def directory_digests(records, roots: typing.List[str],
+                      tree: dict = None) -> typing.Dict[str, typing.Optional[str]]:
+    """ Return {directory: digest or None} for all directories containing files.
+    Records are FileRecord-like objects with path, size and digest.
+    Tree is WalkFilter.tree of the walk, if known. """
+
+    digests, _ = _digest_tree(records, [os.path.abspath(root) for root in roots], tree)
+    return digests
+
+
+def duplicate_dirs(records, roots: typing.List[str], tree: dict = None) -> typing.List[DirGroup]:
+    """ Return groups of the topmost identical directories. Source roots are not
+    reported themselves, only their sub-directories. Tree is WalkFilter.tree
+    of the walk, directories with not scanned entries are never duplicates. """
+
+    roots = [os.path.abspath(root) for root in roots]
+    digests, nodes = _digest_tree(records, roots, tree)
+
+    by_digest = {}
+    for dirpath, digest in digests.items():
+        if digest is not None and dirpath not in roots:
+            by_digest.setdefault(digest, []).append(dirpath)
+    duplicated = {dirpath for paths in by_digest.values() if len(paths) > 1 for dirpath in paths}
+
+    groups = []
+    for digest, paths in by_digest.items():
+        top = [path for path in paths if os.path.dirname(path) not in duplicated]
+        if len(top) > 1:
+            top.sort()
+            node = nodes[top[0]]
+            groups.append(DirGroup(os.path.basename(top[0]), top, node.count, node.size))
+    return groups
+
+
+def covered_files(records, directories: typing.Iterable[str]) -> typing.Set[str]:
+    """ Return paths of files inside any of given directories. """
+
+    directories = set(directories)
+    covered = set()
+    for record in records:
+        parent = os.path.dirname(record.path)
+        while True:
+            if parent in directories:
+                covered.add(record.path)
+                break
+            upper = os.path.dirname(parent)
+            if upper == parent:
+                break
+            parent = upper
+    return covered
+
+
+def save_dir_duplicates(groups: typing.List[DirGroup], target=sys.stdout):
+    print('Duplicate directory list:', file=target)
+    for group in groups:
+        print(f'Dirname: {group.name}', file=target)
+        print(f'Files: {group.files}', file=target)
+        print(f'Size: {group.size} byte', file=target)
+        for dirpath in group.path:
+            print(f'{dirpath}', file=target)
+        print('', file=target)
+    print('End of list.', file=target)
@@ -0,0 +1,123 @@
+"""
+Directory walk with pruning.
+
+Exclude patterns are checked for directories before descending into them, so
+excluded subtrees (.git, node_modules, ...) are never listed. Include patterns
+select files, size bounds are checked at stat time, and walk could be kept
+within the root file system.
+
+Pattern without "/" is matched against file or directory name, pattern with
+"/" - against path relative to the walked root.
+
+If walk filter tracks tree, each walked directory is recorded with names of
+its real sub-directories, or with None, if any of its entries is not returned
+as regular file: excluded or filtered out entries, symbolic links, special
+files. Such directory is known to differ from its scanned files.
+
+Walk could be paced by throttle: each listed directory and each stat-ed file
+takes one I/O operation. Directories are listed and files are stat-ed by file
+system backend (fsbackend), local by default.
+
+"""
+
+import os
+import re
+import typing
+import stat
+import fnmatch
+from .fsbackend import LOCAL
+
+
+def _compile(patterns: typing.List[str]):
+    """ Return (name regex, relative path regex), None if there are no patterns. """
+
+    names = [fnmatch.translate(pattern) for pattern in patterns if '/' not in pattern]
+    pathes = [fnmatch.translate(pattern.strip('/')) for pattern in patterns if '/' in pattern]
+    return (re.compile('|'.join(names)) if names else None,
+            re.compile('|'.join(pathes)) if pathes else None)
+
+
+class WalkFilter(object):
+    """ Walk pruning rules and pacing. Sizes are in bytes, bounds are inclusive.
+    If track_tree is set, walked directories are recorded in tree:
+    {directory: sub-directory names or None, if not all entries are returned}. """
+
+    def __init__(self, include: typing.List[str] = None, exclude: typing.List[str] = None,
+                 min_size: int = None, max_size: int = None,
+                 one_file_system: bool = False, throttle=None, backend=None,
+                 track_tree: bool = False):
+        self.include = _compile(include) if include else None
+        self.exclude = _compile(exclude) if exclude else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.one_file_system = one_file_system
+        self.throttle = throttle
+        self.backend = backend or LOCAL
+        self.tree: typing.Optional[typing.Dict[str, typing.Optional[typing.List[str]]]] = \
+            {} if track_tree else None
+
+    @staticmethod
+    def _match(compiled, name: str, relpath: str) -> bool:
+        name_re, path_re = compiled
+        return bool((name_re and name_re.match(name)) or (path_re and path_re.match(relpath)))
+
+    def excluded(self, name: str, relpath: str) -> bool:
+        return self.exclude is not None and self._match(self.exclude, name, relpath)
+
+    def included(self, name: str, relpath: str) -> bool:
+        return self.include is None or self._match(self.include, name, relpath)
+
+    def size_fits(self, size: int) -> bool:
+        return (self.min_size is None or size >= self.min_size) \
+            and (self.max_size is None or size <= self.max_size)
+
+
+def walk_files(rootpath: str,
+               walk_filter: WalkFilter = None) -> typing.Iterator[typing.Tuple[str, int]]:
+    """ Iterator, return (path, size) for each file under rootpath, which
+    passes walk_filter. """
+
+    walk_filter = walk_filter or WalkFilter()
+    backend = walk_filter.backend
+    root_device = backend.stat(rootpath).st_dev if walk_filter.one_file_system else None
+    throttle = walk_filter.throttle
+    tree = walk_filter.tree
+    for dirpath, dirnames, filenames in backend.walk(rootpath):
+        if throttle:
+            throttle.io()
+        reldir = os.path.relpath(dirpath, rootpath)
+        reldir = '' if reldir == os.curdir else reldir
+        complete = True
+        kept = []
+        for dirname in dirnames:
+            if walk_filter.excluded(dirname, os.path.join(reldir, dirname)):
+                complete = False
+                continue
+            if root_device is not None or tree is not None:
+                dir_stat = backend.lstat(os.path.join(dirpath, dirname))
+                if root_device is not None and dir_stat.st_dev != root_device:
+                    complete = False
+                    continue
+                if stat.S_ISLNK(dir_stat.st_mode):
+                    complete = False
+            kept.append(dirname)
+        dirnames[:] = kept
+
+        for filename in filenames:
+            relpath = os.path.join(reldir, filename)
+            if walk_filter.excluded(filename, relpath) \
+                    or not walk_filter.included(filename, relpath):
+                complete = False
+                continue
+            absfilename = os.path.join(dirpath, filename)
+            if throttle:
+                throttle.io()
+            if tree is not None and not stat.S_ISREG(backend.lstat(absfilename).st_mode):
+                complete = False
+            size = backend.stat(absfilename).st_size
+            if walk_filter.size_fits(size):
+                yield absfilename, size
+            else:
+                complete = False
+        if tree is not None:
+            tree[dirpath] = kept if complete else None